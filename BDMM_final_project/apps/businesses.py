@@ -4,6 +4,7 @@ import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 from app import app
 import apps.dcc_functions as f
+from backend import executor
 
 ########################################################################################################################
 
@@ -108,7 +109,12 @@ def callbacks(none):
         Output("business_box_2", "children"),
         Output("business_box_3", "children"),
         Output("business_box_4", "children"),
-        Output("business_box_5", "children")
+        Output("business_box_5", "children"),
+        Output("business_bar_1", "figure"),
+        Output("business_bar_2", "figure"),
+        Output("business_treemap", "figure"),
+        Output("business_map", "figure"),
+        Output("business_connection", "figure")
     ],
     [
         Input('button_business', 'n_clicks')
@@ -121,111 +127,22 @@ def callbacks(none):
 def callbacks(n_clicks_1, year, country_list):
     bot_year = year[0]
     top_year = year[1]
-
-    boxes = f.business_box(bot_year, top_year, country_list)
-    print('Queried business Boxes')
-    box_1 = boxes[0]
-    box_2 = boxes[1]
-    box_3 = boxes[2]
-    box_4 = boxes[3]
-    box_5 = boxes[4]
-
-    return str(box_1) + '€', \
-           str(box_2), \
-           str(box_3), \
-           str(box_4) + '€', \
-           str(box_5) + '€'
-
-
-
-@app.callback(
-    Output("business_bar_1", "figure"),
-    [
-        Input('button_business', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.business_bar_1(bot_year, top_year, country_list)
-    print('Queried business Bar 1!')
-    return fig
-
-@app.callback(
-    Output("business_bar_2", "figure"),
-    [
-        Input('button_business', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.business_bar_2(bot_year, top_year, country_list)
-    print('Queried business bar 2')
-    return fig
-
-@app.callback(
-    Output("business_treemap", "figure"),
-    [
-        Input('button_business', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.business_treemap(bot_year, top_year, country_list)
-    print('Queried business treemap')
-    return fig
-
-
-@app.callback(
-    Output("business_map", "figure"),
-    [
-        Input('button_business', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.business_map(bot_year, top_year, country_list)
-    print('Queried business Map')
-    return fig
-
-
-@app.callback(
-    Output("business_connection", "figure"),
-    [
-        Input('button_business', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.business_connection(bot_year, top_year, country_list)
-    print('Queried business Connection')
-    return fig
\ No newline at end of file
+    filters = (bot_year, top_year, country_list)
+
+    # every tile is queried at the same time, see backend/executor.py
+    boxes, bar_1, bar_2, treemap, business_map, connection = executor.run_concurrently([
+        (f.business_box, filters),
+        (f.business_bar_1, filters),
+        (f.business_bar_2, filters),
+        (f.business_treemap, filters),
+        (f.business_map, filters),
+        (f.business_connection, filters),
+    ])
+    print('Queried business page')
+
+    return str(boxes[0]) + '€', \
+           str(boxes[1]), \
+           str(boxes[2]), \
+           str(boxes[3]) + '€', \
+           str(boxes[4]) + '€', \
+           bar_1, bar_2, treemap, business_map, connection
@@ -5,80 +5,16 @@ import dash_html_components as html
 from dash.dependencies import Input, Output, State
 from app import app
 import apps.dcc_functions as f
+from backend import executor
+from backend import dimensions
 
 
-cpv_division = [
-    ['Clothing, footwear, luggage articles and accessories', '18'],
-    ['Leather and textile fabrics, plastic and rubber materials',
-    '19'],
-    ['Installation services (except software)', '51'],
-    ['Construction structures and materials; auxiliary products to construction (except electric apparatus)',
-    '44'],
-    ['Office and computing machinery, equipment and supplies except furniture and software packages',
-    '30'],
-    ['Research and development services and related consultancy services',
-    '73'],
-    ['Repair and maintenance services', '50'],
-    ['Medical equipments, pharmaceuticals and personal care products',
-    '33'],
-    ['Transport equipment and auxiliary products to transportation',
-    '34'],
-    ['Health and social work services', '85'],
-    ['Financial and insurance services', '66'],
-    ['Electrical machinery, apparatus, equipment and consumables; lighting',
-    '31'],
-    ['Education and training services', '80'],
-    ['Real estate services', '70'],
-    ['Public utilities', '65'],
-    ['IT services: consulting, software development, Internet and support',
-    '72'],
-    ['Sewage, refuse, cleaning and environmental services', '90'],
-    ['Food, beverages, tobacco and related products', '15'],
-    ['Business services: law, marketing, consulting, recruitment, printing and security',
-    '79'],
-    ['Security, fire-fighting, police and defence equipment', '35'],
-    ['Services related to the oil and gas industry', '76'],
-    ['Petroleum products, fuel, electricity and other sources of energy',
-    '09'],
-    ['Administration, defence and social security services', '75'],
-    ['Radio, television, communication, telecommunication and related equipment',
-    '32'],
-    ['Agricultural, farming, fishing, forestry and related products',
-    '03'],
-    ['Recreational, cultural and sporting services', '92'],
-    ['Other community, social and personal services', '98'],
-    ['Construction work', '45'],
-    ['Supporting and auxiliary transport services; travel agencies services',
-    '63'],
-    ['Laboratory, optical and precision equipments (excl. glasses)',
-    '38'],
-    ['Agricultural, forestry, horticultural, aquacultural and apicultural services',
-    '77'],
-    ['Furniture (incl. office furniture), furnishings, domestic appliances (excl. lighting) and cleaning products',
-    '39'],
-    ['Software package and information systems', '48'],
-    ['Transport services (excl. Waste transport)', '60'],
-    ['Agricultural machinery', '16'],
-    ['Architectural, construction, engineering and inspection services',
-    '71'],
-    ['Hotel, restaurant and retail trade services', '55'],
-    ['Musical instruments, sport goods, games, toys, handicraft, art materials and accessories',
-    '37'],
-    ['Postal and telecommunications services', '64'],
-    ['Collected and purified water', '41'],
-    ['Machinery for mining, quarrying, construction equipment', '43'],
-    ['Industrial machinery', '42'],
-    ['Mining, basic metals and related products', '14'],
-    ['Printed matter and related products', '22'],
-    ['Chemical products', '24']
-]
-
-cpv_options = [dict(label=cpv[0], value=cpv[1]) for cpv in cpv_division]
-
+# Options are filled from the dimension cache when the page is opened (see the 'cpv_drop' callback below), so that
+# importing the page does not query the database
 cpv_dropdown = dcc.Dropdown(
                 id='cpv_drop',
-                options=cpv_options,
-                value=cpv_division[0][1],
+                options=[],
+                value='50',
                 multi=False
             ),
 
@@ -196,135 +132,32 @@ def callbacks(none):
 
 
 @app.callback(
+    Output("cpv_drop", "options"),
     [
-        Output("box_1", "children"),
-        Output("box_2", "children"),
-        Output("box_3", "children"),
-        Output("box_4", "children"),
-        Output("box_5", "children")
-    ],
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    boxes = f.cpv_box(bot_year, top_year, country_list)
-    print('Queried cpv Boxes')
-    box_1 = boxes[0]
-    box_2 = boxes[1]
-    box_3 = boxes[2]
-    box_4 = boxes[3]
-    box_5 = boxes[4]
-
-    return str(box_1) + '€', \
-           str(box_2), \
-           str(box_3), \
-           str(box_4) + '€', \
-           str(box_5) + '€'
-
-
-@app.callback(
-    Output("treemap", "figure"),
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_treemap(bot_year, top_year, country_list)
-    print('Queried cpv Treemap!')
-    return fig
-
-@app.callback(
-    Output("bar_1", "figure"),
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_bar_1(bot_year, top_year, country_list)
-    print('Queried cpv bar 1')
-    return fig
-
-@app.callback(
-    Output("bar_2", "figure"),
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_bar_2(bot_year, top_year, country_list)
-    print('Queried cpv bar 2')
-    return fig
-
-
-@app.callback(
-    Output("bar_3", "figure"),
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
+        Input('url', 'pathname')
     ]
 )
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_bar_3(bot_year, top_year, country_list)
-    print('Queried cpv bar 3')
-    return fig
+def callbacks(none):
+    descriptions = dimensions.cpv_descriptions()
+    return [dict(label=description, value=code) for code, description in descriptions.items() if code and description]
 
 
 @app.callback(
-    Output("bar_4", "figure"),
     [
-        Input('button_code', 'n_clicks')
+        Output("box_1", "children"),
+        Output("box_2", "children"),
+        Output("box_3", "children"),
+        Output("box_4", "children"),
+        Output("box_5", "children"),
+        Output("treemap", "figure"),
+        Output("bar_1", "figure"),
+        Output("bar_2", "figure"),
+        Output("bar_3", "figure"),
+        Output("bar_4", "figure"),
+        Output("hist", "figure"),
+        Output("cpv_map", "figure"),
+        Output("cpv_bar_diff", "figure")
     ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_bar_4(bot_year, top_year, country_list)
-    print('Queried cpv bar 4')
-    return fig
-
-
-@app.callback(
-    Output("hist", "figure"),
     [
         Input('button_code', 'n_clicks')
     ],
@@ -337,46 +170,25 @@ def callbacks(n_clicks_1, year, country_list):
 def callbacks(n_clicks_1, cpv, year, country_list):
     bot_year = year[0]
     top_year = year[1]
-
-    fig = f.cpv_histogram(bot_year, top_year, country_list, cpv)
-    print('Queried cpv histogram')
-    return fig
-
-
-
-@app.callback(
-    Output("cpv_map", "figure"),
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_map(bot_year, top_year, country_list)
-    print('Queried cpv Map')
-    return fig
-
-
-@app.callback(
-    Output("cpv_bar_diff", "figure"),
-    [
-        Input('button_code', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.cpv_bar_diff(bot_year, top_year, country_list)
-    print('Queried cpv Bar Diff')
-    return fig
+    filters = (bot_year, top_year, country_list)
+
+    # every tile is queried at the same time, see backend/executor.py
+    boxes, treemap, bar_1, bar_2, bar_3, bar_4, hist, cpv_map, cpv_bar_diff = executor.run_concurrently([
+        (f.cpv_box, filters),
+        (f.cpv_treemap, filters),
+        (f.cpv_bar_1, filters),
+        (f.cpv_bar_2, filters),
+        (f.cpv_bar_3, filters),
+        (f.cpv_bar_4, filters),
+        (f.cpv_histogram, filters + (cpv,)),
+        (f.cpv_map, filters),
+        (f.cpv_bar_diff, filters),
+    ])
+    print('Queried cpv page')
+
+    return str(boxes[0]) + '€', \
+           str(boxes[1]), \
+           str(boxes[2]), \
+           str(boxes[3]) + '€', \
+           str(boxes[4]) + '€', \
+           treemap, bar_1, bar_2, bar_3, bar_4, hist, cpv_map, cpv_bar_diff
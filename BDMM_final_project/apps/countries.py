@@ -3,6 +3,7 @@ import dash_html_components as html
 from dash.dependencies import Input, Output, State
 from app import app
 import apps.dcc_functions as f
+from backend import executor
 import dash_bootstrap_components as dbc
 
 
@@ -101,7 +102,11 @@ def callbacks(none):
         Output("country_box_2", "children"),
         Output("country_box_3", "children"),
         Output("country_box_4", "children"),
-        Output("country_box_5", "children")
+        Output("country_box_5", "children"),
+        Output("country_treemap", "figure"),
+        Output("country_bar_1", "figure"),
+        Output("country_bar_2", "figure"),
+        Output("country_map", "figure")
     ],
     [
         Input('button_country', 'n_clicks')
@@ -114,92 +119,21 @@ def callbacks(none):
 def callbacks(n_clicks_1, year, country_list):
     bot_year = year[0]
     top_year = year[1]
-
-    boxes = f.country_box(bot_year, top_year, country_list)
-    print('Queried Country Boxes')
-    box_1 = boxes[0]
-    box_2 = boxes[1]
-    box_3 = boxes[2]
-    box_4 = boxes[3]
-    box_5 = boxes[4]
-
-    return str(box_1) + '€', \
-           str(box_2), \
-           str(box_3), \
-           str(box_4) + '€', \
-           str(box_5) + '€'
-
-
-
-@app.callback(
-    Output("country_treemap", "figure"),
-    [
-        Input('button_country', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.country_treemap(bot_year, top_year, country_list)
-    print('Queried Country Treemap!')
-    return fig
-
-@app.callback(
-    Output("country_bar_1", "figure"),
-    [
-        Input('button_country', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.country_bar_1(bot_year, top_year, country_list)
-    print('Queried Country bar 1')
-    return fig
-
-@app.callback(
-    Output("country_bar_2", "figure"),
-    [
-        Input('button_country', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.country_bar_2(bot_year, top_year, country_list)
-    print('Queried Country bar 2')
-    return fig
-
-
-@app.callback(
-    Output("country_map", "figure"),
-    [
-        Input('button_country', 'n_clicks')
-    ],
-    [
-        State('year_slider', 'value'),
-        State('country_drop', 'value')
-    ]
-)
-def callbacks(n_clicks_1, year, country_list):
-    bot_year = year[0]
-    top_year = year[1]
-
-    fig = f.country_map(bot_year, top_year, country_list)
-    print('Queried Country Map')
-    return fig
+    filters = (bot_year, top_year, country_list)
+
+    # every tile is queried at the same time, see backend/executor.py
+    boxes, treemap, bar_1, bar_2, country_map = executor.run_concurrently([
+        (f.country_box, filters),
+        (f.country_treemap, filters),
+        (f.country_bar_1, filters),
+        (f.country_bar_2, filters),
+        (f.country_map, filters),
+    ])
+    print('Queried country page')
+
+    return str(boxes[0]) + '€', \
+           str(boxes[1]), \
+           str(boxes[2]), \
+           str(boxes[3]) + '€', \
+           str(boxes[4]) + '€', \
+           treemap, bar_1, bar_2, country_map
@@ -2,9 +2,12 @@ import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+from flask import jsonify, request
 from app import app
-import base64
+import dash
 import backend.performance_evaluation as perf_eval
+from backend import jobs
+from backend import uploads
 
 layout = html.Div([
     html.Div([
@@ -28,21 +31,21 @@ layout = html.Div([
         html.H1('Performance test'),
         html.Div('This will run all the dashboard queries sequentially and output the time taken by all queries'),
         html.Button('Start evaluation', id='buttonEval', style = {'margin-top': '2%'}),
+        html.Button('Cancel', id='buttonCancel', style = {'margin-top': '2%', 'margin-left': '1%'}),
+        html.Div(id='cancel-state'),
+        # run id of the evaluation started from this page, see backend/jobs.py
+        dcc.Store(id='eval-run'),
         dcc.Interval(id="progress-interval", n_intervals=0, interval=2000, max_intervals=1000),
         dbc.Progress(id="progress", striped=True, animated=True, style={"height": "40px", 'margin-top': '2%'}),
     ],style={'text-align': 'center', 'margin-top': '2%'}),
     
     html.Hr(), html.Hr(), html.Hr(),  
     html.H1('File Upload', style={'text-align': 'center'}),
-    html.Div('Allows for new document uploads and measures the time the upload took to complete', style={'text-align': 'center'}),
+    html.Div('Allows for new document uploads and shows the progress and throughput of their ingest', style={'text-align': 'center'}),
     html.Div(id='textarea-avg', style={'whiteSpace': 'pre-line'}),
     html.Div(id='textarea-time', style={'whiteSpace': 'pre-line'}),
-    dcc.Upload(
-        id='upload-data',
-        children=html.Div([
-            'Drag and Drop or ',
-            html.A('Select Files')
-        ]),
+    # files are sent in chunks by assets/chunked_upload.js and ingested in the background, see backend/uploads.py
+    html.Input(id='upload-files', type='file', multiple=True, accept='.json,.ndjson,.jsonl,.gz,.zst',
         style={
             'width': '100%',
             'height': '60px',
@@ -52,85 +55,144 @@ layout = html.Div([
             'borderRadius': '5px',
             'textAlign': 'center',
             'margin': '10px'
-        },
-        # Allow multiple files to be uploaded
-        multiple=False
+        }
     ),
+    html.Div('JSON arrays or NDJSON, plain or compressed with gzip / zstd, several files at once',
+             style={'text-align': 'center'}),
+    html.Div(id='upload-client-state', style={'text-align': 'center'}),
+    # run ids of the ingests started from this page and number of them that finished, 'upload-interval' only runs
+    # in the browser to pick up new runs, the server is polled by 'upload-poll' while one of them is not finished
+    dcc.Store(id='upload-runs', data=[]),
+    dcc.Store(id='upload-done', data=0),
+    dcc.Interval(id='upload-interval', n_intervals=0, interval=1000),
+    dcc.Interval(id='upload-poll', n_intervals=0, interval=2000, disabled=True),
     html.Div(id='output-data-upload'),
 ])
 
-def parse_contents(contents, filename, date):
-    content_type, content_string = contents.split(',')
-    json_obj = base64.b64decode(content_string)
+@app.server.route('/upload/<upload_id>', methods=['POST'])
+def upload_chunk(upload_id):
+    try:
+        size = uploads.append_chunk(upload_id, request.args['file'], int(request.args.get('offset', 0)), request.stream)
+    except (uploads.UploadError, KeyError, ValueError) as e:
+        return jsonify(error=str(e)), 409
+    return jsonify(size=size)
 
+@app.server.route('/upload/<upload_id>/complete', methods=['POST'])
+def upload_complete(upload_id):
     try:
-        if 'json' not in filename:
-            raise Exception("Invalid data file")
-        
-        (inserted_ids, processed_time) = perf_eval.insert_json(json_obj)
-    except Exception as e:
-        print(f'There was an error processing this file: {e}')
-        return html.Div([
-            f'There was an error processing this file: {e}'
-        ])
-
-    return html.Div([
-        html.H6(f"Inserted ids {inserted_ids}"),
-        html.Hr(),  # horizontal line
-        html.H3(f"Insertion time: {processed_time:.3f} seconds!"),
+        run_id = uploads.start_ingest(upload_id, request.get_json(force=True).get('files', []))
+    except uploads.UploadConflict as e:
+        return jsonify(error=str(e)), 409
+    except uploads.UploadError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(run_id=run_id)
 
-    ])
+app.clientside_callback(
+    """
+    function(n, runs) {
+        var started = window.bdmmUploadRuns || [];
+        if (runs && runs.length === started.length) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        return started.slice();
+    }
+    """,
+    Output('upload-runs', 'data'),
+    [Input('upload-interval', 'n_intervals')],
+    [State('upload-runs', 'data')]
+)
+
+def file_status(name, file):
+    seconds = f" in {file['seconds']:.1f}s" if file['seconds'] else ""
+    error = f" - {file['error']}" if file['error'] else ""
+    return f"{name}: {file['status']}{seconds}{error}"
 
+@app.callback([Output('output-data-upload', 'children'),
+               Output('upload-done', 'data'),
+               Output('upload-poll', 'disabled')],
+              [Input('upload-poll', 'n_intervals'),
+               Input('upload-runs', 'data')],
+              [State('upload-done', 'data')])
+def update_output(n, runs, done):
+    children = []
+    finished = 0
+    active = 0
+    for run_id in runs or []:
+        job = jobs.get(run_id)
+        if job is None:
+            continue
+        snapshot = job.snapshot()
+        finished += job.finished()
+        active += not job.finished()
+        children += [
+            html.H6(snapshot['message']),
+            dbc.Progress(value=snapshot['progress'], striped=not job.finished(), animated=not job.finished(),
+                         style={'height': '20px'}),
+            html.Div([html.Div(file_status(name, file)) for name, file in snapshot['queries'].items()]),
+            html.Hr(),
+        ]
 
-@app.callback(Output('output-data-upload', 'children'),
-              [Input('upload-data', 'contents')],
-              [State('upload-data', 'filename'),
-               State('upload-data', 'last_modified')])
-def update_output(list_of_contents, list_of_names, list_of_dates):
-    if list_of_contents is not None:
-        children = parse_contents(list_of_contents, list_of_names, list_of_dates) 
-        return children
+    return children, finished if finished != done else dash.no_update, not active
 
 @app.callback(Output('textarea-count', 'children'),
-              [Input('upload-data', 'contents')],
-              [State('upload-data', 'filename'),
-               State('upload-data', 'last_modified')])
-def update_output_textarea_count(content, name, date):
+              [Input('upload-done', 'data')])
+def update_output_textarea_count(done):
+    status = perf_eval.get_database_status()
+    if status:
+        return status
     return f"{perf_eval.get_collection_count()} contracts on the database"
 
 @app.callback(Output('textarea-avg', 'children'),
-              [Input('upload-data', 'contents')],
-              [State('upload-data', 'filename'),
-               State('upload-data', 'last_modified')])
-def update_textarea_avg(list_of_contents, list_of_names, list_of_dates):
+              [Input('upload-done', 'data')])
+def update_textarea_avg(done):
     return f"Collection stats: {perf_eval.get_collection_stats()}"
 
 @app.callback(
-        Output("buttonEval", "disabled")
+        Output("eval-run", "data")
     ,[
         Input("buttonEval", "n_clicks")
+    ],[
+        State("eval-run", "data")
     ])
-def start_evaluation(n_clicks):
+def start_evaluation(n_clicks, run_id):
     if n_clicks is None:
-        return False
+        return run_id
+
+    job = jobs.get(run_id) if run_id else None
+    if job is not None and not job.finished():
+        return run_id
 
-    from threading import Thread
-    Thread(target=perf_eval.performance_evaluation).start()
-    return True
+    return perf_eval.start_performance_evaluation()
+
+@app.callback(
+        Output("cancel-state", "children")
+    ,[
+        Input("buttonCancel", "n_clicks")
+    ],[
+        State("eval-run", "data")
+    ])
+def cancel_evaluation(n_clicks, run_id):
+    if n_clicks is None or not run_id:
+        return ""
+
+    job = jobs.cancel(run_id)
+    return "Cancelling after the current query" if job is not None and not job.finished() else ""
 
 @app.callback(
     [
         Output("progress", "value"), 
         Output("progress", "children"), 
+        Output("buttonEval", "disabled"),
     ],[
         Input("progress-interval", "n_intervals")
+    ],[
+        State("eval-run", "data")
     ],
 )
-def update_progress(n):
-    disabled = True if n == 50 else False
-    try:
-        with open(".query.state", 'r') as file:
-            data = file.read().split(":")
-    except:
-        data = (0, "Not started")
-    return data[0], data[1]
\ No newline at end of file
+def update_progress(n, run_id):
+    job = jobs.get(run_id) if run_id else None
+    if job is None:
+        return 0, "Not started", False
+
+    percent, message = job.progress()
+    return percent, message, not job.finished()
@@ -1,45 +1,60 @@
+import time
+from threading import Lock, Thread
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
+from pymongo.errors import PyMongoError
+from backend import dimensions
+import backend.queries as queries
 
 
-countries =[
-    ['MK', 'North Macedonia'],
-    ['LT', 'Lithuania'],
-    ['SI', 'Slovenia'],
-    ['CY', 'Cyprus'],
-    ['NL', 'Netherlands'],
-    ['LI', 'Liechtenstein'],
-    ['HR', 'Croatia'],
-    ['AT', 'Austria'],
-    ['RO', 'Romania'],
-    ['ES', 'Spain'],
-    ['SE', 'Sweden'],
-    ['DK', 'Denmark'],
-    ['FI', 'Finland'],
-    ['PL', 'Poland'],
-    ['DE', 'Germany'],
-    ['GR', 'Greece'],
-    ['FR', 'France'],
-    ['CH', 'Switzerland'],
-    ['BG', 'Bulgaria'],
-    ['HU', 'Hungary'],
-    ['BE', 'Belgium'],
-    ['SK', 'Slovakia'],
-    ['NO', 'Norway'],
-    ['IT', 'Italy'],
-    ['IS', 'Iceland'],
-    ['EE', 'Estonia'],
-    ['LV', 'Latvia'],
-    ['CZ', 'Czechia'],
-    ['MT', 'Malta'],
-    ['LU', 'Luxembourg'],
-    ['UK', 'United Kingdom'],
-    ['IE', 'Ireland'],
-    ['PT', 'Portugal']
-]
-
-country_options = [dict(label=country[1], value=country[0]) for country in countries]
+# seconds before the country names are read again after the database could not be reached
+retry_interval = 30
+
+_lock = Lock()
+_options = None
+_loading = False
+_failed_at = 0.0
+
+
+def options_of(names):
+    countries = sorted([[code, names.get(code) or code] for code in queries.countries], key=lambda c: c[1])
+
+    return [dict(label=country[1], value=country[0]) for country in countries]
+
+
+def load_country_options():
+    global _options, _loading, _failed_at
+
+    try:
+        _options = options_of({code: dimensions.country_name(code) for code in queries.countries})
+    except PyMongoError as e:
+        print(f"Loading the country names failed: {e}", flush=True)
+        _failed_at = time.time()
+    finally:
+        with _lock:
+            _loading = False
+
+
+def country_options():
+    """
+    Dropdown options of every country of the dashboard, names from the dimension cache shared with the queries
+
+    The layout never waits for the database: until the names are loaded by a background thread (retried every
+    retry_interval seconds while the database cannot be reached) the bare codes are shown
+    """
+    global _loading
+
+    if _options is not None:
+        return _options
+
+    with _lock:
+        start = not _loading and time.time() - _failed_at >= retry_interval
+        _loading = _loading or start
+    if start:
+        Thread(target=load_country_options, daemon=True).start()
+
+    return options_of({})
 
 
 image_filename = 'assets/eu_icon.png'
@@ -72,8 +87,8 @@ def render_sidebar():
             html.H2('Country Choice', style={'color': 'white'}),
             dcc.Dropdown(
                 id='country_drop',
-                options=country_options,
-                value=[country[0] for country in countries],
+                options=country_options(),
+                value=list(queries.countries),
                 multi=True,
                 style={'max-height': '400px', 'overflow-y': 'scroll', 'background-color':'#003399', 'color':'#f9f9f9'}
             )
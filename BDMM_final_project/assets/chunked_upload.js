@@ -0,0 +1,77 @@
+// Chunked upload of the files selected in the 'upload-files' input of the home page, see backend/uploads.py
+//
+// Every file is sent in chunks of chunkSize bytes, one request at a time, then the upload is completed and the
+// server starts ingesting it in the background. The run id of the ingest is pushed to window.bdmmUploadRuns, which
+// the page copies into its 'upload-runs' store (in the browser) to poll the progress while an ingest runs.
+
+var chunkSize = 8 * 1024 * 1024;
+
+window.bdmmUploadRuns = window.bdmmUploadRuns || [];
+
+function uploadId() {
+  var id = '';
+  for (var i = 0; i < 32; i++) {
+    id += Math.floor(Math.random() * 16).toString(16);
+  }
+  return id;
+}
+
+function setUploadState(text) {
+  var state = document.getElementById('upload-client-state');
+  if (state) {
+    state.textContent = text;
+  }
+}
+
+function checkResponse(response) {
+  return response.json().then(function(body) {
+    if (!response.ok) {
+      throw new Error(body.error || response.statusText);
+    }
+    return body;
+  });
+}
+
+// at least one chunk is sent, so that an empty file is spooled as well
+function uploadFile(id, file, offset) {
+  var chunk = file.slice(offset, offset + chunkSize);
+  var url = '/upload/' + id + '?file=' + encodeURIComponent(file.name) + '&offset=' + offset;
+  return fetch(url, {method: 'POST', body: chunk, headers: {'Content-Type': 'application/octet-stream'}})
+    .then(checkResponse)
+    .then(function(body) {
+      setUploadState('Uploading ' + file.name + ': ' + Math.round(body.size / Math.max(file.size, 1) * 100) + '%');
+      return body.size < file.size ? uploadFile(id, file, body.size) : null;
+    });
+}
+
+function uploadFiles(files) {
+  var id = uploadId();
+  var names = [];
+  var sequence = Promise.resolve();
+  Array.prototype.forEach.call(files, function(file) {
+    names.push(file.name);
+    sequence = sequence.then(function() { return uploadFile(id, file, 0); });
+  });
+  return sequence
+    .then(function() {
+      return fetch('/upload/' + id + '/complete', {
+        method: 'POST',
+        body: JSON.stringify({files: names}),
+        headers: {'Content-Type': 'application/json'}
+      }).then(checkResponse);
+    })
+    .then(function(body) {
+      window.bdmmUploadRuns.push(body.run_id);
+      setUploadState('Uploaded ' + names.join(', ') + ', ingesting');
+    })
+    .catch(function(error) {
+      setUploadState('Upload failed: ' + error.message);
+    });
+}
+
+// the input is rendered by Dash after this script runs, so the event is caught on the document
+document.addEventListener('change', function(event) {
+  if (event.target.id === 'upload-files' && event.target.files.length) {
+    uploadFiles(event.target.files).then(function() { event.target.value = ''; });
+  }
+});
@@ -1,11 +1,110 @@
+import importlib.util
+import os
+from threading import Lock
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 
-host="rhea.isegi.unl.pt"
-port="28004"
-user="GROUP_4"
-password="MjIzOTc0NzI0MTAyNzAxMzg0MjcwODk0MzIwNTA4NzA2MzYxOTAw"
-protocol="mongodb"
+########################################################################################################################
+# Connection to the contracts database
+#
+# The client is created lazily, on first use, and once per process: a client inherited through fork() is never
+# reused, so the module is safe under multi-process servers. `db` and `eu` are proxies resolving to the client of
+# the current process, so `from backend.DB import db` does not open any connection at import time.
+#     BDMM_MONGO_URI                  connection string (default mongodb://localhost:27017), credentials included
+#     BDMM_MONGO_DB                   database name (default contracts)
+#     BDMM_MONGO_MAX_POOL_SIZE        connections per process (default 50)
+#     BDMM_MONGO_MIN_POOL_SIZE        connections kept open (default 0)
+#     BDMM_MONGO_SERVER_TIMEOUT_MS    server selection timeout (default 10000)
+#     BDMM_MONGO_CONNECT_TIMEOUT_MS   connection timeout (default 10000)
+#     BDMM_MONGO_SOCKET_TIMEOUT_MS    socket timeout, 0 for none (default 0)
+#     BDMM_MONGO_READ_PREFERENCE      primary, primaryPreferred, secondary, ... (default primary)
+#     BDMM_MONGO_COMPRESSORS          wire compression, e.g. 'zstd,snappy,zlib' (default: the installed ones)
+########################################################################################################################
 
-client = MongoClient(f"{protocol}://{user}:{password}@{host}:{port}")
-db = client.contracts
-eu = db.eu
+def default_compressors():
+    """
+    zstd and snappy need the zstandard / python-snappy packages, zlib is always available
+    """
+    compressors = [name for name, module in [('zstd', 'zstandard'), ('snappy', 'snappy')]
+                   if importlib.util.find_spec(module)]
+
+    return ','.join(compressors + ['zlib'])
+
+
+uri = os.environ.get('BDMM_MONGO_URI', 'mongodb://localhost:27017')
+database_name = os.environ.get('BDMM_MONGO_DB', 'contracts')
+
+client_options = {
+    'maxPoolSize': int(os.environ.get('BDMM_MONGO_MAX_POOL_SIZE', '50')),
+    'minPoolSize': int(os.environ.get('BDMM_MONGO_MIN_POOL_SIZE', '0')),
+    'serverSelectionTimeoutMS': int(os.environ.get('BDMM_MONGO_SERVER_TIMEOUT_MS', '10000')),
+    'connectTimeoutMS': int(os.environ.get('BDMM_MONGO_CONNECT_TIMEOUT_MS', '10000')),
+    'socketTimeoutMS': int(os.environ.get('BDMM_MONGO_SOCKET_TIMEOUT_MS', '0')) or None,
+    'readPreference': os.environ.get('BDMM_MONGO_READ_PREFERENCE', 'primary'),
+    'compressors': os.environ.get('BDMM_MONGO_COMPRESSORS', default_compressors()),
+}
+
+_lock = Lock()
+_client = None
+_client_pid = None
+
+
+def get_client():
+    """
+    Returns the MongoClient of the current process, creating it on first use (or after a fork)
+    """
+    global _client, _client_pid
+
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(uri, connect=False, **client_options)
+                _client_pid = os.getpid()
+
+    return _client
+
+
+def get_db():
+    return get_client()[database_name]
+
+
+def ping():
+    """
+    Health check of the database
+
+    Expected Output:
+    (ok (bool), error message or None)
+    """
+    try:
+        get_client().admin.command('ping')
+        return True, None
+    except PyMongoError as e:
+        return False, str(e)
+
+
+class LazyDatabase:
+    """
+    Stand-in for the Database of the current process, e.g. db.eu.aggregate(...) or db['eu_cube']
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+class LazyCollection:
+    """
+    Stand-in for a Collection of the current process, e.g. eu.insert_many(...)
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_db()[self.name], attribute)
+
+
+db = LazyDatabase()
+eu = LazyCollection('eu')
@@ -0,0 +1,147 @@
+import asyncio
+import os
+from functools import wraps
+from weakref import WeakKeyDictionary
+from backend import DB
+from backend import cache
+from backend import queries
+
+########################################################################################################################
+# Asyncio variant of the query_list functions, on the motor driver
+#
+# Every function runs the same aggregation plan as its synchronous counterpart in backend/queries.py (see
+# queries.plan) and returns the same output, but awaits the server instead of blocking a thread, so a single event
+# loop can have many queries of many analysts in flight at once:
+#     results = await gather_queries([(ex1_cpv_box, (2010, 2015)), (ex2_cpv_treemap, (2010, 2015))])
+#
+# Results are read from and written to the same result cache as the synchronous functions. The pre-aggregated
+# rollups (BDMM_USE_CUBE / BDMM_USE_PARTIALS) are not used here, these functions always aggregate eu. The client is
+# configured like backend/DB.py and created once per process and event loop, motor needs the motor package. The cache
+# and data version reads and writes are blocking I/O (SQLite, Redis or pymongo) and run in the default executor of
+# the loop, so they never stall the other queries. The dimension tables of the joins are loaded once per process,
+# synchronously, on first use (see backend/dimensions.py).
+########################################################################################################################
+
+_clients = WeakKeyDictionary()
+
+# background revalidations, referenced until they finish
+_tasks = set()
+
+
+def get_client():
+    """
+    Returns the AsyncIOMotorClient of the running event loop in the current process
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    loop = asyncio.get_running_loop()
+    client, pid = _clients.get(loop, (None, None))
+    if client is None or pid != os.getpid():
+        client = AsyncIOMotorClient(DB.uri, connect=False, **DB.client_options)
+        _clients[loop] = (client, os.getpid())
+
+    return client
+
+
+def get_db():
+    return get_client()[DB.database_name]
+
+
+async def run(plan_):
+    """
+    Runs a plan of backend/queries.py on eu and returns the finished documents
+    """
+    cursor = get_db().eu.aggregate(plan_['pipeline'], **plan_['options'])
+
+    return queries.finish(plan_, await cursor.to_list(length=None))
+
+
+async def blocking(fn, *args):
+    """
+    Awaits a blocking call run in the default executor of the event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def compute(key, plan_):
+    # read before running the query, see cache.compute
+    version = await blocking(cache.query_cache.version)
+    value = await run(plan_)
+    await blocking(cache.query_cache.set, key, value, version)
+
+    return value
+
+
+async def revalidate(fn, key, plan_):
+    try:
+        await compute(key, plan_)
+    except Exception as e:
+        print(f"Refreshing {fn.__name__} failed: {e}", flush=True)
+    finally:
+        cache.end_refresh(key)
+
+
+def asynchronous(fn):
+    """
+    Builds the coroutine function of a query_list function from its plan in queries.query_plans, with the same cache
+    policy as cache.memoize
+    """
+    fn = getattr(fn, '__wrapped__', fn)
+    query_plan = queries.query_plans[fn.__name__]
+
+    @wraps(fn)
+    async def query(*args, **kwargs):
+        key = cache.cache_key(fn, args, kwargs)
+        status, value = await blocking(cache.query_cache.get, key)
+        if status == 'stale' and cache.stale_while_revalidate:
+            if cache.start_refresh(key):
+                task = asyncio.ensure_future(revalidate(fn, key, query_plan(*args, **kwargs)))
+                _tasks.add(task)
+                task.add_done_callback(_tasks.discard)
+        elif status != 'hit':
+            value = await compute(key, query_plan(*args, **kwargs))
+
+        return value
+
+    return query
+
+
+async def gather_queries(calls):
+    """
+    Awaits every (coroutine function, args) call concurrently
+
+    Expected Output:
+    list of the results, in the order of 'calls'
+    """
+    return await asyncio.gather(*(fn(*args) for fn, args in calls))
+
+
+ex1_cpv_box = asynchronous(queries.ex1_cpv_box)
+ex2_cpv_treemap = asynchronous(queries.ex2_cpv_treemap)
+ex3_cpv_bar_1 = asynchronous(queries.ex3_cpv_bar_1)
+ex4_cpv_bar_2 = asynchronous(queries.ex4_cpv_bar_2)
+ex5_cpv_bar_3 = asynchronous(queries.ex5_cpv_bar_3)
+ex6_cpv_bar_4 = asynchronous(queries.ex6_cpv_bar_4)
+ex7_cpv_map = asynchronous(queries.ex7_cpv_map)
+ex8_cpv_hist = asynchronous(queries.ex8_cpv_hist)
+ex9_cpv_bar_diff = asynchronous(queries.ex9_cpv_bar_diff)
+ex10_country_box = asynchronous(queries.ex10_country_box)
+ex11_country_treemap = asynchronous(queries.ex11_country_treemap)
+ex12_country_bar_1 = asynchronous(queries.ex12_country_bar_1)
+ex13_country_bar_2 = asynchronous(queries.ex13_country_bar_2)
+ex14_country_map = asynchronous(queries.ex14_country_map)
+ex15_business_box = asynchronous(queries.ex15_business_box)
+ex16_business_bar_1 = asynchronous(queries.ex16_business_bar_1)
+ex17_business_bar_2 = asynchronous(queries.ex17_business_bar_2)
+ex18_business_treemap = asynchronous(queries.ex18_business_treemap)
+ex19_business_map = asynchronous(queries.ex19_business_map)
+ex20_business_connection = asynchronous(queries.ex20_business_connection)
+
+query_list = [
+    ex1_cpv_box, ex2_cpv_treemap, ex3_cpv_bar_1, ex4_cpv_bar_2,
+    ex5_cpv_bar_3, ex6_cpv_bar_4, ex7_cpv_map, ex8_cpv_hist, ex9_cpv_bar_diff,
+    ex10_country_box, ex11_country_treemap, ex12_country_bar_1,
+    ex13_country_bar_2, ex14_country_map, ex15_business_box,
+    ex16_business_bar_1, ex17_business_bar_2, ex18_business_treemap,
+    ex19_business_map, ex20_business_connection
+]
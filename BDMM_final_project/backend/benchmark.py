@@ -0,0 +1,187 @@
+import argparse
+import csv
+import os
+import sys
+
+########################################################################################################################
+# Headless benchmark of the query_list functions
+#
+# Only imports the query layer (backend/queries.py and backend/DB.py), not the Dash app, so it runs on a box without
+# the web server, e.g. nightly against a local mongod:
+#     python -m backend.benchmark --uri mongodb://localhost:27017 --iterations 20 --json bench.json --budget 2
+#     python -m backend.benchmark --query ex8_cpv_hist --query ex19 --explain --csv bench.csv
+# The exit status is 1 when a query exceeds its latency budget, 2 on invalid arguments (e.g. an unknown query) and 3
+# when the database cannot be reached.
+########################################################################################################################
+
+csv_fields = ['query', 'min', 'median', 'mean', 'p95', 'p99', 'max', 'documents', 'bytes',
+              'indexes', 'collscan', 'keys_examined', 'docs_examined', 'spilled', 'flagged']
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a non negative integer")
+
+    return number
+
+
+def query_budget(value):
+    """
+    Parses NAME=SECONDS into (name, seconds)
+    """
+    name, _, seconds = value.partition('=')
+    try:
+        return name, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not NAME=SECONDS")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard queries without the web server')
+    parser.add_argument('--uri', help='MongoDB connection string (default BDMM_MONGO_URI or mongodb://localhost:27017)')
+    parser.add_argument('--db', help='database name (default BDMM_MONGO_DB or contracts)')
+    parser.add_argument('--query', action='append', default=[],
+                        help='query to run, full name or prefix such as ex8 (repeatable, default all)')
+    parser.add_argument('--list', action='store_true', help='list the query names and exit')
+    parser.add_argument('--warmup', type=non_negative_int, default=1, help='unmeasured runs per query (default 1)')
+    parser.add_argument('--iterations', type=positive_int, default=10, help='measured runs per query (default 10)')
+    parser.add_argument('--explain', action='store_true', help='capture the explain plan of each pipeline')
+    parser.add_argument('--scan-ratio', type=float, default=1000,
+                        help='flag pipelines examining more than this many documents per returned one')
+    parser.add_argument('--json', help='write the full report as JSON to this file')
+    parser.add_argument('--csv', help='write one row per query as CSV to this file')
+    parser.add_argument('--budget', type=float, help='latency budget in seconds of every query')
+    parser.add_argument('--query-budget', action='append', default=[], type=query_budget, metavar='NAME=SECONDS',
+                        help='latency budget of one query, overrides --budget (repeatable)')
+    parser.add_argument('--budget-stat', default='p95', choices=['min', 'median', 'mean', 'p95', 'p99', 'max'],
+                        help='latency statistic compared with the budget (default p95)')
+
+    return parser
+
+
+def matches(fn, name):
+    return fn.__name__ == name or fn.__name__.startswith(name + '_')
+
+
+def select_queries(query_list, names):
+    """
+    Functions of query_list matching the given full names or prefixes, in query_list order, raises ValueError on a
+    name matching no query
+    """
+    if not names:
+        return list(query_list)
+
+    selected = [fn for fn in query_list if any(matches(fn, name) for name in names)]
+    unknown = [name for name in names if not any(matches(fn, name) for fn in query_list)]
+    if unknown:
+        raise ValueError(f"Unknown queries: {', '.join(unknown)}")
+
+    return selected
+
+
+def budgets(args, query_list):
+    """
+    Budgets of the run, the --query-budget names being full names or prefixes of exactly one query of query_list,
+    raises ValueError otherwise (a typo would silently disable the budget)
+
+    Expected Output (dict):
+    {query name or None (every query): seconds, ....}
+    """
+    budgets_ = {None: args.budget} if args.budget is not None else {}
+    for name, seconds in args.query_budget:
+        found = [fn.__name__ for fn in query_list if matches(fn, name)]
+        if not found:
+            raise ValueError(f"Unknown query in --query-budget: {name}")
+        if len(found) > 1:
+            raise ValueError(f"Ambiguous query in --query-budget: {name} matches {', '.join(found)}")
+        budgets_[found[0]] = seconds
+
+    return budgets_
+
+
+def over_budget(results, budgets_, stat):
+    """
+    Expected Output (list):
+    [(query name, measured seconds, budget seconds), ....] of the queries exceeding their budget
+    """
+    exceeded = []
+    for result in results:
+        budget = budgets_.get(result['query'], budgets_.get(None))
+        if budget is not None and result['latency'][stat] > budget:
+            exceeded.append((result['query'], result['latency'][stat], budget))
+
+    return exceeded
+
+
+def csv_row(result):
+    row = dict(result['latency'], query=result['query'], **result['result'])
+    if result.get('explain'):
+        row.update({field: result['explain'][field] for field in csv_fields if field in result['explain']})
+        row['indexes'] = ' '.join(row['indexes'])
+
+    return row
+
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=csv_fields, extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            writer.writerow(csv_row(result))
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # the connection layer reads its configuration when imported, and a one-off run has no use for the shared
+    # result cache file
+    if args.uri:
+        os.environ['BDMM_MONGO_URI'] = args.uri
+    if args.db:
+        os.environ['BDMM_MONGO_DB'] = args.db
+    os.environ.setdefault('BDMM_CACHE_BACKEND', 'memory')
+
+    from backend import DB
+    from backend import performance_evaluation
+    from backend.queries import query_list
+
+    try:
+        functions = select_queries(query_list, args.query)
+        budgets_ = budgets(args, query_list)
+    except ValueError as e:
+        # exits with 2, a misconfigured run is not mistaken for a budget regression
+        parser.error(str(e))
+    if args.list:
+        print('\n'.join(fn.__name__ for fn in functions))
+        return 0
+
+    ok, error = DB.ping()
+    if not ok:
+        print(f"Database unavailable: {error}", file=sys.stderr, flush=True)
+        return 3
+
+    report = performance_evaluation.benchmark(functions, warmup=args.warmup, iterations=args.iterations,
+                                              output=args.json, explain=args.explain, scan_ratio=args.scan_ratio)
+    if args.csv:
+        write_csv(report['queries'], args.csv)
+
+    exceeded = over_budget(report['queries'], budgets_, args.budget_stat)
+    for name, seconds, budget in exceeded:
+        print(f"{name}: {args.budget_stat} {seconds:.3f}s exceeds the budget of {budget:.3f}s", file=sys.stderr,
+              flush=True)
+
+    return 1 if exceeded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
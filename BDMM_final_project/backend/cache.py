@@ -0,0 +1,357 @@
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock, Thread
+from backend import metadata
+
+########################################################################################################################
+# Result cache of the query_list functions
+#
+# Results are keyed by the function name plus its normalized arguments (defaults applied, lists sorted), so that
+# repeated Submit clicks on the same year range and country selection are answered from the cache. Every result is
+# tagged with the data version it was computed on (see backend/metadata.py) and is recomputed as soon as the version
+# moves, so an unchanged dataset is never recomputed. Keys are prefixed with the epoch of the database, so a cache
+# file shared by several databases (BDMM_MONGO_URI / BDMM_MONGO_DB) never serves the results of another one. By
+# default a result of a previous version is still served (stale-while-revalidate) while a background thread
+# recomputes it, so a page load never waits for a cold scan once the view was computed at least once (see
+# backend/warmup.py).
+#
+# Results are pickled and compressed and kept in a pluggable store. The default SQLite file is shared by every
+# worker process of the Dash server on the same machine, a Redis compatible server shares them across machines.
+#     BDMM_CACHE_BACKEND  'sqlite' (default), 'redis' or 'memory' (private to the process)
+#     BDMM_CACHE_PATH     SQLite file (default .query_cache.sqlite)
+#     BDMM_REDIS_URL      Redis server (default redis://localhost:6379/0)
+#     BDMM_CACHE_SIZE     maximum number of cached results (default 256)
+#     BDMM_CACHE_TTL      seconds a result stays valid regardless of the version (default 0, no expiry)
+#     BDMM_CACHE_STALE    '1' (default) serves stale results while revalidating, '0' recomputes synchronously
+#     BDMM_CACHE_TOUCH    seconds between two updates of the last access time of a SQLite entry (default 60)
+########################################################################################################################
+
+backend_name = os.environ.get('BDMM_CACHE_BACKEND', 'sqlite')
+sqlite_path = os.environ.get('BDMM_CACHE_PATH', '.query_cache.sqlite')
+redis_url = os.environ.get('BDMM_REDIS_URL', 'redis://localhost:6379/0')
+max_entries = int(os.environ.get('BDMM_CACHE_SIZE', '256'))
+ttl = float(os.environ.get('BDMM_CACHE_TTL', '0'))
+stale_while_revalidate = os.environ.get('BDMM_CACHE_STALE', '1') == '1'
+touch_interval = float(os.environ.get('BDMM_CACHE_TOUCH', '60'))
+
+
+def serialize(value):
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def deserialize(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+class MemoryStore:
+    """
+    LRU store private to the process
+    """
+
+    def __init__(self, max_entries=max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                return False
+        self.set(key, entry)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    LRU store in a local SQLite file, shared by every process opening the same file
+
+    A connection is opened per operation so the store is safe to use from threads and forked workers. The last access
+    time is only updated when it is older than touch_interval, so that most hits are plain reads that do not queue on
+    the write lock of the file (the LRU order is approximate within touch_interval).
+    """
+
+    def __init__(self, path=sqlite_path, max_entries=max_entries, touch_interval=touch_interval):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                               '(key TEXT PRIMARY KEY, stored_at REAL, accessed_at REAL, version INTEGER, value BLOB)')
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute('SELECT stored_at, version, value, accessed_at FROM entries WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[3] >= self.touch_interval:
+                connection.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+        return row[:3]
+
+    def set(self, key, entry):
+        stored_at, version, value = entry
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                               (key, stored_at, stored_at, version, value))
+            connection.execute('DELETE FROM entries WHERE key NOT IN '
+                               '(SELECT key FROM entries ORDER BY accessed_at DESC LIMIT ?)', (self.max_entries,))
+
+    def add(self, key, entry):
+        """
+        Stores the entry only if the key is not there yet, in one statement so that a single process wins
+
+        Expected Output:
+        True if the entry was stored
+        """
+        stored_at, version, value = entry
+        with self._connect() as connection:
+            cursor = connection.execute('INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)',
+                                        (key, stored_at, stored_at, version, value))
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM entries')
+
+    def size(self):
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+class RedisStore:
+    """
+    Store in a Redis compatible server, eviction is left to the server's maxmemory policy
+    """
+
+    prefix = 'bdmm:query:'
+
+    def __init__(self, url=redis_url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        entry = self.client.get(self.prefix + key)
+        return pickle.loads(entry) if entry is not None else None
+
+    def set(self, key, entry):
+        self.client.set(self.prefix + key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL),
+                        ex=int(ttl) if ttl else None)
+
+    def add(self, key, entry):
+        return bool(self.client.set(self.prefix + key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL),
+                                    ex=int(ttl) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + '*'))
+
+
+stores = {'memory': MemoryStore, 'sqlite': SQLiteStore, 'redis': RedisStore}
+
+
+class QueryCache:
+    """
+    Cache of versioned values with time to live and hit / stale / miss counters, kept in one of the stores above
+
+    'version' is a callable returning the current data version, entries computed on another version are stale.
+    'namespace' is a callable returning the epoch of the database, prefixed to every key so that entries of another
+    database are misses (versions start at 0 in every database)
+    """
+
+    def __init__(self, store, ttl=ttl, version=metadata.data_version, namespace=metadata.data_epoch):
+        self.store = store
+        self.ttl = ttl
+        self.version = version
+        self.namespace = namespace
+        self.counters = {'hit': 0, 'stale': 0, 'miss': 0}
+        self._lock = Lock()
+
+    def _count(self, status):
+        with self._lock:
+            self.counters[status] += 1
+
+    def store_key(self, key):
+        return f"{self.namespace()}:{key}"
+
+    def get(self, key):
+        """
+        Expected Output:
+        (status, value), status being 'hit', 'stale' (computed on a previous data version) or 'miss'
+        """
+        version = self.version()
+        key = self.store_key(key)
+        entry = self.store.get(key)
+        if entry is None or (self.ttl and time.time() - entry[0] > self.ttl):
+            if entry is not None:
+                self.store.delete(key)
+            self._count('miss')
+            return 'miss', None
+
+        status = 'hit' if entry[1] == version else 'stale'
+        self._count(status)
+        return status, deserialize(entry[2])
+
+    def set(self, key, value, version):
+        self.store.set(self.store_key(key), (time.time(), version, serialize(value)))
+
+    def claim(self, name):
+        """
+        Takes a marker shared by every process using the store, e.g. 'warmup:<version>' so that a single process warms
+        the cache of a data version (a MemoryStore is private, every process then claims its own)
+
+        Expected Output:
+        True for the first caller in the current namespace
+        """
+        return self.store.add(self.store_key(name), (time.time(), None, serialize(None)))
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        """
+        Expected Output (dict):
+        {'hit': int, 'stale': int, 'miss': int, 'size': int}
+        """
+        return dict(self.counters, size=self.store.size())
+
+
+query_cache = QueryCache(stores[backend_name]())
+
+
+def normalize(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(set(value), key=str))
+
+    return value
+
+
+def cache_key(fn, args, kwargs):
+    """
+    Key of a call, the same for every way of passing the same arguments and in every process, e.g.
+    ex2_cpv_treemap(2008, 2020, ['PT', 'ES']) and ex2_cpv_treemap(country_list=['ES', 'PT'])
+    -> "ex2_cpv_treemap:<sha1 of (('bot_year', 2008), ('top_year', 2020), ('country_list', ('ES', 'PT')))>"
+    """
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = tuple((name, normalize(value)) for name, value in bound.arguments.items())
+
+    return f"{fn.__name__}:{hashlib.sha1(repr(arguments).encode()).hexdigest()}"
+
+
+_refreshing = set()
+_refreshing_lock = Lock()
+
+
+def compute(fn, key, args, kwargs):
+    # read before running the query, a concurrent insert then leaves the result tagged with the old version
+    version = query_cache.version()
+    value = fn(*args, **kwargs)
+    query_cache.set(key, value, version)
+
+    return value
+
+
+def start_refresh(key):
+    """
+    Marks a key as being refreshed, at most one refresh per key runs at a time in this process
+
+    Expected Output:
+    True if the caller should refresh it, False if a refresh is already running
+    """
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+
+    return True
+
+
+def end_refresh(key):
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def revalidate(fn, key, args, kwargs):
+    """
+    Recomputes a stale result in a background thread, see start_refresh
+    """
+
+    if not start_refresh(key):
+        return
+
+    def refresh():
+        try:
+            compute(fn, key, args, kwargs)
+        except Exception as e:
+            print(f"Refreshing {fn.__name__} failed: {e}", flush=True)
+        finally:
+            end_refresh(key)
+
+    Thread(target=refresh, daemon=True).start()
+
+
+def memoize(fn):
+    """
+    Decorator caching the results of a query function in query_cache, the uncached function is kept as __wrapped__
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = cache_key(fn, args, kwargs)
+        status, value = query_cache.get(key)
+        if status == 'stale' and stale_while_revalidate:
+            revalidate(fn, key, args, kwargs)
+        elif status != 'hit':
+            value = compute(fn, key, args, kwargs)
+
+        return value
+
+    return wrapper
@@ -0,0 +1,356 @@
+from pymongo import UpdateOne
+from backend.DB import db
+from backend import dimensions
+from backend import ingest
+from backend import metadata
+from backend.indexes import ensure_indexes
+
+########################################################################################################################
+# Pre-aggregated OLAP cube over the eu collection
+#
+# One document (cell) per YEAR x ISO_COUNTRY_CODE x CPV division x B_EU_FUNDS holding the sums and counts needed to
+# answer the group by queries of the CPV and Country pages. Averages are rebuilt as value_sum / value_count, where
+# value_count only counts numeric values, so that the result is the same as '$avg' over the raw contracts.
+#
+# Build (or rebuild) with, after running backend.migrations so every contract carries CPV_DIVISION:
+#     python -m backend.cube
+#
+# After it is built, insert_operation keeps it current by '$inc'-ing the cells touched by each inserted batch.
+########################################################################################################################
+
+cube_name = 'eu_cube'
+building_name = 'eu_cube_building'
+
+cell_id = {
+    'YEAR': '$YEAR',
+    'ISO_COUNTRY_CODE': '$ISO_COUNTRY_CODE',
+    'CPV_DIVISION': '$CPV_DIVISION',
+    'B_EU_FUNDS': '$B_EU_FUNDS'
+}
+
+measures = ['count', 'value_sum', 'value_count', 'offers_sum', 'offers_count']
+
+
+def cell_pipeline():
+    """
+    Returns the stages grouping contracts into cube cells
+
+    Expected Output (list of stages), each produced document having the shape:
+    {_id: {YEAR, ISO_COUNTRY_CODE, CPV_DIVISION, B_EU_FUNDS}, YEAR, ISO_COUNTRY_CODE, CPV_DIVISION, B_EU_FUNDS,
+     count, value_sum, value_count, offers_sum, offers_count}
+    """
+
+    groupby_cell = {
+        '$group': {
+            '_id': cell_id,
+            'count': {'$sum': 1},
+            'value_sum': {'$sum': '$VALUE_EURO'},
+            'value_count': {'$sum': {'$cond': [{'$isNumber': '$VALUE_EURO'}, 1, 0]}},
+            'offers_sum': {'$sum': '$NUMBER_OFFERS'},
+            'offers_count': {'$sum': {'$cond': [{'$isNumber': '$NUMBER_OFFERS'}, 1, 0]}}
+        }
+    }
+
+    flatten = {
+        '$set': {
+            'YEAR': '$_id.YEAR',
+            'ISO_COUNTRY_CODE': '$_id.ISO_COUNTRY_CODE',
+            'CPV_DIVISION': '$_id.CPV_DIVISION',
+            'B_EU_FUNDS': '$_id.B_EU_FUNDS'
+        }
+    }
+
+    return [groupby_cell, flatten]
+
+
+def build_cube():
+    """
+    Builds the cube collection from the eu collection into a temporary collection with '$out' and renames it over the
+    previous cube, so cells that are no longer produced (e.g. deleted contracts) do not survive a rebuild
+
+    Expected Output:
+    number of cells in the cube (int)
+    """
+
+    out = {'$out': building_name}
+
+    db.eu.aggregate(cell_pipeline() + [out], allowDiskUse=True)
+    if building_name in db.list_collection_names():
+        db[building_name].rename(cube_name, dropTarget=True)
+    else:
+        # no contract at all, some server versions do not create an empty '$out' collection
+        db[cube_name].drop()
+        db.create_collection(cube_name)
+    ensure_indexes([cube_name])
+    # the cube backed queries may return different results
+    metadata.bump_data_version()
+
+    return db[cube_name].count_documents({})
+
+
+def cell_deltas(documents):
+    """
+    Aggregates documents into cube cells in memory, mirroring cell_pipeline
+
+    Expected Output (dict):
+    {(YEAR, ISO_COUNTRY_CODE, CPV_DIVISION, B_EU_FUNDS): {count, value_sum, value_count, offers_sum, offers_count}}
+    """
+
+    deltas = {}
+    for document in documents:
+        key = (document.get('YEAR'), document.get('ISO_COUNTRY_CODE'), document.get('CPV_DIVISION'),
+               document.get('B_EU_FUNDS'))
+        cell = deltas.setdefault(key, dict.fromkeys(measures, 0))
+
+        value = document.get('VALUE_EURO')
+        offers = document.get('NUMBER_OFFERS')
+
+        cell['count'] += 1
+        if ingest.is_number(value):
+            cell['value_sum'] += value
+            cell['value_count'] += 1
+        if ingest.is_number(offers):
+            cell['offers_sum'] += offers
+            cell['offers_count'] += 1
+
+    return deltas
+
+
+def increment_cube(documents):
+    """
+    Adds freshly inserted documents to the cube without rebuilding it, does nothing if the cube was never built
+
+    Expected Output:
+    number of cells touched (int)
+    """
+
+    if cube_name not in db.list_collection_names():
+        return 0
+
+    operations = []
+    for key, cell in cell_deltas(documents).items():
+        id_ = dict(zip(['YEAR', 'ISO_COUNTRY_CODE', 'CPV_DIVISION', 'B_EU_FUNDS'], key))
+        operations.append(UpdateOne({'_id': id_}, {'$inc': cell, '$setOnInsert': id_}, upsert=True))
+
+    if operations:
+        db[cube_name].bulk_write(operations, ordered=False)
+
+    return len(operations)
+
+
+def cube_filter(bot_year, top_year, country_list, extra=None):
+    filter_ = {
+        '$match': {
+            '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
+            'ISO_COUNTRY_CODE': {'$in': country_list}
+        }
+    }
+    if extra:
+        filter_['$match'].update(extra)
+
+    return filter_
+
+
+def average(sum_field, count_field):
+    return {'$cond': [{'$gt': [count_field, 0]}, {'$divide': [sum_field, count_field]}, None]}
+
+
+def box(bot_year, top_year, country_list, group_field):
+    """
+    Cube version of the five box metrics, grouped by 'group_field' (CPV_DIVISION or ISO_COUNTRY_CODE)
+
+    Expected Output:
+    (euro_avg, count, offer_avg, euro_avg_y_eu, euro_avg_n_eu)
+    """
+
+    def funds_sum(field, funds):
+        return {'$sum': {'$cond': [{'$eq': ['$B_EU_FUNDS', funds]}, field, 0]}}
+
+    groupby_key = {
+        '$group': {
+            '_id': '$' + group_field,
+            'count': {'$sum': '$count'},
+            'value_sum': {'$sum': '$value_sum'},
+            'value_count': {'$sum': '$value_count'},
+            'offers_sum': {'$sum': '$offers_sum'},
+            'offers_count': {'$sum': '$offers_count'},
+            'value_sum_y_eu': funds_sum('$value_sum', 'Y'),
+            'value_count_y_eu': funds_sum('$value_count', 'Y'),
+            'value_sum_n_eu': funds_sum('$value_sum', 'N'),
+            'value_count_n_eu': funds_sum('$value_count', 'N')
+        }
+    }
+
+    groupby_all = {
+        '$group': {
+            '_id': None,
+            'euro_avg': {'$avg': average('$value_sum', '$value_count')},
+            'count': {'$avg': '$count'},
+            'offer_avg': {'$avg': average('$offers_sum', '$offers_count')},
+            'euro_avg_y_eu': {'$avg': average('$value_sum_y_eu', '$value_count_y_eu')},
+            'euro_avg_n_eu': {'$avg': average('$value_sum_n_eu', '$value_count_n_eu')}
+        }
+    }
+
+    pipeline = [cube_filter(bot_year, top_year, country_list), groupby_key, groupby_all]
+
+    document = list(db[cube_name].aggregate(pipeline))[0]
+
+    return int(document['euro_avg']), int(document['count']), int(document['offer_avg']), \
+           int(document['euro_avg_y_eu']), int(document['euro_avg_n_eu'])
+
+
+def cpv_treemap(bot_year, top_year, country_list):
+    """
+    Cube version of ex2_cpv_treemap
+
+    Expected Output (list of documents):
+    [{cpv: value_1, count: value_2}, ....]
+    """
+
+    groupby_cpv_count = {
+        '$group': {
+            '_id': '$CPV_DIVISION',
+            'count': {'$sum': '$count'}
+        }
+    }
+
+    pipeline = [cube_filter(bot_year, top_year, country_list), groupby_cpv_count]
+
+    return dimensions.join_cpv(list(db[cube_name].aggregate(pipeline)))
+
+
+def cpv_bar(bot_year, top_year, country_list, order, eu_funds=None):
+    """
+    Cube version of ex3_cpv_bar_1 to ex6_cpv_bar_4, 'order' is 1 for the lowest and -1 for the highest 5 divisions and
+    'eu_funds' optionally restricts 'B_EU_FUNDS'
+
+    Expected Output (list of 5 sorted documents):
+    [{cpv: value_1, avg: value_2}, ....]
+    """
+
+    extra = {'B_EU_FUNDS': eu_funds} if eu_funds else None
+
+    groupby_cpv_avg = {
+        '$group': {
+            '_id': '$CPV_DIVISION',
+            'value_sum': {'$sum': '$value_sum'},
+            'value_count': {'$sum': '$value_count'}
+        }
+    }
+
+    average_ = {'$project': {'avg': average('$value_sum', '$value_count')}}
+
+    sort = {'$sort': {'avg': order}}
+    limit = {'$limit': 5}
+
+    pipeline = [cube_filter(bot_year, top_year, country_list, extra), groupby_cpv_avg, average_, sort, limit]
+
+    return dimensions.join_cpv(list(db[cube_name].aggregate(pipeline)))
+
+
+def cpv_map(bot_year, top_year, country_list):
+    """
+    Cube version of ex7_cpv_map
+
+    Expected Output (list of documents):
+    [{cpv: value_1, avg: value_2, country: value_3}, ....]
+    """
+
+    extra = {'CPV_DIVISION': {'$ne': None}}
+
+    groupby_isocode_cpv = {
+        '$group': {
+            '_id': {'iso': '$ISO_COUNTRY_CODE', 'cpv': '$CPV_DIVISION'},
+            'value_sum': {'$sum': '$value_sum'},
+            'value_count': {'$sum': '$value_count'}
+        }
+    }
+
+    average_ = {'$set': {'avg': average('$value_sum', '$value_count')}}
+
+    sort = {'$sort': {'_id.iso': 1, 'avg': -1}}
+
+    groupby_isocode_max = {
+        '$group': {
+            '_id': '$_id.iso',
+            'avg': {'$first': '$avg'},
+            'cpv': {'$first': '$_id.cpv'}
+        }
+    }
+
+    pipeline = [cube_filter(bot_year, top_year, country_list, extra), groupby_isocode_cpv, average_, sort,
+                groupby_isocode_max]
+
+    return dimensions.join_country(list(db[cube_name].aggregate(pipeline)))
+
+
+def country_treemap(bot_year, top_year, country_list):
+    """
+    Cube version of ex11_country_treemap
+
+    Expected Output (list of documents):
+    [{country: value_1, count: value_2}, ....]
+    """
+
+    groupby_isocode_count = {
+        '$group': {
+            '_id': '$ISO_COUNTRY_CODE',
+            'count': {'$sum': '$count'}
+        }
+    }
+
+    pipeline = [cube_filter(bot_year, top_year, country_list), groupby_isocode_count]
+
+    return dimensions.join_country(list(db[cube_name].aggregate(pipeline)))
+
+
+def country_bar(bot_year, top_year, country_list, order):
+    """
+    Cube version of ex12_country_bar_1 and ex13_country_bar_2, 'order' is 1 for the lowest and -1 for the highest 5
+    countries
+
+    Expected Output (list of 5 sorted documents):
+    [{country: value_1, avg: value_2}, ....]
+    """
+
+    groupby_isocode_avg = {
+        '$group': {
+            '_id': '$ISO_COUNTRY_CODE',
+            'value_sum': {'$sum': '$value_sum'},
+            'value_count': {'$sum': '$value_count'}
+        }
+    }
+
+    average_ = {'$project': {'avg': average('$value_sum', '$value_count')}}
+
+    sort = {'$sort': {'avg': order}}
+    limit = {'$limit': 5}
+
+    pipeline = [cube_filter(bot_year, top_year, country_list), groupby_isocode_avg, average_, sort, limit]
+
+    return dimensions.join_country(list(db[cube_name].aggregate(pipeline)))
+
+
+def country_map(bot_year, top_year, country_list):
+    """
+    Cube version of ex14_country_map
+
+    Expected Output (list of documents):
+    [{sum: value_1, country: value_2}, ....]
+    """
+
+    groupby_isocode_sum = {
+        '$group': {
+            '_id': '$ISO_COUNTRY_CODE',
+            'sum': {'$sum': '$value_sum'}
+        }
+    }
+
+    pipeline = [cube_filter(bot_year, top_year, country_list, {'B_EU_FUNDS': 'Y'}), groupby_isocode_sum]
+
+    return dimensions.join_country(list(db[cube_name].aggregate(pipeline)))
+
+
+if __name__ == '__main__':
+    print(f"Built {cube_name} with {build_cube()} cells", flush=True)
@@ -0,0 +1,82 @@
+from threading import Lock
+from backend.DB import db
+
+########################################################################################################################
+# In-process cache of the small dimension collections (cpv and iso_codes)
+#
+# The queries group on codes only and the description / country name is joined here, in Python, after the group,
+# instead of running a '$lookup' into these collections on every request. Call refresh() after changing them.
+########################################################################################################################
+
+# Codes used by TED that are not the ISO 3166 alpha-2 code of the country
+country_aliases = {'UK': 'GB', 'EL': 'GR'}
+
+_lock = Lock()
+_cpv_descriptions = None
+_country_names = None
+
+
+def refresh():
+    """
+    (Re)loads both dimension tables from the database
+    """
+    global _cpv_descriptions, _country_names
+
+    cpv_descriptions = {}
+    for document in db.cpv.find({}, {'_id': False, 'cpv_division': True, 'cpv_division_description': True}):
+        cpv_descriptions.setdefault(document.get('cpv_division'), document.get('cpv_division_description'))
+
+    country_names = {}
+    for document in db.iso_codes.find({}, {'_id': False, 'alpha-2': True, 'name': True}):
+        country_names.setdefault(document.get('alpha-2'), document.get('name'))
+
+    with _lock:
+        _cpv_descriptions, _country_names = cpv_descriptions, country_names
+
+
+def cpv_descriptions():
+    """
+    Expected Output (dict):
+    {cpv_division: cpv_division_description, ....}
+    """
+    if _cpv_descriptions is None:
+        refresh()
+
+    return _cpv_descriptions
+
+
+def country_names():
+    """
+    Expected Output (dict):
+    {alpha-2: name, ....}
+    """
+    if _country_names is None:
+        refresh()
+
+    return _country_names
+
+
+def country_name(code):
+    names = country_names()
+
+    return names.get(code, names.get(country_aliases.get(code)))
+
+
+def join_cpv(documents):
+    """
+    Replaces the CPV Division code in the '_id' of each grouped document with its description, as 'cpv'
+
+    [{_id: '72', count: 10}, ....] -> [{cpv: 'IT services: ...', count: 10}, ....]
+    """
+    descriptions = cpv_descriptions()
+
+    return [dict({'cpv': descriptions.get(document.pop('_id'))}, **document) for document in documents]
+
+
+def join_country(documents):
+    """
+    Replaces the 'ISO_COUNTRY_CODE' in the '_id' of each grouped document with the country name, as 'country'
+
+    [{_id: 'PT', count: 10}, ....] -> [{country: 'Portugal', count: 10}, ....]
+    """
+    return [dict({'country': country_name(document.pop('_id'))}, **document) for document in documents]
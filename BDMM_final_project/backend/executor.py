@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+########################################################################################################################
+# Page query executor
+#
+# Each dashboard page renders through a single callback that submits the builder of every tile to a bounded thread
+# pool and gathers the results, so the page takes about as long as its slowest query instead of the sum of its
+# queries. The pool is shared by every request of the process, which bounds the number of aggregations one worker
+# runs against the database at the same time (pymongo releases the GIL while waiting for the server).
+#     BDMM_PAGE_WORKERS  threads of the pool (default: enough for two loads of the largest page at the same time)
+########################################################################################################################
+
+# tiles of the CPV page (apps/codes.py), the largest page, a smaller pool would queue tiles of a single page load
+largest_page = 9
+
+max_workers = max(int(os.environ.get('BDMM_PAGE_WORKERS', str(2 * largest_page))), largest_page)
+
+_lock = Lock()
+_pool = None
+_pool_pid = None
+
+
+def get_pool():
+    """
+    Returns the thread pool of the current process, creating it on first use (or after a fork)
+    """
+    global _pool, _pool_pid
+
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='page-query')
+                _pool_pid = os.getpid()
+
+    return _pool
+
+
+def run_concurrently(tasks):
+    """
+    Runs every (function, args) task in the pool and waits for all of them, an exception is raised as the task's
+    result would have been
+
+    Expected Output:
+    list of the results, in the order of 'tasks'
+    """
+
+    futures = [get_pool().submit(fn, *args) for fn, args in tasks]
+
+    return [future.result() for future in futures]
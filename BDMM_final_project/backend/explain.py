@@ -0,0 +1,111 @@
+from backend.DB import db
+from backend.queries import query_plans
+
+########################################################################################################################
+# Explain plans of the query_list pipelines
+#
+# The pipeline of every query is taken from its plan (see queries.plan), so nothing is executed besides the explain
+# itself. With 'executionStats' the server runs the pipeline to count the keys and documents it examined, and
+# reports whether a stage spilled to disk. The explained pipeline is always the one on eu: a query answered from the
+# cube or the partial aggregates (BDMM_USE_CUBE / BDMM_USE_PARTIALS) is not explained.
+########################################################################################################################
+
+# a pipeline examining more than scan_ratio times the documents it returns is flagged
+scan_ratio = 1000
+
+
+def find_values(document, key):
+    """
+    Every value of 'key' anywhere in a nested explain document
+    """
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from find_values(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from find_values(value, key)
+
+
+def explain_pipeline(plan_, verbosity='executionStats'):
+    """
+    Runs the 'explain' command of an aggregation plan on eu and returns the raw explain document
+    """
+    command = {'aggregate': 'eu', 'pipeline': plan_['pipeline'], 'cursor': {}}
+    command.update(plan_['options'])
+
+    return db.command('explain', command, verbosity=verbosity)
+
+
+def explain_summary(explained):
+    """
+    Summary of an explain document, in either of its shapes (whole pipeline pushed down to the query layer, or a
+    '$cursor' first stage followed by the remaining 'stages')
+
+    Expected Output (dict):
+    {'winning_plan': dict, 'indexes': [index names], 'collscan': bool, 'keys_examined': int, 'docs_examined': int,
+     'spilled': bool, 'memory_bytes': int}
+    """
+    winning_plan = next(find_values(explained, 'winningPlan'), {})
+    stages = list(find_values(winning_plan, 'stage'))
+
+    return {
+        'winning_plan': winning_plan,
+        'indexes': sorted(set(find_values(winning_plan, 'indexName'))),
+        'collscan': 'COLLSCAN' in stages,
+        'keys_examined': sum(find_values(explained, 'totalKeysExamined')),
+        'docs_examined': sum(find_values(explained, 'totalDocsExamined')),
+        'spilled': any(find_values(explained, 'usedDisk')) or any(spills > 0 for spills in find_values(explained, 'spills')),
+        'memory_bytes': memory_bytes(explained),
+    }
+
+
+def memory_bytes(explained):
+    """
+    Memory used by the blocking stages ('$group', '$sort', ...) as reported by the server, 0 when the server version
+    does not report it
+    """
+    accumulators = sum(sum(usage.values()) for usage in find_values(explained, 'maxAccumulatorMemoryUsageBytes')
+                       if isinstance(usage, dict))
+
+    return accumulators or max(find_values(explained, 'peakTrackedMemBytes'), default=0)
+
+
+def explain_query(fn, args=(), kwargs=None, returned=None, ratio=scan_ratio):
+    """
+    Explains a query_list function with the given arguments
+
+    'returned' is the number of documents the query returns (see performance_evaluation.result_size), it defaults to
+    the 'nReturned' of the last stage of the explain. The query is flagged when it examines more than 'ratio' times
+    that many documents.
+
+    Expected Output (dict):
+    explain_summary plus {'returned': int, 'flagged': bool}
+    """
+    plan_ = query_plans[fn.__name__](*args, **(kwargs or {}))
+    explained = explain_pipeline(plan_)
+    summary = explain_summary(explained)
+
+    if returned is None:
+        stages = explained.get('stages')
+        last = stages[-1] if stages else explained.get('executionStats', {})
+        returned = last.get('nReturned', 0)
+
+    summary['returned'] = returned
+    summary['flagged'] = summary['docs_examined'] > ratio * max(returned, 1)
+
+    return summary
+
+
+def describe(summary):
+    """
+    One line description of an explain summary, e.g. 'IXSCAN YEAR_1_ISO_COUNTRY_CODE_1_CPV_DIVISION_1, 1520 keys,
+    1520 docs examined for 5 returned'
+    """
+    access = 'COLLSCAN' if summary['collscan'] else f"IXSCAN {', '.join(summary['indexes']) or '-'}"
+    spill = ', spilled to disk' if summary['spilled'] else ''
+    flag = ' [FLAGGED]' if summary['flagged'] else ''
+
+    return (f"{access}, {summary['keys_examined']} keys, {summary['docs_examined']} docs examined "
+            f"for {summary['returned']} returned{spill}{flag}")
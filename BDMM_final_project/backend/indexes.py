@@ -0,0 +1,151 @@
+import argparse
+from backend.DB import db
+
+########################################################################################################################
+# Declarative index specification of the contracts database
+#
+# Every index the pipelines in backend/queries.py rely on is listed here, so that a fresh environment or a test
+# database gets the same physical design as production:
+#     python -m backend.indexes              create the missing indexes
+#     python -m backend.indexes --reconcile  also drop indexes that are not in the specification
+#     python -m backend.indexes --report     show which indexes each query of query_list uses
+########################################################################################################################
+
+index_spec = {
+    'eu': [
+        # YEAR / ISO_COUNTRY_CODE filter prefix of every query, CPV_DIVISION for the CPV groupings
+        [('YEAR', 1), ('ISO_COUNTRY_CODE', 1), ('CPV_DIVISION', 1)],
+        # CPV code prefix ranges (see queries.cpv_prefix) of ex8_cpv_hist
+        [('YEAR', 1), ('ISO_COUNTRY_CODE', 1), ('CPV', 1)],
+        # CAE_NAME groupings of the Business page (ex15 to ex19)
+        [('YEAR', 1), ('ISO_COUNTRY_CODE', 1), ('CAE_NAME', 1)],
+    ],
+    # backend.cube.cube_name
+    'eu_cube': [
+        [('YEAR', 1), ('ISO_COUNTRY_CODE', 1)],
+    ],
+}
+
+
+def index_name(keys):
+    """
+    Default MongoDB name of an index, e.g. [('YEAR', 1), ('CAE_NAME', 1)] -> 'YEAR_1_CAE_NAME_1'
+    """
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+
+def ensure_indexes(collections=None, reconcile=False):
+    """
+    Creates the indexes of index_spec that do not exist yet, optionally restricted to some collections
+
+    Existing indexes are matched by key pattern: an index with the keys of the specification under another name (made
+    by hand or by an older deploy) counts as present, as creating it again would fail, and is only replaced by the
+    specification's name when 'reconcile' is True. An existing index with the name of the specification but different
+    keys is dropped and recreated. When 'reconcile' is True the indexes that are not in index_spec (other than '_id_')
+    are dropped as well.
+
+    Collections that do not exist are skipped, as creating an index would create them: an empty eu_cube would be taken
+    for a built cube (see cube.increment_cube and partials.fetch_cells). Run it again once the data is loaded.
+
+    Expected Output (dict):
+    {collection: {'created': [index names], 'dropped': [index names]}, ....}
+    """
+
+    existing_collections = set(db.list_collection_names())
+
+    report = {}
+    for collection in collections or index_spec:
+        if collection not in existing_collections:
+            continue
+        wanted = {index_name(keys): keys for keys in index_spec.get(collection, [])}
+        existing = {name: [(field, int(direction)) if isinstance(direction, float) else (field, direction)
+                           for field, direction in info['key']]
+                    for name, info in db[collection].index_information().items()}
+
+        dropped, created = index_changes(existing, wanted, reconcile)
+        for name in dropped:
+            db[collection].drop_index(name)
+        for name in created:
+            db[collection].create_index(wanted[name], name=name)
+
+        report[collection] = {'created': created, 'dropped': dropped}
+
+    return report
+
+
+def index_changes(existing, wanted, reconcile=False):
+    """
+    Compares the existing indexes of a collection with the wanted ones, both as {name: [(field, direction), ....]}
+
+    Expected Output:
+    ([index names to drop], [wanted index names to create]), drops first
+    """
+
+    dropped = []
+    for name, keys in existing.items():
+        if name == '_id_':
+            continue
+        if name in wanted:
+            # the name is taken by other keys
+            if keys != wanted[name]:
+                dropped.append(name)
+        elif reconcile:
+            # not in the specification, or its keys under another name (otherwise kept and counted as present)
+            dropped.append(name)
+
+    kept = [keys for name, keys in existing.items() if name not in dropped]
+    created = [name for name, keys in wanted.items() if keys not in kept]
+
+    return dropped, created
+
+
+def index_accesses():
+    """
+    Returns the number of operations that used each index since the server started, read with '$indexStats'
+
+    Expected Output (dict):
+    {(collection, index name): accesses (int), ....}
+    """
+
+    accesses = {}
+    for collection in index_spec:
+        for stats in db[collection].aggregate([{'$indexStats': {}}]):
+            accesses[(collection, stats['name'])] = stats['accesses']['ops']
+
+    return accesses
+
+
+def index_usage_report(functions=None):
+    """
+    Runs each query, bypassing the result cache, and reports the indexes whose access counters moved while it ran
+
+    The counters are server wide, so the report is only exact when nothing else is querying the database.
+
+    Expected Output (dict):
+    {function name: [(collection, index name), ....], ....}
+    """
+
+    from backend.queries import query_list
+
+    report = {}
+    for fn in functions or query_list:
+        before = index_accesses()
+        getattr(fn, '__wrapped__', fn)()
+        after = index_accesses()
+        report[fn.__name__] = [key for key, ops in after.items() if ops > before.get(key, 0)]
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create or reconcile the indexes of the contracts database')
+    parser.add_argument('--reconcile', action='store_true', help='drop indexes that are not in the specification')
+    parser.add_argument('--report', action='store_true', help='report the indexes used by each query')
+    args = parser.parse_args()
+
+    for collection, changes in ensure_indexes(reconcile=args.reconcile).items():
+        print(f"{collection}: created {changes['created']} dropped {changes['dropped']}", flush=True)
+
+    if args.report:
+        for name, used in index_usage_report().items():
+            print(f"{name}: {', '.join(f'{c}.{i}' for c, i in used) or 'no index (COLLSCAN)'}", flush=True)
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+########################################################################################################################
+# Ingest time derivations
+#
+# Fields that every query would otherwise compute per document are stored on the contract when it is inserted.
+# Documents already in the collection are brought up to date by backend/migrations.py.
+########################################################################################################################
+
+# Formats the TED extracts use for DT_DISPATCH / DT_AWARD, e.g. '22-DEC-17'
+date_formats = ['%d-%b-%y', '%d-%b-%Y', '%d/%m/%Y', '%Y-%m-%d']
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_date(value):
+    """
+    Converts a TED date string into a datetime, dates that are already datetimes are returned as they are
+
+    Expected Output:
+    datetime or None when the value is missing or not in a known format
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(str(value).strip(), date_format)
+        except ValueError:
+            continue
+
+    return None
+
+
+def award_differences(document):
+    """
+    Returns the discrepancies between contract award and execution used by ex9_cpv_bar_diff
+
+    time_difference = 'DT_DISPATCH' - 'DT_AWARD' in milliseconds (as '$subtract' of two dates)
+    value_difference = 'AWARD_VALUE_EURO' - 'VALUE_EURO'
+
+    Expected Output (dict):
+    {'time_difference': int or None, 'value_difference': number or None}
+    """
+    dispatch = parse_date(document.get('DT_DISPATCH'))
+    award = parse_date(document.get('DT_AWARD'))
+    award_value = document.get('AWARD_VALUE_EURO')
+    value = document.get('VALUE_EURO')
+
+    time_difference = None
+    if dispatch is not None and award is not None:
+        time_difference = int((dispatch - award).total_seconds() * 1000)
+
+    value_difference = None
+    if is_number(award_value) and is_number(value):
+        value_difference = award_value - value
+
+    return {'time_difference': time_difference, 'value_difference': value_difference}
+
+
+def cpv_division(cpv):
+    """
+    Returns the CPV Division of a CPV code as the two digit string used by the cpv collection ('cpv_division')
+
+    CPV codes are stored as 8 digit numbers, so leading zeros are lost (03000000 is stored as 3000000) and the
+    division has to be computed numerically rather than by taking the first two characters.
+
+    Expected Output:
+    two digit string or None when the contract has no CPV
+    """
+    if cpv is None:
+        return None
+    if isinstance(cpv, str):
+        return cpv.strip()[:2] or None
+
+    return '%02d' % (int(cpv) // 1000000)
+
+
+def prepare_document(document):
+    """
+    Adds the derived fields to a contract before it is inserted, the document is changed in place and returned
+    """
+    if document.get('CPV') is not None:
+        document['CPV_DIVISION'] = cpv_division(document['CPV'])
+
+    for field in ['DT_DISPATCH', 'DT_AWARD']:
+        if isinstance(document.get(field), str):
+            document[field] = parse_date(document[field]) or document[field]
+
+    document.update(award_differences(document))
+
+    return document
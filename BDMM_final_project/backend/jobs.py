@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+from threading import Event, Lock, Semaphore, Thread
+
+########################################################################################################################
+# In-process registry of background jobs (performance evaluations, uploads, ...)
+#
+# Every run gets its own id, holds the status and timing of each of its queries (or files) and can be cancelled
+# between two of them, so concurrent runs started from different browsers never overwrite each other's progress.
+# The pages keep the id of their run in a dcc.Store and poll get(run_id), nothing is written to disk. The registry
+# lives in the memory of the server process: with several workers the polling requests must reach the worker running
+# the job (single worker or sticky sessions).
+#     BDMM_MAX_RUNNING_JOBS  jobs of each kind running at the same time, the others wait as 'pending' (default 1)
+#     BDMM_KEPT_JOBS         finished jobs kept for polling (default 50)
+########################################################################################################################
+
+max_running = int(os.environ.get('BDMM_MAX_RUNNING_JOBS', '1'))
+max_kept = int(os.environ.get('BDMM_KEPT_JOBS', '50'))
+
+registry = {}
+_lock = Lock()
+_slots = {}
+
+finished_statuses = ('done', 'failed', 'cancelled')
+
+
+class Job:
+    """
+    A run of named queries (or files), status is 'pending', 'running', 'done', 'failed' or 'cancelled'
+
+    The progress is the share of finished queries unless the job reports a finer one with set_progress
+    """
+
+    def __init__(self, kind, queries):
+        self.run_id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'pending'
+        self.message = 'Waiting to start'
+        self.queries = {name: {'status': 'pending', 'seconds': None, 'error': None} for name in queries}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.percent = None
+        self._cancel = Event()
+        self._lock = Lock()
+
+    def start(self):
+        with self._lock:
+            self.status = 'running'
+            self.message = 'Started'
+            self.started_at = time.time()
+
+    def query_started(self, name):
+        with self._lock:
+            self.queries[name]['status'] = 'running'
+            self.message = f"Running {name}"
+
+    def query_finished(self, name, seconds, error=None):
+        with self._lock:
+            self.queries[name].update(status='failed' if error else 'done', seconds=seconds, error=error)
+
+    def set_progress(self, percent, message):
+        with self._lock:
+            self.percent = percent
+            self.message = message
+
+    def finish(self, status, message):
+        with self._lock:
+            self.status = status
+            self.message = message
+            self.finished_at = time.time()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def finished(self):
+        return self.status in finished_statuses
+
+    def progress(self):
+        """
+        Expected Output:
+        (percentage of finished queries (float), message)
+        """
+        with self._lock:
+            done = sum(1 for query in self.queries.values() if query['status'] in ('done', 'failed'))
+            if self.finished():
+                percent = 100
+            elif self.percent is not None:
+                percent = self.percent
+            else:
+                percent = done / len(self.queries) * 100 if self.queries else 0
+
+            return percent, self.message
+
+    def snapshot(self):
+        """
+        Expected Output (dict):
+        {'run_id', 'kind', 'status', 'message', 'progress', 'queries': {name: {'status', 'seconds', 'error'}},
+         'created_at', 'started_at', 'finished_at'}
+        """
+        percent, message = self.progress()
+        with self._lock:
+            return {
+                'run_id': self.run_id,
+                'kind': self.kind,
+                'status': self.status,
+                'message': message,
+                'progress': percent,
+                'queries': {name: dict(query) for name, query in self.queries.items()},
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+def prune():
+    """
+    Forgets the oldest finished jobs beyond max_kept
+    """
+    with _lock:
+        finished = sorted((job for job in registry.values() if job.finished()), key=lambda job: job.finished_at)
+        for job in finished[:max(len(finished) - max_kept, 0)]:
+            del registry[job.run_id]
+
+
+def slots(kind):
+    with _lock:
+        return _slots.setdefault(kind, Semaphore(max_running))
+
+
+def submit(kind, queries, target):
+    """
+    Registers a job and runs target(job) in a background thread once one of the max_running slots of its kind is
+    free (an upload does not wait for a running evaluation), target is expected to call job.start / query_started /
+    query_finished / finish and to stop when job.cancelled()
+
+    Expected Output:
+    the Job
+    """
+    job = Job(kind, queries)
+    with _lock:
+        registry[job.run_id] = job
+
+    def run():
+        with slots(kind):
+            if job.cancelled():
+                job.finish('cancelled', 'Cancelled before starting')
+                return
+            try:
+                target(job)
+                if not job.finished():
+                    job.finish('done', 'Done')
+            except Exception as e:
+                job.finish('failed', f"Error - {e}")
+        prune()
+
+    Thread(target=run, daemon=True).start()
+
+    return job
+
+
+def get(run_id):
+    with _lock:
+        return registry.get(run_id)
+
+
+def cancel(run_id):
+    job = get(run_id)
+    if job is not None:
+        job.cancel()
+
+    return job
@@ -0,0 +1,145 @@
+import json
+import os
+
+########################################################################################################################
+# Incremental parsing of contract files
+#
+# A file is read a chunk at a time and yields its contracts one by one, whether it is a JSON array ([{...}, {...}])
+# or NDJSON (one contract per line), so memory is bounded by the largest contract rather than by the file. Only the
+# standard library is used, the inserts are in backend/streaming.py.
+#     BDMM_INGEST_READ_SIZE     characters read from the file at a time (default 1048576)
+#     BDMM_INGEST_MAX_ELEMENT   characters of the largest element of a JSON array (default 16777216)
+########################################################################################################################
+
+read_size = int(os.environ.get('BDMM_INGEST_READ_SIZE', str(1024 * 1024)))
+max_element_size = int(os.environ.get('BDMM_INGEST_MAX_ELEMENT', str(16 * 1024 * 1024)))
+
+# an error this close to the end of the buffer may be a literal, number or escape cut by the read ('tru', '\u00')
+boundary_margin = 16
+
+number_characters = set('0123456789+-.eE')
+
+
+def first_character(file):
+    """
+    Reads up to the first non blank character of a text file, returning it
+    """
+    while True:
+        character = file.read(1)
+        if not character or not character.isspace():
+            return character
+
+
+def incomplete(error, buffer):
+    """
+    True when a JSONDecodeError is caused by the end of the buffer, i.e. reading more may complete the element, rather
+    than by malformed content
+    """
+    return error.msg.startswith('Unterminated string') or error.pos >= len(buffer) - boundary_margin
+
+
+def cut_number(element, end, buffer):
+    """
+    True when a parsed number may be the beginning of a longer one cut by the read, e.g. 23 of 234 or -5.5 of -5.5e3
+    """
+    return isinstance(element, (int, float)) and not isinstance(element, bool) and \
+        set(buffer[end:]) <= number_characters
+
+
+def iter_json_array(file, read_size=read_size, max_element_size=max_element_size):
+    """
+    Yields the elements of a JSON array one by one, 'file' being positioned right after the opening '['
+
+    A malformed element or separator (missing or doubled ',', trailing ',', missing ']') raises json.JSONDecodeError
+    as soon as it is read, an element longer than max_element_size raises ValueError, so the buffer never grows beyond
+    one element and one read.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    # an element was read, the next character must be ',' or ']'
+    separator = False
+    # a ',' was read, the next character must start an element
+    comma = False
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+
+        if position < len(buffer):
+            character = buffer[position]
+            if separator:
+                if character == ']':
+                    return
+                if character != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+                position += 1
+                separator, comma = False, True
+                continue
+
+            if character == ']' and not comma:
+                return
+            if character in ',]':
+                raise json.JSONDecodeError('Expecting value', buffer, position)
+
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                if eof or not cut_number(element, end, buffer):
+                    yield element
+                    position = end
+                    separator, comma = True, False
+                    continue
+            except json.JSONDecodeError as e:
+                if eof or not incomplete(e, buffer):
+                    raise
+        elif eof:
+            raise json.JSONDecodeError("Expecting ']' at the end of the array", buffer, position)
+
+        # the element is incomplete, keep only what is not parsed yet and read more
+        buffer = buffer[position:]
+        position = 0
+        if len(buffer) > max_element_size:
+            raise ValueError(f"Element larger than {max_element_size} characters")
+        data = file.read(read_size)
+        eof = not data
+        buffer += data
+
+
+def iter_ndjson(file, rejected):
+    """
+    Yields the contract of every line of an NDJSON file, lines that are not valid JSON are appended to 'rejected'
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            rejected.append(f"line {number}: {e}")
+
+
+def iter_contracts(file, rejected):
+    """
+    Yields the contracts of a text file in either format, detected from its first character
+    """
+    character = first_character(file)
+    if character == '[':
+        yield from iter_json_array(file)
+    elif character:
+        yield from iter_ndjson(prepend(character, file), rejected)
+
+
+def prepend(character, file):
+    first_line = character + file.readline()
+    yield first_line
+    yield from file
+
+
+def batches(documents, size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,108 @@
+import os
+import time
+import uuid
+from threading import Lock
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from backend.DB import db
+
+########################################################################################################################
+# Data version of the eu collection
+#
+# A monotonically increasing stamp kept in the metadata collection and bumped after every successful insert, migration
+# (backend/migrations.py) and cube build (backend/cube.py). Cached query results are tagged with the version they were
+# computed on and are only dropped when it moves, so any other write to eu (or to the collections the queries read)
+# made outside of these functions must call bump_data_version() as well, or stale results are served for good.
+#
+# The same document holds a random epoch created with it, i.e. once per database. Versions start at 0 in every
+# database, so the cache keys are prefixed with the epoch (see backend/cache.py): results computed on another database,
+# or on a dropped and recreated one, are never served.
+#     BDMM_VERSION_CHECK_INTERVAL  seconds a version read from the database is reused (default 1)
+########################################################################################################################
+
+metadata_name = 'metadata'
+version_id = 'data_version'
+
+check_interval = float(os.environ.get('BDMM_VERSION_CHECK_INTERVAL', '1'))
+
+_lock = Lock()
+_last_read = (0.0, None, None)
+
+
+def create_epoch():
+    """
+    Adds the epoch (and version 0) to the version document when it does not have one yet, e.g. in a new database
+
+    Expected Output:
+    the version document {'_id', 'version', 'epoch'}
+    """
+    update = [{'$set': {'version': {'$ifNull': ['$version', 0]}, 'epoch': {'$ifNull': ['$epoch', uuid.uuid4().hex]}}}]
+    try:
+        return db[metadata_name].find_one_and_update({'_id': version_id}, update, upsert=True,
+                                                     return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        # upserted at the same time by another process
+        return create_epoch()
+
+
+def remember(document):
+    global _last_read
+
+    with _lock:
+        _last_read = (time.time(), document['version'], document['epoch'])
+
+
+def read_stamp():
+    """
+    Returns the current data version and epoch, read at most once per check_interval seconds
+
+    Expected Output:
+    (version (int), 0 if it was never bumped, epoch (string))
+    """
+    read_at, version, epoch = _last_read
+    if epoch is not None and time.time() - read_at < check_interval:
+        return version, epoch
+
+    document = db[metadata_name].find_one({'_id': version_id})
+    if document is None or 'epoch' not in document:
+        document = create_epoch()
+    remember(document)
+
+    return document['version'], document['epoch']
+
+
+def data_version():
+    """
+    Expected Output:
+    current version (int), 0 if it was never bumped
+    """
+    return read_stamp()[0]
+
+
+def data_epoch():
+    """
+    Expected Output:
+    epoch of the database (string)
+    """
+    return read_stamp()[1]
+
+
+def bump_data_version():
+    """
+    Increments the data version, called once the documents of an insert (or any other write to eu) are stored
+
+    Expected Output:
+    new version (int)
+    """
+
+    document = db[metadata_name].find_one_and_update(
+        {'_id': version_id},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    if 'epoch' not in document:
+        document = create_epoch()
+    remember(document)
+
+    return document['version']
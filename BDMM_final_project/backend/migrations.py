@@ -0,0 +1,91 @@
+from pymongo import UpdateOne
+from backend.DB import db
+from backend import ingest
+from backend import metadata
+from backend.indexes import ensure_indexes
+
+########################################################################################################################
+# One-off migrations bringing documents inserted before a derived field existed up to date
+#
+# Every migration only touches documents that still miss its field, so running them again is cheap and safe:
+#     python -m backend.migrations
+# A migration that updates documents bumps the data version (see backend/metadata.py) so cached results are dropped.
+########################################################################################################################
+
+# Aggregation equivalent of backend.ingest.cpv_division
+cpv_division_expression = {
+    '$cond': [
+        {'$eq': [{'$type': '$CPV'}, 'string']},
+        {'$substrCP': ['$CPV', 0, 2]},
+        {'$substrCP': [{'$toString': {'$add': [100, {'$toLong': {'$floor': {'$divide': ['$CPV', 1000000]}}}]}}, 1, 2]}
+    ]
+}
+
+
+def backfill_cpv_division():
+    """
+    Stores 'CPV_DIVISION' on every contract with a CPV code and makes sure the indexes of eu (including the
+    (YEAR, ISO_COUNTRY_CODE, CPV_DIVISION) index the CPV queries filter and group on) exist
+
+    Expected Output:
+    number of updated documents (int)
+    """
+
+    result = db.eu.update_many(
+        {'CPV_DIVISION': {'$exists': False}, 'CPV': {'$ne': None}},
+        [{'$set': {'CPV_DIVISION': cpv_division_expression}}]
+    )
+    ensure_indexes(['eu'])
+    if result.modified_count:
+        metadata.bump_data_version()
+
+    return result.modified_count
+
+
+def backfill_award_differences(batch_size=1000):
+    """
+    Converts 'DT_DISPATCH' / 'DT_AWARD' strings into dates and stores 'time_difference' and 'value_difference' on every
+    contract that does not have them yet
+
+    The TED date format ('22-DEC-17') is parsed in Python (see backend.ingest.parse_date) and written back in batches.
+
+    Expected Output:
+    number of updated documents (int)
+    """
+
+    fields = {'DT_DISPATCH': True, 'DT_AWARD': True, 'AWARD_VALUE_EURO': True, 'VALUE_EURO': True}
+    cursor = db.eu.find({'time_difference': {'$exists': False}}, fields, batch_size=batch_size)
+
+    updated = 0
+    operations = []
+    for document in cursor:
+        update = ingest.award_differences(document)
+        for field in ['DT_DISPATCH', 'DT_AWARD']:
+            if isinstance(document.get(field), str) and ingest.parse_date(document[field]):
+                update[field] = ingest.parse_date(document[field])
+        operations.append(UpdateOne({'_id': document['_id']}, {'$set': update}))
+
+        if len(operations) == batch_size:
+            updated += db.eu.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        updated += db.eu.bulk_write(operations, ordered=False).modified_count
+
+    if updated:
+        metadata.bump_data_version()
+
+    return updated
+
+
+migrations = [backfill_cpv_division, backfill_award_differences]
+
+
+def run_migrations():
+    for migration in migrations:
+        print(f"Running {migration.__name__}", flush=True)
+        print(f"Finished {migration.__name__}: {migration()} documents updated", flush=True)
+
+
+if __name__ == '__main__':
+    run_migrations()
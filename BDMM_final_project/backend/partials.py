@@ -0,0 +1,218 @@
+from backend.DB import db
+from backend import cache
+from backend import cube
+from backend import dimensions
+
+########################################################################################################################
+# Per-year partial aggregates composing arbitrary year ranges
+#
+# Sums and counts are decomposable, so the CPV and Country group by queries can be answered by merging the cube cells
+# (see backend/cube.py) of each year in the range. The cells of a year (every country, CPV division and B_EU_FUNDS)
+# are kept in the result cache under the current data version, a request only fetches the years that are missing
+# and the country subset is applied in Python. Dragging the year slider therefore rarely touches the database.
+#
+# The functions mirror the ones in backend/cube.py and return the same output as the matching query functions.
+########################################################################################################################
+
+
+def year_key(year):
+    return f'partials:{year}'
+
+
+def fetch_cells(years):
+    """
+    Reads the cells of the given years from the cube when it is built, otherwise aggregates them from eu
+
+    Expected Output (dict):
+    {year: [(ISO_COUNTRY_CODE, CPV_DIVISION, B_EU_FUNDS, count, value_sum, value_count, offers_sum, offers_count), ....]}
+    """
+
+    filter_ = {'$match': {'YEAR': {'$in': years}}}
+
+    if cube.cube_name in db.list_collection_names():
+        documents = db[cube.cube_name].aggregate([filter_])
+    else:
+        documents = db.eu.aggregate([filter_] + cube.cell_pipeline(), allowDiskUse=True)
+
+    cells = {year: [] for year in years}
+    for document in documents:
+        cells.setdefault(document['YEAR'], []).append(
+            (document.get('ISO_COUNTRY_CODE'), document.get('CPV_DIVISION'), document.get('B_EU_FUNDS')) +
+            tuple(document[measure] for measure in cube.measures)
+        )
+
+    return cells
+
+
+def year_cells(bot_year, top_year, country_list):
+    """
+    Returns the cells of the year range restricted to country_list, fetching only the years that are not cached
+    """
+
+    cells, missing = [], []
+    for year in range(bot_year, top_year + 1):
+        status, year_cells_ = cache.query_cache.get(year_key(year))
+        if status == 'hit':
+            cells.extend(year_cells_)
+        else:
+            missing.append(year)
+
+    if missing:
+        version = cache.query_cache.version()
+        for year, year_cells_ in fetch_cells(missing).items():
+            cache.query_cache.set(year_key(year), year_cells_, version)
+            cells.extend(year_cells_)
+
+    countries = set(country_list)
+
+    return [cell for cell in cells if cell[0] in countries]
+
+
+def rollup(cells, key):
+    """
+    Sums the measures of the cells sharing the same key, key is a function of a cell
+
+    Expected Output (dict):
+    {key: [count, value_sum, value_count, offers_sum, offers_count], ....}
+    """
+
+    groups = {}
+    for cell in cells:
+        group = groups.setdefault(key(cell), [0, 0, 0, 0, 0])
+        for position, measure in enumerate(cell[3:]):
+            group[position] += measure
+
+    return groups
+
+
+def average(total, count):
+    return total / count if count else None
+
+
+def mean(values):
+    values = [value for value in values if value is not None]
+
+    return sum(values) / len(values) if values else None
+
+
+def sort_by_avg(documents, order):
+    """
+    Sorts like {'$sort': {'avg': order}}, where null values come first in ascending order
+    """
+    return sorted(documents, key=lambda document: (document['avg'] is not None, document['avg'] or 0),
+                  reverse=order == -1)
+
+
+def box(bot_year, top_year, country_list, group_field):
+    """
+    Partial aggregates version of the five box metrics, grouped by 'group_field' (CPV_DIVISION or ISO_COUNTRY_CODE)
+
+    Expected Output:
+    (euro_avg, count, offer_avg, euro_avg_y_eu, euro_avg_n_eu)
+    """
+
+    position = 0 if group_field == 'ISO_COUNTRY_CODE' else 1
+    cells = year_cells(bot_year, top_year, country_list)
+
+    groups = rollup(cells, lambda cell: cell[position])
+    groups_y_eu = rollup([cell for cell in cells if cell[2] == 'Y'], lambda cell: cell[position])
+    groups_n_eu = rollup([cell for cell in cells if cell[2] == 'N'], lambda cell: cell[position])
+
+    euro_avg = mean(average(group[1], group[2]) for group in groups.values())
+    count = mean(group[0] for group in groups.values())
+    offer_avg = mean(average(group[3], group[4]) for group in groups.values())
+    euro_avg_y_eu = mean(average(group[1], group[2]) for group in groups_y_eu.values())
+    euro_avg_n_eu = mean(average(group[1], group[2]) for group in groups_n_eu.values())
+
+    return int(euro_avg), int(count), int(offer_avg), int(euro_avg_y_eu), int(euro_avg_n_eu)
+
+
+def cpv_treemap(bot_year, top_year, country_list):
+    """
+    Partial aggregates version of ex2_cpv_treemap
+
+    Expected Output (list of documents):
+    [{cpv: value_1, count: value_2}, ....]
+    """
+
+    groups = rollup(year_cells(bot_year, top_year, country_list), lambda cell: cell[1])
+
+    return dimensions.join_cpv([{'_id': cpv, 'count': group[0]} for cpv, group in groups.items()])
+
+
+def cpv_bar(bot_year, top_year, country_list, order, eu_funds=None):
+    """
+    Partial aggregates version of ex3_cpv_bar_1 to ex6_cpv_bar_4, 'order' is 1 for the lowest and -1 for the highest
+    5 divisions and 'eu_funds' optionally restricts 'B_EU_FUNDS'
+
+    Expected Output (list of 5 sorted documents):
+    [{cpv: value_1, avg: value_2}, ....]
+    """
+
+    cells = [cell for cell in year_cells(bot_year, top_year, country_list) if not eu_funds or cell[2] == eu_funds]
+    groups = rollup(cells, lambda cell: cell[1])
+
+    documents = [{'_id': cpv, 'avg': average(group[1], group[2])} for cpv, group in groups.items()]
+
+    return dimensions.join_cpv(sort_by_avg(documents, order)[:5])
+
+
+def cpv_map(bot_year, top_year, country_list):
+    """
+    Partial aggregates version of ex7_cpv_map
+
+    Expected Output (list of documents):
+    [{cpv: value_1, avg: value_2, country: value_3}, ....]
+    """
+
+    cells = [cell for cell in year_cells(bot_year, top_year, country_list) if cell[1] is not None]
+    groups = rollup(cells, lambda cell: (cell[0], cell[1]))
+
+    best = {}
+    for (country, cpv), group in groups.items():
+        best.setdefault(country, []).append({'_id': country, 'avg': average(group[1], group[2]), 'cpv': cpv})
+
+    return dimensions.join_country([sort_by_avg(documents, -1)[0] for documents in best.values()])
+
+
+def country_treemap(bot_year, top_year, country_list):
+    """
+    Partial aggregates version of ex11_country_treemap
+
+    Expected Output (list of documents):
+    [{country: value_1, count: value_2}, ....]
+    """
+
+    groups = rollup(year_cells(bot_year, top_year, country_list), lambda cell: cell[0])
+
+    return dimensions.join_country([{'_id': country, 'count': group[0]} for country, group in groups.items()])
+
+
+def country_bar(bot_year, top_year, country_list, order):
+    """
+    Partial aggregates version of ex12_country_bar_1 and ex13_country_bar_2, 'order' is 1 for the lowest and -1 for
+    the highest 5 countries
+
+    Expected Output (list of 5 sorted documents):
+    [{country: value_1, avg: value_2}, ....]
+    """
+
+    groups = rollup(year_cells(bot_year, top_year, country_list), lambda cell: cell[0])
+
+    documents = [{'_id': country, 'avg': average(group[1], group[2])} for country, group in groups.items()]
+
+    return dimensions.join_country(sort_by_avg(documents, order)[:5])
+
+
+def country_map(bot_year, top_year, country_list):
+    """
+    Partial aggregates version of ex14_country_map
+
+    Expected Output (list of documents):
+    [{sum: value_1, country: value_2}, ....]
+    """
+
+    cells = [cell for cell in year_cells(bot_year, top_year, country_list) if cell[2] == 'Y']
+    groups = rollup(cells, lambda cell: cell[0])
+
+    return dimensions.join_country([{'_id': country, 'sum': group[1]} for country, group in groups.items()])
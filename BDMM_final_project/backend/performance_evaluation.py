@@ -1,42 +1,265 @@
 import backend.DB as DB
 import json
+from backend import explain as explain_
+from backend import jobs
+import statistics
+from backend.queries import countries
 from backend.queries import query_list
-from backend.queries import insert_operation
 import time
 
 def get_collection_count():
     return DB.eu.count()
 
+def get_database_status():
+    ok, error = DB.ping()
+    return "" if ok else f"Database unavailable: {error}"
+
 def get_collection_stats():
     stats = DB.db.command("collstats", "eu")
     return {k: stats[k] for k in ('count', 'nindexes', 'size')} 
 
-def insert_json(json_obj):
-    start = time.process_time()
-    json_decode = json.loads(json_obj)
-    inserted = insert_operation(json_decode)
-    time_elapsed = time.process_time() - start
-    return (inserted, time_elapsed)
-
-def performance_evaluation():
+def performance_evaluation(job=None):
+    """
+    Runs every query of query_list once, reporting progress and timings to 'job' (see backend/jobs.py)
+    """
+    job = job or jobs.Job('evaluation', [fn.__name__ for fn in query_list])
+    job.start()
     start_time = time.time()
     print("Started performance evaluation", flush=True)
     print("", flush=True)
     for num, fn in enumerate(query_list):
-        with open(".query.state", 'w+') as file:
-            percent = (num / len(query_list)) * 100 
-            file.write(f"{str(percent)}: Running {fn.__name__}")
+        if job.cancelled():
+            job.finish('cancelled', f"Cancelled after {num} of {len(query_list)} queries")
+            return job
+        job.query_started(fn.__name__)
         query_start = time.time()
         try:
-            fn()
-        except:
-            with open(".query.state", 'w+') as file:
-                file.write(f"100:Error - Query {fn.__name__} failed")
-            return
+            # bypass the result cache, the evaluation measures the queries themselves
+            getattr(fn, '__wrapped__', fn)()
+        except Exception as e:
+            job.query_finished(fn.__name__, time.time() - query_start, error=str(e))
+            job.finish('failed', f"Error - Query {fn.__name__} failed")
+            return job
+        job.query_finished(fn.__name__, time.time() - query_start)
         print(f"Finished iteration {num+1} of {len(query_list)} (time elapsed {(time.time() - query_start):.1f}s) func: {fn.__name__} ", flush=True)
     print("Finished performance evaluation", flush=True)
     print("", flush=True)
 
     time_elapsed = (time.time() - start_time)
-    with open(".query.state", 'w+') as file:
-        file.write(f"100:Done - Time elapsed {time_elapsed:.3f} seconds")
+    job.finish('done', f"Done - Time elapsed {time_elapsed:.3f} seconds")
+
+    return job
+
+
+def start_performance_evaluation():
+    """
+    Starts performance_evaluation as a background job
+
+    Expected Output:
+    the run id of the job
+    """
+    return jobs.submit('evaluation', [fn.__name__ for fn in query_list], performance_evaluation).run_id
+
+
+########################################################################################################################
+# Benchmark mode
+#
+# Runs each query 'warmup' times without measuring (connection pool, server caches) and then 'iterations' times,
+# bypassing the result cache, and reports the latency distribution and the size of the result of each query. The
+# summary is printed and, with 'output', written as JSON so that two runs (e.g. before and after an index change)
+# can be compared.
+########################################################################################################################
+
+
+def percentile(values, p):
+    """
+    p-th percentile (0 to 100) of the values, interpolated between the closest ranks
+    """
+    values = sorted(values)
+    position = (len(values) - 1) * p / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def latency_stats(timings):
+    """
+    Expected Output (dict, seconds):
+    {'min': float, 'median': float, 'mean': float, 'p95': float, 'p99': float, 'max': float}
+    """
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+        'max': max(timings),
+    }
+
+
+def result_size(result):
+    """
+    Expected Output (dict):
+    {'documents': number of documents (or values) returned, 'bytes': size of the result as JSON}
+    """
+    return {
+        'documents': len(result) if isinstance(result, (list, tuple)) else 1,
+        'bytes': len(json.dumps(result, default=str)),
+    }
+
+
+def benchmark_query(fn, args=(), kwargs=None, warmup=1, iterations=10, explain=False, scan_ratio=explain_.scan_ratio):
+    """
+    Benchmarks one query function with the given arguments, with 'explain' its pipeline is explained as well
+
+    Expected Output (dict):
+    {'query': name, 'args': [..], 'kwargs': {..}, 'iterations': int, 'timings': [seconds, ....],
+     'latency': latency_stats, 'result': result_size, 'explain': explain.explain_query summary or None}
+    """
+    if iterations < 1:
+        raise ValueError(f"iterations must be at least 1, got {iterations}")
+    kwargs = kwargs or {}
+    # bypass the result cache, the benchmark measures the queries themselves
+    query = getattr(fn, '__wrapped__', fn)
+
+    for _ in range(warmup):
+        query(*args, **kwargs)
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = query(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    size = result_size(result)
+
+    return {
+        'query': fn.__name__,
+        'args': list(args),
+        'kwargs': kwargs,
+        'iterations': iterations,
+        'timings': timings,
+        'latency': latency_stats(timings),
+        'result': size,
+        'explain': explain_.explain_query(fn, args, kwargs, size['documents'], scan_ratio) if explain else None,
+    }
+
+
+def print_summary(results):
+    print(f"{'query':<28}{'min':>9}{'median':>9}{'p95':>9}{'p99':>9}{'max':>9}{'docs':>8}{'bytes':>10}", flush=True)
+    for result in results:
+        latency, size = result['latency'], result['result']
+        print(f"{result['query']:<28}" +
+              ''.join(f"{latency[stat]:>9.3f}" for stat in ('min', 'median', 'p95', 'p99', 'max')) +
+              f"{size['documents']:>8}{size['bytes']:>10}", flush=True)
+
+    for result in results:
+        if result.get('explain'):
+            print(f"{result['query']:<28}{explain_.describe(result['explain'])}", flush=True)
+
+
+def benchmark(functions=None, warmup=1, iterations=10, output=None, explain=False, scan_ratio=explain_.scan_ratio):
+    """
+    Benchmarks every function of query_list (or 'functions') with its default arguments, with 'explain' the plan,
+    indexes, examined keys / documents and disk spills of each pipeline are captured next to the timings and the
+    pipelines examining more than 'scan_ratio' times the documents they return are flagged
+
+    Expected Output (dict, also written as JSON to 'output' when given):
+    {'started_at': epoch seconds, 'warmup': int, 'iterations': int, 'queries': [benchmark_query results, ....]}
+    """
+    report = {'started_at': time.time(), 'warmup': warmup, 'iterations': iterations, 'scan_ratio': scan_ratio,
+              'queries': []}
+
+    for fn in functions or query_list:
+        report['queries'].append(benchmark_query(fn, warmup=warmup, iterations=iterations,
+                                                 explain=explain, scan_ratio=scan_ratio))
+
+    print_summary(report['queries'])
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2, default=str)
+
+    return report
+
+
+########################################################################################################################
+# Parameter sweep
+#
+# Query cost depends on how many contracts the year range and country selection match, so the sweep benchmarks
+# every query over a grid of year ranges x country subsets and reports latency against the matched document count
+# (the contracts of eu passing the common YEAR / ISO_COUNTRY_CODE filter). A spec is a dict of the two axes:
+#     {'years': [(bot_year, top_year), ....], 'countries': [[code, ....], ....]}
+########################################################################################################################
+
+
+def single_years(bot_year=2008, top_year=2020):
+    return [(year, year) for year in range(bot_year, top_year + 1)]
+
+
+def sliding_windows(bot_year=2008, top_year=2020, width=4, step=4):
+    return [(year, min(year + width - 1, top_year)) for year in range(bot_year, top_year + 1, step)]
+
+
+default_sweep = {
+    'years': [(2008, 2008), (2014, 2014), (2020, 2020)] + sliding_windows() + [(2008, 2020)],
+    'countries': [['PT'], ['PT', 'ES', 'FR', 'DE', 'IT'], countries],
+}
+
+
+def matched_documents(bot_year, top_year, country_list):
+    return DB.eu.count_documents({'YEAR': {'$gte': bot_year, '$lte': top_year}, 'ISO_COUNTRY_CODE': {'$in': country_list}})
+
+
+def latency_slope(points):
+    """
+    Least squares slope of the median latency over the matched documents, in seconds per million documents
+    """
+    xs = [point['matched'] / 1e6 for point in points]
+    ys = [point['latency']['median'] for point in points]
+    mean_x, mean_y = statistics.mean(xs), statistics.mean(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance if variance else None
+
+
+def sweep(spec=None, functions=None, warmup=1, iterations=5, output=None):
+    """
+    Benchmarks every function of query_list (or 'functions') on every point of the spec grid
+
+    Expected Output (dict, also written as JSON to 'output' when given):
+    {'spec': spec, 'warmup': int, 'iterations': int,
+     'queries': {name: {'points': [{'bot_year', 'top_year', 'countries', 'matched', 'latency', 'result'}, ....]
+                        (sorted by matched), 'seconds_per_million': float}, ....}}
+    """
+    spec = spec or default_sweep
+    grid = [(bot_year, top_year, list(country_list))
+            for bot_year, top_year in spec['years'] for country_list in spec['countries']]
+    matched = {(bot_year, top_year, tuple(country_list)): matched_documents(bot_year, top_year, country_list)
+               for bot_year, top_year, country_list in grid}
+
+    report = {'spec': spec, 'warmup': warmup, 'iterations': iterations, 'queries': {}}
+    for fn in functions or query_list:
+        points = []
+        for bot_year, top_year, country_list in grid:
+            result = benchmark_query(fn, (bot_year, top_year, country_list), warmup=warmup, iterations=iterations)
+            points.append({
+                'bot_year': bot_year,
+                'top_year': top_year,
+                'countries': country_list,
+                'matched': matched[(bot_year, top_year, tuple(country_list))],
+                'latency': result['latency'],
+                'result': result['result'],
+            })
+        points.sort(key=lambda point: point['matched'])
+
+        report['queries'][fn.__name__] = {'points': points, 'seconds_per_million': latency_slope(points)}
+        print(f"{fn.__name__:<28} median {points[0]['latency']['median']:.3f}s at {points[0]['matched']} docs, "
+              f"{points[-1]['latency']['median']:.3f}s at {points[-1]['matched']} docs", flush=True)
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2, default=str)
+
+    return report
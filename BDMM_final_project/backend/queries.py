@@ -1,13 +1,30 @@
+import os
+import re
 import pandas as pd
 from pymongo import MongoClient
 from backend.DB import eu
 from backend.DB import db
+from backend import cache
+from backend import cube
+from backend import dimensions
+from backend import ingest
+from backend import metadata
+from backend import partials
 
 ########################################################################################################################
 countries = ['NO', 'HR', 'HU', 'CH', 'CZ', 'RO', 'LV', 'GR', 'UK', 'SI', 'LT',
              'ES', 'FR', 'IE', 'SE', 'NL', 'PT', 'PL', 'DK', 'MK', 'DE', 'IT',
              'BG', 'CY', 'AT', 'LU', 'BE', 'FI', 'EE', 'SK', 'MT', 'LI', 'IS']
 
+# Answer the CPV and Country group by queries from the pre-aggregated cube (see backend/cube.py) or from the cached
+# per-year partial aggregates (see backend/partials.py) instead of eu
+use_cube = os.environ.get('BDMM_USE_CUBE', '0') == '1'
+use_partials = os.environ.get('BDMM_USE_PARTIALS', '0') == '1'
+rollup = partials if use_partials else cube if use_cube else None
+
+# Incremental maintenance of the pre-aggregated collections, each called with the documents of every insert
+rollup_maintainers = [cube.increment_cube]
+
 
 def ex0_cpv_example(bot_year=2008, top_year=2020):
     """
@@ -37,176 +54,144 @@ def ex0_cpv_example(bot_year=2008, top_year=2020):
     return list_documents
 
 
-def ex1_cpv_box(bot_year=2008, top_year=2020, country_list=countries):
+def cpv_range(code):
     """
-    Returns five metrics, described below
-    Result filterable by floor year, roof year and country_list
+    Compiles a CPV code prefix (division '50', group '503', class '5031', ...) into a numeric range over the 8 digit
+    'CPV' so that the filter can be answered by an index instead of comparing a substring of every document
 
     Expected Output:
-    (avg_cpv_euro_avg, avg_cpv_count, avg_cpv_offer_avg, avg_cpv_euro_avg_y_eu, avg_cpv_euro_avg_n_eu)
+    {'$gte': low, '$lt': high}, for '50' -> {'$gte': 50000000, '$lt': 51000000}
+    """
+    width = 10 ** (8 - len(code))
 
-    Where:
-    avg_cpv_euro_avg = average value of each CPV's division contracts average 'EURO_VALUE', (int)
-    avg_cpv_count = average value of each CPV's division contract count, (int)
-    avg_cpv_offer_avg = average value of each CPV's division contracts average NUMBER_OFFERS', (int)
-    avg_cpv_euro_avg_y_eu = average value of each CPV's division contracts average EURO_VALUE' with 'B_EU_FUNDS', (int)
-    avg_cpv_euro_avg_n_eu = average value of each CPV's division contracts average 'EURO_VALUE' with out 'B_EU_FUNDS' (int)
+    return {'$gte': int(code) * width, '$lt': (int(code) + 1) * width}
+
+
+def cpv_prefix(code):
     """
+    Clauses matching a CPV code prefix whether 'CPV' is stored as a number (see cpv_range) or as a string (anchored
+    regex, answered by the same index), to be used as the '$or' of a '$match'
 
-    filter_ = {
-        '$match': {
-            '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}, {'ISO_COUNTRY_CODE': {'$in': country_list}}]
-        }}
+    Expected Output:
+    [{'CPV': {'$gte': low, '$lt': high}}, {'CPV': {'$regex': '^code'}}]
+    """
+    return [{'CPV': cpv_range(code)}, {'CPV': {'$regex': '^' + re.escape(code)}}]
 
-    avg_cpv_euro_avg = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'CPV': { "$substr": [ "$CPV", 0, 2 ] }
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-    
-    avg_cpv_count = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'CPV': { "$substr": [ "$CPV", 0, 2 ] }
-                    },
-                    'SUM':{'$sum':1}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$SUM'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
 
-    avg_cpv_offer_avg = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'CPV': { "$substr": [ "$CPV", 0, 2 ] }
-                    },
-                    'AVG':{'$avg':'$NUMBER_OFFERS'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
+def plan(pipeline, finish=None, **options):
+    """
+    Describes an aggregation on eu without running it, so that the same pipelines can be run by run() below, by the
+    async variant of the queries (see backend/async_queries.py) or only explained
 
+    'finish' is applied to the list of returned documents, e.g. the dimension joins, and 'options' are passed to
+    aggregate, e.g. allowDiskUse=True
 
-    avg_cpv_euro_avg_y_eu = int(list(
-        db.eu.aggregate([filter_,
-        {
-            '$match':{
-            '$and': [{'B_EU_FUNDS':'Y'}]
-            }
-            
-        },
-            {
-                '$group':{
-                    '_id':{
-                        'CPV': { "$substr": [ "$CPV", 0, 2 ] }
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
+    Expected Output (dict):
+    {'pipeline': [stages], 'finish': function or None, 'options': {aggregate options}}
+    """
+    return {'pipeline': pipeline, 'finish': finish, 'options': options}
 
 
+def finish(plan_, documents):
+    return plan_['finish'](documents) if plan_['finish'] else documents
 
-    
-    avg_cpv_euro_avg_n_eu = int(list(
-        db.eu.aggregate([filter_,
-        {
-            '$match':{
-            '$and': [{'B_EU_FUNDS':'N'}]
-            }
-            
-        },
-            {
-                '$group':{
-                    '_id':{
-                        'CPV': { "$substr": [ "$CPV", 0, 2 ] }
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
 
-    return avg_cpv_euro_avg, avg_cpv_count, avg_cpv_offer_avg, avg_cpv_euro_avg_y_eu, avg_cpv_euro_avg_n_eu
+def run(plan_):
+    """
+    Runs a plan on eu and returns the finished documents
+    """
+    return finish(plan_, list(db.eu.aggregate(plan_['pipeline'], **plan_['options'])))
 
 
-def ex2_cpv_treemap(bot_year=2008, top_year=2020, country_list=countries):
+def box_plan(filter_, group_id):
     """
-    Returns the count of contracts for each CPV Division
+    Plan computing the five box metrics of a dashboard page in a single aggregation
+
+    Each contract is grouped once by 'group_id' carrying every accumulator the boxes need, the EU funds split is
+    done with '$cond' so that groups without 'Y' (or 'N') contracts are ignored by '$avg' exactly as a separate
+    '$match' would. The per group values are then averaged in a final '$group'.
+
+    Expected Output (once run):
+    (euro_avg, count, offer_avg, euro_avg_y_eu, euro_avg_n_eu)
+    """
+
+    groupby_key = {
+        '$group':{
+            '_id': group_id,
+            'AVG': {'$avg': '$VALUE_EURO'},
+            'SUM': {'$sum': 1},
+            'OFFER_AVG': {'$avg': '$NUMBER_OFFERS'},
+            'AVG_Y_EU': {'$avg': {'$cond': [{'$eq': ['$B_EU_FUNDS', 'Y']}, '$VALUE_EURO', None]}},
+            'AVG_N_EU': {'$avg': {'$cond': [{'$eq': ['$B_EU_FUNDS', 'N']}, '$VALUE_EURO', None]}}
+        }
+    }
+
+    groupby_all = {
+        '$group':{
+            '_id': None,
+            'euro_avg': {'$avg': '$AVG'},
+            'count': {'$avg': '$SUM'},
+            'offer_avg': {'$avg': '$OFFER_AVG'},
+            'euro_avg_y_eu': {'$avg': '$AVG_Y_EU'},
+            'euro_avg_n_eu': {'$avg': '$AVG_N_EU'}
+        }
+    }
+
+    pipeline = [filter_, groupby_key, groupby_all]
+
+    return plan(pipeline, box_values)
+
+
+def box_values(documents):
+    document = documents[0]
+
+    return int(document['euro_avg']), int(document['count']), int(document['offer_avg']), \
+           int(document['euro_avg_y_eu']), int(document['euro_avg_n_eu'])
+
+
+def ex1_cpv_box_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex1_cpv_box, see plan()
+    """
+    filter_ = {
+        '$match': {
+            '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}, {'ISO_COUNTRY_CODE': {'$in': country_list}}]
+        }}
+
+    return box_plan(filter_, {'CPV': '$CPV_DIVISION'})
+
+
+@cache.memoize
+def ex1_cpv_box(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Returns five metrics, described below
     Result filterable by floor year, roof year and country_list
 
-    Expected Output (list of documents):
-    [{cpv: value_1, count: value_2}, ....]
+    Expected Output:
+    (avg_cpv_euro_avg, avg_cpv_count, avg_cpv_offer_avg, avg_cpv_euro_avg_y_eu, avg_cpv_euro_avg_n_eu)
 
     Where:
-    value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
-    value_2 = contract count of each CPV Division, (int)
+    avg_cpv_euro_avg = average value of each CPV's division contracts average 'EURO_VALUE', (int)
+    avg_cpv_count = average value of each CPV's division contract count, (int)
+    avg_cpv_offer_avg = average value of each CPV's division contracts average NUMBER_OFFERS', (int)
+    avg_cpv_euro_avg_y_eu = average value of each CPV's division contracts average EURO_VALUE' with 'B_EU_FUNDS', (int)
+    avg_cpv_euro_avg_n_eu = average value of each CPV's division contracts average 'EURO_VALUE' with out 'B_EU_FUNDS' (int)
+    """
+    if rollup:
+        return rollup.box(bot_year, top_year, country_list, 'CPV_DIVISION')
+
+    return run(ex1_cpv_box_plan(bot_year, top_year, country_list))
+
+
+def ex2_cpv_treemap_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex2_cpv_treemap, see plan()
     """
-    
     filter_ = {
         '$match': {
             '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}, {'ISO_COUNTRY_CODE': {'$in': country_list}}]
         }}
     
-    projection = {
-        '$project':{
-            '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]}
-        }
-    }
-
     groupby_cpv_count = {
         '$group':{
             '_id': '$CPV_DIVISION',
@@ -214,47 +199,33 @@ def ex2_cpv_treemap(bot_year=2008, top_year=2020, country_list=countries):
         }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'cpv',
-            'foreignField': 'cpv_division',
-            'localField': '_id',
-            'as': 'CPV'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id' : False,
-            'cpv':{ '$arrayElemAt': ['$CPV', 0]},
-            'count':'$count'
-        }
-    }
-
-    projection3 = {
-        '$project': {
-            'cpv': '$cpv.cpv_division_description',
-            'count': True
-        }
-    }
-    pipeline = [filter_, projection, groupby_cpv_count, lookup, projection2, projection3]
+    pipeline = [filter_, groupby_cpv_count]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-    
-    return list_documents
+    return plan(pipeline, dimensions.join_cpv)
 
 
-def ex3_cpv_bar_1(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex2_cpv_treemap(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Per CPV Division and get the average 'EURO_VALUE' return the highest 5 cpvs
+    Returns the count of contracts for each CPV Division
     Result filterable by floor year, roof year and country_list
 
-    Expected Output (list of 5 sorted documents):
-    [{cpv: value_1, avg: value_2}, ....]
+    Expected Output (list of documents):
+    [{cpv: value_1, count: value_2}, ....]
 
     Where:
     value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
-    value_2 = average 'EURO_VALUE' of each CPV Division, (float)
+    value_2 = contract count of each CPV Division, (int)
+    """
+    if rollup:
+        return rollup.cpv_treemap(bot_year, top_year, country_list)
+
+    return run(ex2_cpv_treemap_plan(bot_year, top_year, country_list))
+
+
+def ex3_cpv_bar_1_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex3_cpv_bar_1, see plan()
     """
     filter_ = {
                 '$match': {
@@ -263,42 +234,10 @@ def ex3_cpv_bar_1(bot_year=2008, top_year=2020, country_list=countries):
                 }
     }
 
-    projection = {
-        '$project':{
-            '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]},
-            'VALUE_EURO': '$VALUE_EURO'
-        }
-    }
-
     groupby_cpv_count = {
         '$group':{
             '_id': '$CPV_DIVISION',
-            'average': {'$avg' : '$VALUE_EURO'}
-        }
-    }
-
-    lookup = {
-        '$lookup': {
-            'from': 'cpv',
-            'foreignField': 'cpv_division',
-            'localField': '_id',
-            'as': 'CPV'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id' : False,
-            'cpv':{ '$arrayElemAt': ['$CPV', 0]},
-            'avg':'$average'
-        }
-    }
-
-    projection3 = {
-        '$project': {
-            'cpv': '$cpv.cpv_division_description',
-            'avg': True
+            'avg': {'$avg' : '$VALUE_EURO'}
         }
     }
 
@@ -311,16 +250,15 @@ def ex3_cpv_bar_1(bot_year=2008, top_year=2020, country_list=countries):
         '$limit':5
         }
     
-    pipeline = [filter_, projection, groupby_cpv_count, lookup, projection2, projection3, sort, limit]
+    pipeline = [filter_, groupby_cpv_count, sort, limit]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-    
-    return list_documents
+    return plan(pipeline, dimensions.join_cpv)
 
 
-def ex4_cpv_bar_2(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex3_cpv_bar_1(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Per CPV Division and get the average 'EURO_VALUE' return the lowest 5 cpvs
+    Per CPV Division and get the average 'EURO_VALUE' return the highest 5 cpvs
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of 5 sorted documents):
@@ -330,6 +268,16 @@ def ex4_cpv_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
     value_2 = average 'EURO_VALUE' of each CPV Division, (float)
     """
+    if rollup:
+        return rollup.cpv_bar(bot_year, top_year, country_list, -1)
+
+    return run(ex3_cpv_bar_1_plan(bot_year, top_year, country_list))
+
+
+def ex4_cpv_bar_2_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex4_cpv_bar_2, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -337,42 +285,10 @@ def ex4_cpv_bar_2(bot_year=2008, top_year=2020, country_list=countries):
                 }
     }
 
-    projection = {
-        '$project':{
-            '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]},
-            'VALUE_EURO': '$VALUE_EURO'
-        }
-    }
-
     groupby_cpv_count = {
         '$group':{
             '_id': '$CPV_DIVISION',
-            'average': {'$avg' : '$VALUE_EURO'}
-        }
-    }
-
-    lookup = {
-        '$lookup': {
-            'from': 'cpv',
-            'foreignField': 'cpv_division',
-            'localField': '_id',
-            'as': 'CPV'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id' : False,
-            'cpv':{ '$arrayElemAt': ['$CPV', 0]},
-            'avg':'$average'
-        }
-    }
-
-    projection3 = {
-        '$project': {
-            'cpv': '$cpv.cpv_division_description',
-            'avg': True
+            'avg': {'$avg' : '$VALUE_EURO'}
         }
     }
 
@@ -385,16 +301,15 @@ def ex4_cpv_bar_2(bot_year=2008, top_year=2020, country_list=countries):
         '$limit':5
         }
     
-    pipeline = [filter_, projection, groupby_cpv_count, lookup, projection2, projection3, sort, limit]
-
-    list_documents = list(db.eu.aggregate(pipeline))
+    pipeline = [filter_, groupby_cpv_count, sort, limit]
 
-    return list_documents
+    return plan(pipeline, dimensions.join_cpv)
 
 
-def ex5_cpv_bar_3(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex4_cpv_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Per CPV Division and get the average 'EURO_VALUE' return the highest 5 cpvs for contracts which recieved european funds ('B_EU_FUNDS') 
+    Per CPV Division and get the average 'EURO_VALUE' return the lowest 5 cpvs
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of 5 sorted documents):
@@ -404,6 +319,16 @@ def ex5_cpv_bar_3(bot_year=2008, top_year=2020, country_list=countries):
     value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
     value_2 = average 'EURO_VALUE' of each CPV Division, (float)
     """
+    if rollup:
+        return rollup.cpv_bar(bot_year, top_year, country_list, 1)
+
+    return run(ex4_cpv_bar_2_plan(bot_year, top_year, country_list))
+
+
+def ex5_cpv_bar_3_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex5_cpv_bar_3, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -411,42 +336,10 @@ def ex5_cpv_bar_3(bot_year=2008, top_year=2020, country_list=countries):
                 }
     }
 
-    projection = {
-        '$project':{
-            '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]},
-            'VALUE_EURO': '$VALUE_EURO'
-        }
-    }
-
     groupby_cpv_count = {
         '$group':{
             '_id': '$CPV_DIVISION',
-            'average': {'$avg' : '$VALUE_EURO'}
-        }
-    }
-
-    lookup = {
-        '$lookup': {
-            'from': 'cpv',
-            'foreignField': 'cpv_division',
-            'localField': '_id',
-            'as': 'CPV'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id' : False,
-            'cpv':{ '$arrayElemAt': ['$CPV', 0]},
-            'avg':'$average'
-        }
-    }
-
-    projection3 = {
-        '$project': {
-            'cpv': '$cpv.cpv_division_description',
-            'avg': True
+            'avg': {'$avg' : '$VALUE_EURO'}
         }
     }
 
@@ -459,16 +352,15 @@ def ex5_cpv_bar_3(bot_year=2008, top_year=2020, country_list=countries):
         '$limit':5
         }
     
-    pipeline = [filter_, projection, groupby_cpv_count, lookup, projection2, projection3, sort, limit]
+    pipeline = [filter_, groupby_cpv_count, sort, limit]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-    
-    return list_documents
+    return plan(pipeline, dimensions.join_cpv)
 
 
-def ex6_cpv_bar_4(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex5_cpv_bar_3(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Per CPV Division and get the average 'EURO_VALUE' return the highest 5 cpvs for contracts which did not recieve european funds ('B_EU_FUNDS') 
+    Per CPV Division and get the average 'EURO_VALUE' return the highest 5 cpvs for contracts which recieved european funds ('B_EU_FUNDS') 
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of 5 sorted documents):
@@ -478,6 +370,16 @@ def ex6_cpv_bar_4(bot_year=2008, top_year=2020, country_list=countries):
     value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
     value_2 = average 'EURO_VALUE' of each CPV Division, (float)
     """
+    if rollup:
+        return rollup.cpv_bar(bot_year, top_year, country_list, -1, 'Y')
+
+    return run(ex5_cpv_bar_3_plan(bot_year, top_year, country_list))
+
+
+def ex6_cpv_bar_4_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex6_cpv_bar_4, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -485,42 +387,10 @@ def ex6_cpv_bar_4(bot_year=2008, top_year=2020, country_list=countries):
                 }
     }
 
-    projection = {
-        '$project':{
-            '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]},
-            'VALUE_EURO': '$VALUE_EURO'
-        }
-    }
-
     groupby_cpv_count = {
         '$group':{
             '_id': '$CPV_DIVISION',
-            'average': {'$avg' : '$VALUE_EURO'}
-        }
-    }
-
-    lookup = {
-        '$lookup': {
-            'from': 'cpv',
-            'foreignField': 'cpv_division',
-            'localField': '_id',
-            'as': 'CPV'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id' : False,
-            'cpv':{ '$arrayElemAt': ['$CPV', 0]},
-            'avg':'$average'
-        }
-    }
-
-    projection3 = {
-        '$project': {
-            'cpv': '$cpv.cpv_division_description',
-            'avg': True
+            'avg': {'$avg' : '$VALUE_EURO'}
         }
     }
 
@@ -533,38 +403,44 @@ def ex6_cpv_bar_4(bot_year=2008, top_year=2020, country_list=countries):
         '$limit':5
         }
     
-    pipeline = [filter_, projection, groupby_cpv_count, lookup, projection2, projection3, sort, limit]
+    pipeline = [filter_, groupby_cpv_count, sort, limit]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-    
-    return list_documents
+    return plan(pipeline, dimensions.join_cpv)
 
 
-def ex7_cpv_map(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex6_cpv_bar_4(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Returns the highest CPV Division on average 'EURO_VALUE' per country 'ISO_COUNTRY_CODE'
-
+    Per CPV Division and get the average 'EURO_VALUE' return the highest 5 cpvs for contracts which did not recieve european funds ('B_EU_FUNDS') 
     Result filterable by floor year, roof year and country_list
 
-    Expected Output (list of documents):
-    [{cpv: value_1, avg: value_2, country: value_3}, ....]
+    Expected Output (list of 5 sorted documents):
+    [{cpv: value_1, avg: value_2}, ....]
 
     Where:
     value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
-    value_2 = highest CPV Division average 'EURO_VALUE' of country, (float)
-    value_3 = country in ISO-A2 format (string) (located in iso_codes collection)
+    value_2 = average 'EURO_VALUE' of each CPV Division, (float)
+    """
+    if rollup:
+        return rollup.cpv_bar(bot_year, top_year, country_list, -1, 'N')
+
+    return run(ex6_cpv_bar_4_plan(bot_year, top_year, country_list))
+
+
+def ex7_cpv_map_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex7_cpv_map, see plan()
     """
-    
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
-                    'ISO_COUNTRY_CODE': {'$in': country_list}, 'ISO_COUNTRY_CODE': {'$ne': None}, 'CPV': {'$ne': None}
+                    'ISO_COUNTRY_CODE': {'$in': country_list, '$ne': None}, 'CPV': {'$ne': None}
                 }
     }
 
     groupby_isocode_sum = {
                 '$group':{
-                    '_id':{'iso': '$ISO_COUNTRY_CODE', 'cpv':{'$substr': ['$CPV', 0,2]}},
+                    '_id':{'iso': '$ISO_COUNTRY_CODE', 'cpv': '$CPV_DIVISION'},
                     'avg': {'$avg' : '$VALUE_EURO'}
                 }
                     
@@ -586,77 +462,40 @@ def ex7_cpv_map(bot_year=2008, top_year=2020, country_list=countries):
     }
 
 
-    lookup = {
-        '$lookup': {
-            'from': 'iso_codes',
-            'foreignField': 'alpha-2',
-            'localField': '_id',
-            'as': 'ISOCODES'
-        }
-    }
+    pipeline = [filter_,groupby_isocode_sum,sort,groupby_isocode_max]
 
+    return plan(pipeline, dimensions.join_country)
 
-    projection1 = {
-        '$project': {
-            '_id' : '$_id',
-            'isocodes':{ '$arrayElemAt': ['$ISOCODES', 0]},
-            'avg':'$avg',
-            'cpv': '$cpv'
-        }
-    }
 
-    projection2 = {
-        '$project': {
-            '_id': False,
-            'country': '$isocodes.name',
-            'avg': True,
-            'cpv': '$cpv'
-        }
-    }
-
-
-    pipeline = [filter_,groupby_isocode_sum,sort,groupby_isocode_max,lookup,projection1,projection2]
-
-    list_documents = list(db.eu.aggregate(pipeline))
-
-    return list_documents
-
-
-def ex8_cpv_hist(bot_year=2008, top_year=2020, country_list=countries, cpv='50'):
+@cache.memoize
+def ex7_cpv_map(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Produce an histogram where each bucket has the contract counts of a particular cpv
-     in a given range of values (bucket) according to 'EURO_VALUE'
-
-     Choose 10 buckets of any partition
-    Buckets Example:
-     0 to 100000
-     100000 to 200000
-     200000 to 300000
-     300000 to 400000
-     400000 to 500000
-     500000 to 600000
-     600000 to 700000
-     700000 to 800000
-     800000 to 900000
-     900000 to 1000000
-
-
-    So given a CPV Division code (two digit string) return a list of documents where each document as the bucket _id,
-    and respective bucket count.
+    Returns the highest CPV Division on average 'EURO_VALUE' per country 'ISO_COUNTRY_CODE'
 
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of documents):
-    [{bucket: value_1, count: value_2}, ....]
+    [{cpv: value_1, avg: value_2, country: value_3}, ....]
 
     Where:
-    value_1 = lower limit of respective bucket (if bucket position 0 of example then bucket:0 )
-    value_2 = contract count for thar particular bucket, (int)
+    value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
+    value_2 = highest CPV Division average 'EURO_VALUE' of country, (float)
+    value_3 = country in ISO-A2 format (string) (located in iso_codes collection)
+    """
+    if rollup:
+        return rollup.cpv_map(bot_year, top_year, country_list)
+
+    return run(ex7_cpv_map_plan(bot_year, top_year, country_list))
+
+
+def ex8_cpv_hist_plan(bot_year=2008, top_year=2020, country_list=countries, cpv='50'):
+    """
+    Aggregation plan of ex8_cpv_hist, see plan()
     """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
-                    'ISO_COUNTRY_CODE': {'$in': country_list}, "$expr":{"$eq":[{'$substr': ['$CPV', 0,2]}, cpv]},
+                    'ISO_COUNTRY_CODE': {'$in': country_list}, '$or': cpv_prefix(cpv),
                     'VALUE_EURO': {'$ne': None}
                     
                 }
@@ -665,7 +504,7 @@ def ex8_cpv_hist(bot_year=2008, top_year=2020, country_list=countries, cpv='50')
     projection = {
         '$project':{
             '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]},
+            'CPV_DIVISION': '$CPV_DIVISION',
             'value_euro': "$VALUE_EURO" 
         }
     }
@@ -688,45 +527,56 @@ def ex8_cpv_hist(bot_year=2008, top_year=2020, country_list=countries, cpv='50')
 
     pipeline = [filter_, projection, bucket, projection2]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-    
-    return list_documents  
-
+    return plan(pipeline)
 
 
-def ex9_cpv_bar_diff(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex8_cpv_hist(bot_year=2008, top_year=2020, country_list=countries, cpv='50'):
     """
-    Returns the average time and value difference for each CPV, return the highest 5 cpvs
+    Produce an histogram where each bucket has the contract counts of a particular cpv
+     in a given range of values (bucket) according to 'EURO_VALUE'
 
-    time difference = 'DT-DISPATCH' - 'DT-AWARD'
-    value difference = 'AWARD_VALUE_EURO' - 'EURO_VALUE'
+     Choose 10 buckets of any partition
+    Buckets Example:
+     0 to 100000
+     100000 to 200000
+     200000 to 300000
+     300000 to 400000
+     400000 to 500000
+     500000 to 600000
+     600000 to 700000
+     700000 to 800000
+     800000 to 900000
+     900000 to 1000000
+
+
+    So given a CPV Division code (two digit string) return a list of documents where each document as the bucket _id,
+    and respective bucket count. Longer CPV prefixes (group, class, ...) are accepted as well.
 
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of documents):
-    [{cpv: value_1, time_difference: value_2, value_difference: value_3}, ....]
+    [{bucket: value_1, count: value_2}, ....]
 
     Where:
-    value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
-    value_2 = average 'DT-DISPACH' - 'DT-AWARD', (float)
-    value_3 = average 'EURO_AWARD' - 'EURO_VALUE' (float)
+    value_1 = lower limit of respective bucket (if bucket position 0 of example then bucket:0 )
+    value_2 = contract count for thar particular bucket, (int)
+    """
+
+    return run(ex8_cpv_hist_plan(bot_year, top_year, country_list, cpv))
+
+
+def ex9_cpv_bar_diff_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex9_cpv_bar_diff, see plan()
     """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
-                    'ISO_COUNTRY_CODE': {'$in': country_list}, 'DT_DISPATCH': {'$ne': None}, 'DT_AWARD': {'$ne': None}, 'CPV': {'$ne': None}
+                    'ISO_COUNTRY_CODE': {'$in': country_list}, 'time_difference': {'$ne': None}, 'CPV': {'$ne': None}
                 }
     }
 
-    projection = {
-        '$project':{
-            '_id' : False,
-            'CPV_DIVISION': {'$substr': ['$CPV', 0,2]},
-            'time_difference': {'$subtract' : [ {'$dateFromString': { 'dateString': '$DT_DISPATCH'}}, {'$dateFromString': { 'dateString': '$DT_AWARD'}} ]},
-            'value_difference': {'$subtract' : [ "$AWARD_VALUE_EURO", "$VALUE_EURO" ]}
-        }
-    }
-
     groupby_cpv_count = {
         '$group':{
             '_id': '$CPV_DIVISION',
@@ -735,32 +585,6 @@ def ex9_cpv_bar_diff(bot_year=2008, top_year=2020, country_list=countries):
         }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'cpv',
-            'foreignField': 'cpv_division',
-            'localField': '_id',
-            'as': 'CPV'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id' : False,
-            'cpv':{ '$arrayElemAt': ['$CPV', 0]},
-            'time_difference':'$time_difference',
-            'value_difference':'$value_difference'
-        }
-    }
-
-    projection3 = {
-        '$project': {
-            'cpv': '$cpv.cpv_division_description',
-            'time_difference':True,
-            'value_difference':True
-        }
-    }
-
     sort = {
         '$sort':{
             'time_difference':-1
@@ -771,172 +595,72 @@ def ex9_cpv_bar_diff(bot_year=2008, top_year=2020, country_list=countries):
     limit = {'$limit':5}
 
 
-    pipeline = [filter_, projection, groupby_cpv_count, lookup, projection2, projection3, sort, limit]
+    pipeline = [filter_, groupby_cpv_count, sort, limit]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-
-    return list_documents
+    return plan(pipeline, dimensions.join_cpv)
 
 
-def ex10_country_box(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex9_cpv_bar_diff(bot_year=2008, top_year=2020, country_list=countries):
     """
-    We want five numbers, described below
+    Returns the average time and value difference for each CPV, return the highest 5 cpvs
+
+    time difference = 'DT-DISPATCH' - 'DT-AWARD'
+    value difference = 'AWARD_VALUE_EURO' - 'EURO_VALUE'
+
     Result filterable by floor year, roof year and country_list
 
-    Expected Output:
-    (avg_country_euro_avg, avg_country_count, avg_country_offer_avg, avg_country_euro_avg_y_eu, avg_country_euro_avg_n_eu)
+    Expected Output (list of documents):
+    [{cpv: value_1, time_difference: value_2, value_difference: value_3}, ....]
 
     Where:
-    avg_country_euro_avg = average value of each countries ('ISO_COUNTRY_CODE') contracts average 'EURO_VALUE', (int)
-    avg_country_count = average value of each countries ('ISO_COUNTRY_CODE') contract count, (int)
-    avg_country_offer_avg = average value of each countries ('ISO_COUNTRY_CODE') contracts average NUMBER_OFFERS', (int)
-    avg_country_euro_avg_y_eu = average value of each countries ('ISO_COUNTRY_CODE') contracts average EURO_VALUE' with 'B_EU_FUNDS', (int)
-    avg_country_euro_avg_n_eu = average value of each countries ('ISO_COUNTRY_CODE') contracts average 'EURO_VALUE' with out 'B_EU_FUNDS' (int)
+    value_1 = CPV Division description, (string) (located in cpv collection as 'cpv_division_description')
+    value_2 = average 'DT-DISPACH' - 'DT-AWARD', (float)
+    value_3 = average 'EURO_AWARD' - 'EURO_VALUE' (float)
+
+    Both differences are computed once per contract at ingest ('time_difference' in milliseconds), see backend/ingest.py
     """
 
+    return run(ex9_cpv_bar_diff_plan(bot_year, top_year, country_list))
+
 
+def ex10_country_box_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex10_country_box, see plan()
+    """
     filter_ = {
         '$match': {
             '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}, {'ISO_COUNTRY_CODE': {'$in': country_list}}]
         }}
 
-    avg_country_euro_avg = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'Country': '$ISO_COUNTRY_CODE'
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
+    return box_plan(filter_, {'Country': '$ISO_COUNTRY_CODE'})
 
 
+@cache.memoize
+def ex10_country_box(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    We want five numbers, described below
+    Result filterable by floor year, roof year and country_list
 
-    avg_country_count = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'Country': '$ISO_COUNTRY_CODE'
-                    },
-                    'SUM':{'$sum':1}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$SUM'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-    avg_country_offer_avg = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'Country': '$ISO_COUNTRY_CODE'
-                    },
-                    'AVG':{'$avg':'$NUMBER_OFFERS'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-
-    avg_country_euro_avg_y_eu = int(list(
-        db.eu.aggregate([filter_,
-        {
-            '$match':{
-            '$and': [{'B_EU_FUNDS':'Y'}]
-            }
-            
-        },
-            {
-                '$group':{
-                    '_id':{
-                        'Country': '$ISO_COUNTRY_CODE'
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-
+    Expected Output:
+    (avg_country_euro_avg, avg_country_count, avg_country_offer_avg, avg_country_euro_avg_y_eu, avg_country_euro_avg_n_eu)
 
-    
-    avg_country_euro_avg_n_eu = int(list(
-        db.eu.aggregate([filter_,
-        {
-            '$match':{
-            '$and': [{'B_EU_FUNDS':'N'}]
-            }
-            
-        },
-            {
-                '$group':{
-                    '_id':{
-                        'Country': '$ISO_COUNTRY_CODE'
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
+    Where:
+    avg_country_euro_avg = average value of each countries ('ISO_COUNTRY_CODE') contracts average 'EURO_VALUE', (int)
+    avg_country_count = average value of each countries ('ISO_COUNTRY_CODE') contract count, (int)
+    avg_country_offer_avg = average value of each countries ('ISO_COUNTRY_CODE') contracts average NUMBER_OFFERS', (int)
+    avg_country_euro_avg_y_eu = average value of each countries ('ISO_COUNTRY_CODE') contracts average EURO_VALUE' with 'B_EU_FUNDS', (int)
+    avg_country_euro_avg_n_eu = average value of each countries ('ISO_COUNTRY_CODE') contracts average 'EURO_VALUE' with out 'B_EU_FUNDS' (int)
+    """
+    if rollup:
+        return rollup.box(bot_year, top_year, country_list, 'ISO_COUNTRY_CODE')
 
-    return avg_country_euro_avg, avg_country_count, avg_country_offer_avg, avg_country_euro_avg_y_eu, avg_country_euro_avg_n_eu
+    return run(ex10_country_box_plan(bot_year, top_year, country_list))
 
 
-def ex11_country_treemap(bot_year=2008, top_year=2020, country_list=countries):
+def ex11_country_treemap_plan(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Returns the count of contracts per country ('ISO_COUNTRY_CODE')
-    Result filterable by floor year, roof year and country_list
-
-    Expected Output (list of documents):
-    [{country: value_1, count: value_2}, ....]
-
-    Where:
-    value_1 = Country ('ISO_COUNTRY_CODE') name, (string) (located in iso_codes collection')
-    value_2 = contract count of each country, (int)
+    Aggregation plan of ex11_country_treemap, see plan()
     """
     filter_ = {
                 '$match': {
@@ -952,49 +676,33 @@ def ex11_country_treemap(bot_year=2008, top_year=2020, country_list=countries):
                 }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'iso_codes',
-            'foreignField': 'alpha-2',
-            'localField': '_id',
-            'as': 'ISOCODES'
-        }
-    }
-
-    projection1 = {
-        '$project': {
-            '_id' : False,
-            'isocodes':{ '$arrayElemAt': ['$ISOCODES', 0]},
-            'count':'$count'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            'country': '$isocodes.name',
-            'count': True
-        }
-    }
+    pipeline = [filter_,groupby_isocode_count]
 
-    pipeline = [filter_,groupby_isocode_count,lookup,projection1,projection2]
+    return plan(pipeline, dimensions.join_country)
 
-    list_documents = list(db.eu.aggregate(pipeline))
 
-    return list_documents
-
-
-def ex12_country_bar_1(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex11_country_treemap(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Returns the average 'EURO_VALUE' for each country, return the highest 5 countries
-
+    Returns the count of contracts per country ('ISO_COUNTRY_CODE')
     Result filterable by floor year, roof year and country_list
 
-    Expected Output (list of 5 sorted documents):
-    [{country: value_1, avg: value_2}, ....]
+    Expected Output (list of documents):
+    [{country: value_1, count: value_2}, ....]
 
     Where:
-    value_1 = Country ('ISO_COUNTRY_CODE') name, (string) (located in cpv collection as 'cpv_division_description')
-    value_2 = average 'EURO_VALUE' of each country ('ISO_COUNTRY_CODE') name, (float)
+    value_1 = Country ('ISO_COUNTRY_CODE') name, (string) (located in iso_codes collection')
+    value_2 = contract count of each country, (int)
+    """
+    if rollup:
+        return rollup.country_treemap(bot_year, top_year, country_list)
+
+    return run(ex11_country_treemap_plan(bot_year, top_year, country_list))
+
+
+def ex12_country_bar_1_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex12_country_bar_1, see plan()
     """
     filter_ = {
                 '$match': {
@@ -1006,34 +714,10 @@ def ex12_country_bar_1(bot_year=2008, top_year=2020, country_list=countries):
     groupby_isocode_count = {
                 '$group':{
                     '_id':'$ISO_COUNTRY_CODE',
-                    'average': {'$avg' : '$VALUE_EURO'}
+                    'avg': {'$avg' : '$VALUE_EURO'}
                 }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'iso_codes',
-            'foreignField': 'alpha-2',
-            'localField': '_id',
-            'as': 'ISOCODES'
-        }
-    }
-
-    projection1 = {
-        '$project': {
-            '_id' : False,
-            'isocodes':{ '$arrayElemAt': ['$ISOCODES', 0]},
-            'avg':'$average'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            'country': '$isocodes.name',
-            'avg': True
-        }
-    }
-
     sort = {
         '$sort':{
             'avg':-1
@@ -1042,16 +726,15 @@ def ex12_country_bar_1(bot_year=2008, top_year=2020, country_list=countries):
     limit = {'$limit':5}
 
 
-    pipeline = [filter_,groupby_isocode_count,lookup,projection1,projection2,sort,limit]
+    pipeline = [filter_,groupby_isocode_count,sort,limit]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-
-    return list_documents
+    return plan(pipeline, dimensions.join_country)
 
 
-def ex13_country_bar_2(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex12_country_bar_1(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Group by country and get the average 'EURO_VALUE' for each group, return the lowest, average wise, 5 documents
+    Returns the average 'EURO_VALUE' for each country, return the highest 5 countries
 
     Result filterable by floor year, roof year and country_list
 
@@ -1062,6 +745,16 @@ def ex13_country_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     value_1 = Country ('ISO_COUNTRY_CODE') name, (string) (located in cpv collection as 'cpv_division_description')
     value_2 = average 'EURO_VALUE' of each country ('ISO_COUNTRY_CODE') name, (float)
     """
+    if rollup:
+        return rollup.country_bar(bot_year, top_year, country_list, -1)
+
+    return run(ex12_country_bar_1_plan(bot_year, top_year, country_list))
+
+
+def ex13_country_bar_2_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex13_country_bar_2, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -1072,34 +765,10 @@ def ex13_country_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     groupby_isocode_count = {
                 '$group':{
                     '_id':'$ISO_COUNTRY_CODE',
-                    'average': {'$avg' : '$VALUE_EURO'}
+                    'avg': {'$avg' : '$VALUE_EURO'}
                 }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'iso_codes',
-            'foreignField': 'alpha-2',
-            'localField': '_id',
-            'as': 'ISOCODES'
-        }
-    }
-
-    projection1 = {
-        '$project': {
-            '_id' : False,
-            'isocodes':{ '$arrayElemAt': ['$ISOCODES', 0]},
-            'avg':'$average'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            'country': '$isocodes.name',
-            'avg': True
-        }
-    }
-
     sort = {
         '$sort':{
             'avg':1
@@ -1108,25 +777,34 @@ def ex13_country_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     limit = {'$limit':5}
 
 
-    pipeline = [filter_,groupby_isocode_count,lookup,projection1,projection2,sort,limit]
-
-    list_documents = list(db.eu.aggregate(pipeline))
+    pipeline = [filter_,groupby_isocode_count,sort,limit]
 
-    return list_documents
+    return plan(pipeline, dimensions.join_country)
 
 
-def ex14_country_map(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex13_country_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     """
-    For each country get the sum of thr«e respective contracts 'EURO_VALUE'
+    Group by country and get the average 'EURO_VALUE' for each group, return the lowest, average wise, 5 documents
 
     Result filterable by floor year, roof year and country_list
 
-    Expected Output (list of documents):
-    [{sum: value_1, country: value_2}, ....]
+    Expected Output (list of 5 sorted documents):
+    [{country: value_1, avg: value_2}, ....]
 
     Where:
-    value_1 = sum 'EURO_VALUE' of country ('ISO_COUNTRY_CODE') name, (float)
-    value_2 = country in ISO-A2 format (string) (located in iso_codes collection)
+    value_1 = Country ('ISO_COUNTRY_CODE') name, (string) (located in cpv collection as 'cpv_division_description')
+    value_2 = average 'EURO_VALUE' of each country ('ISO_COUNTRY_CODE') name, (float)
+    """
+    if rollup:
+        return rollup.country_bar(bot_year, top_year, country_list, 1)
+
+    return run(ex13_country_bar_2_plan(bot_year, top_year, country_list))
+
+
+def ex14_country_map_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex14_country_map, see plan()
     """
     filter_ = {
             '$match': {
@@ -1142,38 +820,44 @@ def ex14_country_map(bot_year=2008, top_year=2020, country_list=countries):
                 }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'iso_codes',
-            'foreignField': 'alpha-2',
-            'localField': '_id',
-            'as': 'ISOCODES'
-        }
-    }
+    pipeline = [filter_,groupby_isocode_count]
 
-    projection1 = {
-        '$project': {
-            '_id' : False,
-            'isocodes':{ '$arrayElemAt': ['$ISOCODES', 0]},
-            'sum':'$sum'
-        }
-    }
+    return plan(pipeline, dimensions.join_country)
 
-    projection2 = {
-        '$project': {
-            'country': '$isocodes.name',
-            'sum': True
-        }
-    }
 
+@cache.memoize
+def ex14_country_map(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    For each country get the sum of thr«e respective contracts 'EURO_VALUE'
 
-    pipeline = [filter_,groupby_isocode_count,lookup,projection1,projection2]
+    Result filterable by floor year, roof year and country_list
 
-    list_documents = list(db.eu.aggregate(pipeline))
+    Expected Output (list of documents):
+    [{sum: value_1, country: value_2}, ....]
 
-    return list_documents
+    Where:
+    value_1 = sum 'EURO_VALUE' of country ('ISO_COUNTRY_CODE') name, (float)
+    value_2 = country in ISO-A2 format (string) (located in iso_codes collection)
+    """
+    if rollup:
+        return rollup.country_map(bot_year, top_year, country_list)
+
+    return run(ex14_country_map_plan(bot_year, top_year, country_list))
+
+
+def ex15_business_box_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex15_business_box, see plan()
+    """
+    filter_ = {
+        '$match': {
+            '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}, {'ISO_COUNTRY_CODE': {'$in': country_list}}]
+        }}
 
+    return box_plan(filter_, {'Company': '$CAE_NAME'})
 
+
+@cache.memoize
 def ex15_business_box(bot_year=2008, top_year=2020, country_list=countries):
     """
     We want five numbers, described below
@@ -1191,149 +875,12 @@ def ex15_business_box(bot_year=2008, top_year=2020, country_list=countries):
     avg_business_euro_avg_n_eu = average value of each company ('CAE_NAME') contracts average 'EURO_VALUE' with out 'B_EU_FUNDS' (int)
     """
 
-    filter_ = {
-        '$match': {
-            '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}, {'ISO_COUNTRY_CODE': {'$in': country_list}}]
-        }}
-
-    avg_business_euro_avg = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'Company': '$CAE_NAME'
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-
-
-    avg_business_count = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'Company': '$CAE_NAME'
-                    },
-                    'SUM':{'$sum':1}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$SUM'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-    avg_business_offer_avg = int(list(
-        db.eu.aggregate([filter_,
-            {
-                '$group':{
-                    '_id':{
-                        'Company': '$CAE_NAME'
-                    },
-                    'AVG':{'$avg':'$NUMBER_OFFERS'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-
-    avg_business_euro_avg_y_eu = int(list(
-        db.eu.aggregate([filter_,
-        {
-            '$match':{
-            '$and': [{'B_EU_FUNDS':'Y'}]
-            }
-            
-        },
-            {
-                '$group':{
-                    '_id':{
-                        'Company': '$CAE_NAME'
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-
-
-    
-    avg_business_euro_avg_n_eu = int(list(
-        db.eu.aggregate([filter_,
-        {
-            '$match':{
-            '$and': [{'B_EU_FUNDS':'N'}]
-            }
-            
-        },
-            {
-                '$group':{
-                    '_id':{
-                        'Company': '$CAE_NAME'
-                    },
-                    'AVG':{'$avg':'$VALUE_EURO'}
-                }
-            },
-            
-            {
-                '$group':{
-                    '_id': None,
-                    'Average':{'$avg':'$AVG'}
-                }
-            },
-            
-        ])
-    )[0]['Average'])
-
-
-    return avg_business_euro_avg, avg_business_count, avg_business_offer_avg, avg_business_euro_avg_y_eu, avg_business_euro_avg_n_eu
+    return run(ex15_business_box_plan(bot_year, top_year, country_list))
 
 
-def ex16_business_bar_1(bot_year=2008, top_year=2020, country_list=countries):
+def ex16_business_bar_1_plan(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Returns the average 'EURO_VALUE' for company ('CAE_NAME') return the highest 5 companies
-    Result filterable by floor year, roof year and country_list
-
-    Expected Output (list of 5 sorted documents):
-    [{company: value_1, avg: value_2}, ....]
-
-    Where:
-    value_1 = company ('CAE_NAME') name, (string)
-    value_2 = average 'EURO_VALUE' of each company ('CAE_NAME'), (float)
+    Aggregation plan of ex16_business_bar_1, see plan()
     """
     filter_ = {
                 '$match': {
@@ -1367,16 +914,13 @@ def ex16_business_bar_1(bot_year=2008, top_year=2020, country_list=countries):
     
     pipeline = [filter_,groupby_cae_count,projection,sort,limit]
     
-    list_documents = list(db.eu.aggregate(pipeline))
-
-    return list_documents
+    return plan(pipeline)
 
 
-def ex17_business_bar_2(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex16_business_bar_1(bot_year=2008, top_year=2020, country_list=countries):
     """
-    Returns the average 'EURO_VALUE' for company ('CAE_NAME') return the lowest 5 companies
-
-
+    Returns the average 'EURO_VALUE' for company ('CAE_NAME') return the highest 5 companies
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of 5 sorted documents):
@@ -1386,6 +930,14 @@ def ex17_business_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     value_1 = company ('CAE_NAME') name, (string)
     value_2 = average 'EURO_VALUE' of each company ('CAE_NAME'), (float)
     """
+
+    return run(ex16_business_bar_1_plan(bot_year, top_year, country_list))
+
+
+def ex17_business_bar_2_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex17_business_bar_2, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -1418,22 +970,31 @@ def ex17_business_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     
     pipeline = [filter_,groupby_cae_count,projection,sort,limit]
     
-    list_documents = list(db.eu.aggregate(pipeline))
-
-    return list_documents
+    return plan(pipeline)
 
 
-def ex18_business_treemap(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex17_business_bar_2(bot_year=2008, top_year=2020, country_list=countries):
     """
-    We want the count of contracts for each company 'CAE_CODE', for the highest 15
+    Returns the average 'EURO_VALUE' for company ('CAE_NAME') return the lowest 5 companies
+
+
     Result filterable by floor year, roof year and country_list
 
-    Expected Output (list of documents):
-    [{company: value_1, count: value_2}, ....]
+    Expected Output (list of 5 sorted documents):
+    [{company: value_1, avg: value_2}, ....]
 
     Where:
-    value_1 = company ('CAE_NAME'), (string)
-    value_2 = contract count of each company ('CAE_NAME'), (int)
+    value_1 = company ('CAE_NAME') name, (string)
+    value_2 = average 'EURO_VALUE' of each company ('CAE_NAME'), (float)
+    """
+
+    return run(ex17_business_bar_2_plan(bot_year, top_year, country_list))
+
+
+def ex18_business_treemap_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex18_business_treemap, see plan()
     """
     filter_ = {
                 '$match': {
@@ -1467,27 +1028,30 @@ def ex18_business_treemap(bot_year=2008, top_year=2020, country_list=countries):
     
     pipeline = [filter_,groupby_cae_count,projection,sort,limit]
 
-    list_documents = list(db.eu.aggregate(pipeline))
-
-    return list_documents
+    return plan(pipeline)
 
 
-def ex19_business_map(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex18_business_treemap(bot_year=2008, top_year=2020, country_list=countries):
     """
-    For each country get the highest sum, in terms of 'EURO_VALUE', company ('CAE_NAME')
-
+    We want the count of contracts for each company 'CAE_CODE', for the highest 15
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of documents):
-    [{company: value_1, sum: value_2, country: value_3, address: value_4}, ....]
+    [{company: value_1, count: value_2}, ....]
 
     Where:
-    value_1 = 'top' company of that particular country ('CAE_NAME'), (string)
-    value_2 = sum 'EURO_VALUE' of country and company ('CAE_NAME'), (float)
-    value_3 = country in ISO-A2 format (string) (located in iso_codes collection)
-    value_4 = company ('CAE_NAME') address, single string merging 'CAE_ADDRESS' and 'CAE_TOWN' separated by ' ' (space)
+    value_1 = company ('CAE_NAME'), (string)
+    value_2 = contract count of each company ('CAE_NAME'), (int)
     """
 
+    return run(ex18_business_treemap_plan(bot_year, top_year, country_list))
+
+
+def ex19_business_map_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex19_business_map, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -1513,62 +1077,40 @@ def ex19_business_map(bot_year=2008, top_year=2020, country_list=countries):
         "$group": {
             '_id':'$_id.iso',
             'sum': {'$first': '$sum'},
-            'caename': {'$first': '$_id.caename'},
+            'company': {'$first': '$_id.caename'},
             'address': {'$first': '$_id.address'}
             }
     }
 
-    lookup = {
-        '$lookup': {
-            'from': 'iso_codes',
-            'foreignField': 'alpha-2',
-            'localField': '_id',
-            'as': 'ISOCODES'
-        }
-    }
-
-    projection1 = {
-        '$project': {
-            '_id' : '$_id',
-            'isocodes':{'$arrayElemAt': ['$ISOCODES', 0]},
-            'sum':'$sum',
-            'company': '$caename',
-            'address': '$address'
-        }
-    }
-
-    projection2 = {
-        '$project': {
-            '_id': False,
-            'address': True,
-            'country': '$isocodes.name',
-            'sum': True,
-            'company': True
-        }
-    }
+    pipeline = [filter_,groupby_isocode_sum,sort,groupby_isocode_max]
 
+    return plan(pipeline, dimensions.join_country, allowDiskUse=True)
 
-    pipeline = [filter_,groupby_isocode_sum,sort,groupby_isocode_max,lookup,projection1,projection2]
 
-    list_documents = list(db.eu.aggregate(pipeline, allowDiskUse=True))
-
-    return list_documents
-
-
-def ex20_business_connection(bot_year=2008, top_year=2020, country_list=countries):
+@cache.memoize
+def ex19_business_map(bot_year=2008, top_year=2020, country_list=countries):
     """
-    We want the top 5 most co-occurring companies ('CAE_NAME' and 'WIN_NAME')
+    For each country get the highest sum, in terms of 'EURO_VALUE', company ('CAE_NAME')
 
     Result filterable by floor year, roof year and country_list
 
     Expected Output (list of documents):
-    [{companies: value_1, count: value_2}, ....]
+    [{company: value_1, sum: value_2, country: value_3, address: value_4}, ....]
 
     Where:
-    value_1 = company ('CAE_NAME') string merged with company ('WIN_NAME') seperated by the string ' with ', (string)
-    value_2 = co-occurring number of contracts (int)
+    value_1 = 'top' company of that particular country ('CAE_NAME'), (string)
+    value_2 = sum 'EURO_VALUE' of country and company ('CAE_NAME'), (float)
+    value_3 = country in ISO-A2 format (string) (located in iso_codes collection)
+    value_4 = company ('CAE_NAME') address, single string merging 'CAE_ADDRESS' and 'CAE_TOWN' separated by ' ' (space)
     """
 
+    return run(ex19_business_map_plan(bot_year, top_year, country_list))
+
+
+def ex20_business_connection_plan(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    Aggregation plan of ex20_business_connection, see plan()
+    """
     filter_ = {
                 '$match': {
                     '$and': [{'YEAR': {'$gte': bot_year}}, {'YEAR': {'$lte': top_year}}],
@@ -1602,18 +1144,42 @@ def ex20_business_connection(bot_year=2008, top_year=2020, country_list=countrie
 
     pipeline = [filter_,groupby_companies_count,projection,sort,limit]
     
-    list_documents = list(db.eu.aggregate(pipeline))
+    return plan(pipeline)
 
-    return list_documents
+
+@cache.memoize
+def ex20_business_connection(bot_year=2008, top_year=2020, country_list=countries):
+    """
+    We want the top 5 most co-occurring companies ('CAE_NAME' and 'WIN_NAME')
+
+    Result filterable by floor year, roof year and country_list
+
+    Expected Output (list of documents):
+    [{companies: value_1, count: value_2}, ....]
+
+    Where:
+    value_1 = company ('CAE_NAME') string merged with company ('WIN_NAME') seperated by the string ' with ', (string)
+    value_2 = co-occurring number of contracts (int)
+    """
+
+    return run(ex20_business_connection_plan(bot_year, top_year, country_list))
 
 def insert_operation(document):
     '''
         Insert operation.
 
-        In case pre computed tables were generated for the queries they should be recomputed with the new data.
+        Pre computed tables are kept up to date by applying the delta of the inserted documents to each of them
+        (see rollup_maintainers) instead of recomputing them from the whole collection. The data version is then
+        bumped so that cached results computed on the previous data are dropped.
     '''
+    document = [ingest.prepare_document(contract) for contract in document]
     inserted_ids = eu.insert_many(document).inserted_ids
 
+    for maintain in rollup_maintainers:
+        maintain(document)
+
+    metadata.bump_data_version()
+
     return inserted_ids
 
 
@@ -1625,3 +1191,28 @@ query_list = [
     ex16_business_bar_1, ex17_business_bar_2, ex18_business_treemap,
     ex19_business_map, ex20_business_connection
 ]
+
+
+# Plan function of each query of query_list, by name
+query_plans = {
+    'ex1_cpv_box': ex1_cpv_box_plan,
+    'ex2_cpv_treemap': ex2_cpv_treemap_plan,
+    'ex3_cpv_bar_1': ex3_cpv_bar_1_plan,
+    'ex4_cpv_bar_2': ex4_cpv_bar_2_plan,
+    'ex5_cpv_bar_3': ex5_cpv_bar_3_plan,
+    'ex6_cpv_bar_4': ex6_cpv_bar_4_plan,
+    'ex7_cpv_map': ex7_cpv_map_plan,
+    'ex8_cpv_hist': ex8_cpv_hist_plan,
+    'ex9_cpv_bar_diff': ex9_cpv_bar_diff_plan,
+    'ex10_country_box': ex10_country_box_plan,
+    'ex11_country_treemap': ex11_country_treemap_plan,
+    'ex12_country_bar_1': ex12_country_bar_1_plan,
+    'ex13_country_bar_2': ex13_country_bar_2_plan,
+    'ex14_country_map': ex14_country_map_plan,
+    'ex15_business_box': ex15_business_box_plan,
+    'ex16_business_bar_1': ex16_business_bar_1_plan,
+    'ex17_business_bar_2': ex17_business_bar_2_plan,
+    'ex18_business_treemap': ex18_business_treemap_plan,
+    'ex19_business_map': ex19_business_map_plan,
+    'ex20_business_connection': ex20_business_connection_plan,
+}
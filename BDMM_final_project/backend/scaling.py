@@ -0,0 +1,133 @@
+import argparse
+import json
+import math
+import os
+import tracemalloc
+
+########################################################################################################################
+# Data-size scaling benchmark
+#
+# Grows a synthetic dataset (see backend/synthetic.py) through several sizes on a local server and benchmarks every
+# query at each size. The latency and memory of each query are fitted as size ** exponent: an exponent of 1 is linear
+# growth, the queries growing faster than linearly (beyond 'tolerance') are flagged.
+#     python -m backend.scaling --uri mongodb://localhost:27017 --sizes 1000000,5000000,20000000 --output scaling.json
+# Memory is the peak Python allocation while the query runs (result documents and joins) and the memory of the
+# blocking stages reported by the server in the explain (see explain.memory_bytes).
+########################################################################################################################
+
+default_sizes = [1000000, 5000000, 20000000]
+
+# exponents above 1 + tolerance are flagged as worse than linear
+tolerance = 0.15
+
+
+def growth_exponent(sizes, values):
+    """
+    Least squares slope of log(value) over log(size), None without at least two positive values
+    """
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, values) if value and value > 0]
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance if variance else None
+
+
+def client_memory(fn):
+    """
+    Peak Python memory allocated by one run of the query, in bytes
+    """
+    tracemalloc.start()
+    try:
+        getattr(fn, '__wrapped__', fn)()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def scaling(sizes=None, functions=None, seed=0, workers=os.cpu_count(), warmup=1, iterations=5, output=None,
+            allow_drop=False):
+    """
+    Loads each size in turn (the dataset grows, it is not reloaded) and benchmarks every query at each size
+
+    The first load drops eu and the dimension collections, so ValueError is raised on a database other than
+    synthetic.database_name that holds contracts, unless 'allow_drop'
+
+    Expected Output (dict, also written as JSON to 'output' when given):
+    {'sizes': [int, ....], 'queries': {name: {'latency': [median seconds per size], 'client_memory': [bytes, ....],
+     'server_memory': [bytes, ....], 'latency_exponent': float, 'memory_exponent': float, 'flagged': bool}, ....}}
+    """
+    from backend import DB
+    from backend import performance_evaluation
+    from backend import synthetic
+    from backend.queries import query_list
+
+    if not allow_drop and DB.database_name != synthetic.database_name and DB.db.eu.count_documents({}, limit=1):
+        raise ValueError(f"{DB.database_name} holds contracts that the synthetic load would drop, "
+                         f"use {synthetic.database_name} or allow the drop")
+
+    sizes = sorted(sizes or default_sizes)
+    functions = functions or query_list
+    queries = {fn.__name__: {'latency': [], 'client_memory': [], 'server_memory': []} for fn in functions}
+
+    loaded_chunks = 0
+    for size in sizes:
+        print(f"Loading {size} contracts", flush=True)
+        synthetic.load(size, seed, workers, drop=loaded_chunks == 0, first_chunk=loaded_chunks)
+        loaded_chunks = math.ceil(size / synthetic.chunk_size)
+
+        report = performance_evaluation.benchmark(functions, warmup=warmup, iterations=iterations, explain=True)
+        for fn, result in zip(functions, report['queries']):
+            queries[fn.__name__]['latency'].append(result['latency']['median'])
+            queries[fn.__name__]['server_memory'].append(result['explain']['memory_bytes'])
+            queries[fn.__name__]['client_memory'].append(client_memory(fn))
+
+    for name, query in queries.items():
+        query['latency_exponent'] = growth_exponent(sizes, query['latency'])
+        memory = [client + server for client, server in zip(query['client_memory'], query['server_memory'])]
+        query['memory_exponent'] = growth_exponent(sizes, memory)
+        query['flagged'] = any(exponent is not None and exponent > 1 + tolerance
+                               for exponent in (query['latency_exponent'], query['memory_exponent']))
+
+        exponents = ', '.join(f"{label} ~ n^{exponent:.2f}" if exponent is not None else f"{label} -"
+                              for label, exponent in (('latency', query['latency_exponent']),
+                                                      ('memory', query['memory_exponent'])))
+        print(f"{name:<28}{exponents}{' [WORSE THAN LINEAR]' if query['flagged'] else ''}", flush=True)
+
+    report = {'sizes': sizes, 'queries': queries}
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    return report
+
+
+if __name__ == '__main__':
+    from backend import synthetic
+
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard queries on growing synthetic datasets')
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help='MongoDB connection string')
+    parser.add_argument('--db', default=synthetic.database_name, help='database name, eu is dropped')
+    parser.add_argument('--drop', action='store_true',
+                        help=f'allow dropping the contracts of a database other than {synthetic.database_name}')
+    parser.add_argument('--sizes', default=','.join(map(str, default_sizes)), help='comma separated contract counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    # read by backend/DB.py when imported, the benchmark bypasses the result cache
+    os.environ['BDMM_MONGO_URI'] = args.uri
+    os.environ['BDMM_MONGO_DB'] = args.db
+    os.environ.setdefault('BDMM_CACHE_BACKEND', 'memory')
+
+    try:
+        scaling([int(size) for size in args.sizes.split(',')], seed=args.seed, workers=args.workers,
+                warmup=args.warmup, iterations=args.iterations, output=args.output, allow_drop=args.drop)
+    except ValueError as e:
+        parser.error(str(e))
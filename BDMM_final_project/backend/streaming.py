@@ -0,0 +1,90 @@
+import os
+import time
+from pymongo.errors import BulkWriteError
+from backend.DB import eu
+from backend import ingest
+from backend import json_stream
+from backend import metadata
+
+########################################################################################################################
+# Streaming ingest of contract files
+#
+# A file is parsed incrementally (see backend/json_stream.py), as a JSON array ([{...}, {...}]) or as NDJSON (one
+# contract per line), and inserted in batches with unordered bulk writes, so memory stays flat whatever the size of
+# the file and a bad contract only loses itself: an NDJSON line that is not valid JSON, or a document the server
+# rejects, is counted and skipped. A malformed JSON array stops the ingest at the malformed element.
+#     BDMM_INGEST_BATCH       contracts per insert (default 1000)
+########################################################################################################################
+
+batch_size = int(os.environ.get('BDMM_INGEST_BATCH', '1000'))
+
+
+def insert_batch(documents):
+    """
+    Inserts a batch with an unordered bulk write, the documents the server rejects do not stop the others
+
+    Expected Output:
+    (inserted documents, [error messages])
+    """
+    documents = [ingest.prepare_document(document) for document in documents]
+    try:
+        eu.insert_many(documents, ordered=False)
+        return documents, []
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        failed = {error['index'] for error in errors}
+        return [document for index, document in enumerate(documents) if index not in failed], \
+               [error.get('errmsg', str(error)) for error in errors]
+
+
+def ingest_stream(file, size=batch_size, progress=None):
+    """
+    Inserts every contract of a text file (JSON array or NDJSON), batch by batch
+
+    The pre computed tables are maintained with the contracts of each batch and the data version is bumped once at
+    the end (see queries.insert_operation). 'progress' is called with the running stats after every batch.
+
+    Expected Output (dict):
+    {'inserted': int, 'rejected': int, 'errors': [first error messages], 'batches': int, 'seconds': float,
+     'docs_per_second': float, 'batch_seconds': {'mean': float, 'max': float, 'last': float}}
+    """
+    from backend.queries import rollup_maintainers
+
+    rejected = []
+    stats = {'inserted': 0, 'rejected': 0, 'errors': [], 'batches': 0, 'seconds': 0, 'docs_per_second': 0,
+             'batch_seconds': {'mean': 0, 'max': 0, 'last': 0}}
+    start = time.time()
+
+    for batch in json_stream.batches(json_stream.iter_contracts(file, rejected), size):
+        batch_start = time.time()
+        valid = [document for document in batch if isinstance(document, dict)]
+        inserted, errors = insert_batch(valid) if valid else ([], [])
+        for maintain in rollup_maintainers:
+            maintain(inserted)
+        batch_time = time.time() - batch_start
+
+        errors = rejected + errors + ['not a JSON object'] * (len(batch) - len(valid))
+        rejected.clear()
+        stats['inserted'] += len(inserted)
+        stats['rejected'] += len(errors)
+        stats['errors'] = (stats['errors'] + errors)[:10]
+        stats['batches'] += 1
+        stats['seconds'] = time.time() - start
+        stats['docs_per_second'] = stats['inserted'] / stats['seconds'] if stats['seconds'] else 0
+        stats['batch_seconds'] = {
+            'mean': (stats['batch_seconds']['mean'] * (stats['batches'] - 1) + batch_time) / stats['batches'],
+            'max': max(stats['batch_seconds']['max'], batch_time),
+            'last': batch_time,
+        }
+        if progress:
+            progress(stats)
+
+    # invalid NDJSON lines after the last complete batch
+    stats['rejected'] += len(rejected)
+    stats['errors'] = (stats['errors'] + rejected)[:10]
+    stats['seconds'] = time.time() - start
+
+    if stats['inserted']:
+        metadata.bump_data_version()
+
+    return stats
@@ -0,0 +1,271 @@
+import argparse
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+
+########################################################################################################################
+# Seeded synthetic contracts for scale testing
+#
+# Generates contracts with the fields of test_insert_document.json that the dashboard reads, with production-like
+# distributions: per-country volumes, a few contracting authorities ('CAE_NAME') awarding most contracts (Zipf), CPV
+# codes of the divisions in the cpv collection, log-normal 'VALUE_EURO' and nulls at realistic rates. The contracts
+# of chunk i only depend on (seed, i) and the CPV divisions, so a dataset is the same whatever the number of workers
+# loading it:
+#     python -m backend.synthetic --uri mongodb://localhost:27017 --db contracts_synthetic --contracts 5000000 --drop
+# The existing cpv and iso_codes dimension collections are kept, the lists below only fill them in an empty database
+# (or replace them with --drop). The indexes of backend/indexes.py are created at the end.
+########################################################################################################################
+
+# divisions and descriptions written to an empty cpv collection
+cpv_divisions = {
+    '03': 'Agricultural, farming, fishing, forestry and related products',
+    '09': 'Petroleum products, fuel, electricity and other sources of energy',
+    '14': 'Mining, basic metals and related products',
+    '15': 'Food, beverages, tobacco and related products',
+    '16': 'Agricultural machinery',
+    '18': 'Clothing, footwear, luggage articles and accessories',
+    '19': 'Leather and textile fabrics, plastic and rubber materials',
+    '22': 'Printed matter and related products',
+    '24': 'Chemical products',
+    '30': 'Office and computing machinery, equipment and supplies except furniture and software packages',
+    '31': 'Electrical machinery, apparatus, equipment and consumables; lighting',
+    '32': 'Radio, television, communication, telecommunication and related equipment',
+    '33': 'Medical equipments, pharmaceuticals and personal care products',
+    '34': 'Transport equipment and auxiliary products to transportation',
+    '35': 'Security, fire-fighting, police and defence equipment',
+    '37': 'Musical instruments, sport goods, games, toys, handicraft, art materials and accessories',
+    '38': 'Laboratory, optical and precision equipments (excl. glasses)',
+    '39': 'Furniture (incl. office furniture), furnishings, domestic appliances (excl. lighting) and cleaning products',
+    '41': 'Collected and purified water',
+    '42': 'Industrial machinery',
+    '43': 'Machinery for mining, quarrying, construction equipment',
+    '44': 'Construction structures and materials; auxiliary products to construction (except electric apparatus)',
+    '45': 'Construction work',
+    '48': 'Software package and information systems',
+    '50': 'Repair and maintenance services',
+    '51': 'Installation services (except software)',
+    '55': 'Hotel, restaurant and retail trade services',
+    '60': 'Transport services (excl. Waste transport)',
+    '63': 'Supporting and auxiliary transport services; travel agencies services',
+    '64': 'Postal and telecommunications services',
+    '65': 'Public utilities',
+    '66': 'Financial and insurance services',
+    '70': 'Real estate services',
+    '71': 'Architectural, construction, engineering and inspection services',
+    '72': 'IT services: consulting, software development, Internet and support',
+    '73': 'Research and development services and related consultancy services',
+    '75': 'Administration, defence and social security services',
+    '76': 'Services related to the oil and gas industry',
+    '77': 'Agricultural, forestry, horticultural, aquacultural and apicultural services',
+    '79': 'Business services: law, marketing, consulting, recruitment, printing and security',
+    '80': 'Education and training services',
+    '85': 'Health and social work services',
+    '90': 'Sewage, refuse, cleaning and environmental services',
+    '92': 'Recreational, cultural and sporting services',
+    '98': 'Other community, social and personal services',
+}
+
+# relative weight of the divisions that dominate the TED notices, the others weigh 1
+cpv_weights = {'33': 12, '45': 10, '15': 4, '34': 4, '71': 4, '79': 4, '90': 4, '72': 3, '50': 3, '30': 3, '09': 2}
+
+# alpha-2 code as stored in the iso_codes collection (see dimensions.country_aliases) and name of every country
+iso_codes = {
+    'AT': 'Austria', 'BE': 'Belgium', 'BG': 'Bulgaria', 'CH': 'Switzerland', 'CY': 'Cyprus', 'CZ': 'Czechia',
+    'DE': 'Germany', 'DK': 'Denmark', 'EE': 'Estonia', 'ES': 'Spain', 'FI': 'Finland', 'FR': 'France',
+    'GB': 'United Kingdom of Great Britain and Northern Ireland', 'GR': 'Greece', 'HR': 'Croatia', 'HU': 'Hungary',
+    'IE': 'Ireland', 'IS': 'Iceland', 'IT': 'Italy', 'LI': 'Liechtenstein', 'LT': 'Lithuania', 'LU': 'Luxembourg',
+    'LV': 'Latvia', 'MK': 'North Macedonia', 'MT': 'Malta', 'NL': 'Netherlands', 'NO': 'Norway', 'PL': 'Poland',
+    'PT': 'Portugal', 'RO': 'Romania', 'SE': 'Sweden', 'SI': 'Slovenia', 'SK': 'Slovakia',
+}
+
+# share of the notices published by each country (ISO_COUNTRY_CODE as in the TED extracts), roughly as in TED
+country_weights = {
+    'PL': 22, 'FR': 18, 'DE': 9, 'UK': 6, 'ES': 5, 'IT': 4, 'RO': 4, 'CZ': 3, 'SE': 3, 'LV': 3, 'LT': 3, 'DK': 2,
+    'NL': 2, 'HU': 2, 'BG': 2, 'SK': 2, 'SI': 2, 'FI': 2, 'BE': 1.5, 'AT': 1.5, 'HR': 1.5, 'PT': 1, 'GR': 1,
+    'NO': 1, 'IE': 1, 'EE': 1, 'CH': 0.5, 'CY': 0.3, 'LU': 0.3, 'MT': 0.2, 'MK': 0.2, 'IS': 0.1, 'LI': 0.05,
+}
+
+# fraction of the contracts missing each field
+null_rates = {
+    'VALUE_EURO': 0.15, 'AWARD_VALUE_EURO': 0.35, 'NUMBER_OFFERS': 0.1, 'CAE_ADDRESS': 0.05, 'CAE_TOWN': 0.03,
+    'WIN_NAME': 0.2, 'DT_AWARD': 0.3, 'B_EU_FUNDS': 0.05, 'CPV': 0.01,
+}
+
+authorities_per_country = 5000
+winners_per_country = 20000
+chunk_size = 10000
+
+# database of the scale tests, backend/scaling.py only drops the contracts of another database when asked to
+database_name = 'contracts_synthetic'
+
+months = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+
+def ted_date(date):
+    """
+    Date in the format of the TED extracts, e.g. '22-DEC-17'
+    """
+    return f"{date.day:02d}-{months[date.month - 1]}-{date.year % 100:02d}"
+
+
+def zipf_rank(rng, size):
+    """
+    Rank in 1..size, rank r drawn with a probability proportional to 1 / r
+    """
+    return int(size ** rng.random())
+
+
+def maybe(rng, field, value):
+    return None if rng.random() < null_rates.get(field, 0) else value
+
+
+def generate_contract(rng, notice_id, countries, country_cum_weights, divisions, division_cum_weights):
+    country = rng.choices(countries, cum_weights=country_cum_weights)[0]
+    division = rng.choices(divisions, cum_weights=division_cum_weights)[0]
+    year = rng.randint(2008, 2020)
+    authority = zipf_rank(rng, authorities_per_country)
+    winner = zipf_rank(rng, winners_per_country)
+
+    dispatch = datetime(year, 1, 1) + timedelta(days=rng.randrange(365))
+    award = dispatch - timedelta(days=int(rng.expovariate(1 / 45)))
+    value = round(rng.lognormvariate(11.5, 1.8), 2)
+    award_value = round(value * rng.lognormvariate(0, 0.15), 2)
+
+    return {
+        'ID_NOTICE_CAN': notice_id,
+        'YEAR': year,
+        'ID_TYPE': 3,
+        'DT_DISPATCH': ted_date(dispatch),
+        'DT_AWARD': maybe(rng, 'DT_AWARD', ted_date(award)),
+        'CANCELLED': 0,
+        'CAE_NAME': f"{iso_codes.get(country, country)} Contracting Authority {authority}",
+        'CAE_ADDRESS': maybe(rng, 'CAE_ADDRESS', f"Street {authority % 300 + 1}, {authority}"),
+        'CAE_TOWN': maybe(rng, 'CAE_TOWN', f"{country} Town {authority % 500 + 1}"),
+        'ISO_COUNTRY_CODE': country,
+        'TYPE_OF_CONTRACT': rng.choice(['S', 'U', 'W']),
+        'CPV': maybe(rng, 'CPV', int(division) * 10 ** 6 + rng.randrange(100) * 10 ** 4),
+        'B_EU_FUNDS': maybe(rng, 'B_EU_FUNDS', 'Y' if rng.random() < 0.2 else 'N'),
+        'NUMBER_OFFERS': maybe(rng, 'NUMBER_OFFERS', 1 + int(rng.expovariate(1 / 3))),
+        'VALUE_EURO': maybe(rng, 'VALUE_EURO', value),
+        'AWARD_VALUE_EURO': maybe(rng, 'AWARD_VALUE_EURO', award_value),
+        'WIN_NAME': maybe(rng, 'WIN_NAME', f"{country} Supplier {winner}"),
+    }
+
+
+def generate_chunk(seed, chunk, size=chunk_size, divisions=None):
+    """
+    Contracts of chunk 'chunk' (notice ids chunk * size + 1 to (chunk + 1) * size), the same for the same seed and
+    'divisions' (sorted CPV divisions, default the ones of cpv_divisions)
+    """
+    from backend import ingest
+
+    rng = random.Random(f"{seed}:{chunk}")
+    countries = list(country_weights)
+    country_cum_weights = list(accumulate(country_weights.values()))
+    divisions = divisions or sorted(cpv_divisions)
+    division_cum_weights = list(accumulate(cpv_weights.get(division, 1) for division in divisions))
+
+    return [ingest.prepare_document(generate_contract(rng, notice_id, countries, country_cum_weights, divisions,
+                                                      division_cum_weights))
+            for notice_id in range(chunk * size + 1, (chunk + 1) * size + 1)]
+
+
+def dimension_documents():
+    """
+    Expected Output:
+    (cpv documents, iso_codes documents)
+    """
+    cpv = [{'cpv_division': code, 'cpv_division_description': description} for code, description in cpv_divisions.items()]
+    countries = [{'alpha-2': code, 'name': name} for code, name in iso_codes.items()]
+
+    return cpv, countries
+
+
+def load_dimensions(drop=False):
+    """
+    Fills the cpv and iso_codes collections when they are empty (after dropping them with 'drop'), existing dimension
+    tables are never overwritten
+
+    Expected Output:
+    sorted list of the CPV divisions of the cpv collection
+    """
+    from backend import dimensions
+    from backend.DB import db
+
+    cpv, countries = dimension_documents()
+    for name, documents in [('cpv', cpv), ('iso_codes', countries)]:
+        if drop:
+            db[name].drop()
+        if db[name].estimated_document_count() == 0:
+            db[name].insert_many(documents)
+    dimensions.refresh()
+
+    return sorted(division for division in dimensions.cpv_descriptions() if division)
+
+
+def load_chunk(arguments):
+    seed, chunk, size, divisions = arguments
+    from backend.DB import eu
+
+    start = time.time()
+    eu.insert_many(generate_chunk(seed, chunk, size, divisions), ordered=False)
+
+    return chunk, time.time() - start
+
+
+def load(contracts, seed=0, workers=os.cpu_count(), size=chunk_size, drop=False, first_chunk=0):
+    """
+    Loads 'contracts' synthetic contracts into eu with 'workers' processes, see load_dimensions for the dimension
+    collections, 'drop' replaces eu and the dimension collections
+
+    'first_chunk' skips chunks already loaded, e.g. growing a dataset of 1M contracts (chunks 0 to 99) to 5M loads
+    chunks 100 to 499 and gives the same dataset as loading 5M at once
+
+    Expected Output (dict):
+    {'contracts': int, 'seconds': float, 'contracts_per_second': float}
+    """
+    from backend import indexes
+    from backend import metadata
+    from backend.DB import db
+
+    if drop:
+        db.eu.drop()
+    divisions = load_dimensions(drop)
+
+    chunks = math.ceil(contracts / size)
+    tasks = [(seed, chunk, size, divisions) for chunk in range(first_chunk, chunks)]
+    start = time.time()
+    # every worker opens its own connection, backend.DB creates one client per process
+    with Pool(workers) as pool:
+        for done, (chunk, seconds) in enumerate(pool.imap_unordered(load_chunk, tasks)):
+            print(f"Loaded chunk {done + 1} of {len(tasks)} ({seconds:.1f}s)", flush=True)
+    seconds = time.time() - start
+
+    indexes.ensure_indexes()
+    metadata.bump_data_version()
+
+    loaded = len(tasks) * size
+
+    return {'contracts': loaded, 'seconds': seconds, 'contracts_per_second': loaded / seconds if seconds else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load seeded synthetic contracts into a MongoDB database')
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help='MongoDB connection string')
+    parser.add_argument('--db', default=database_name, help='database name')
+    parser.add_argument('--contracts', type=int, default=1000000, help='number of contracts (rounded up to chunks)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=chunk_size)
+    parser.add_argument('--drop', action='store_true', help='drop eu, cpv and iso_codes before loading')
+    args = parser.parse_args()
+
+    # read by backend/DB.py when the workers import it
+    os.environ['BDMM_MONGO_URI'] = args.uri
+    os.environ['BDMM_MONGO_DB'] = args.db
+
+    print(load(args.contracts, args.seed, args.workers, args.chunk_size, args.drop), flush=True)
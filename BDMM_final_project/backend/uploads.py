@@ -0,0 +1,249 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+from backend import jobs
+from backend import metadata
+from backend import streaming
+
+########################################################################################################################
+# Spooled uploads of contract files
+#
+# The browser sends each file in chunks (see assets/chunked_upload.js) that are appended to a spool directory, so a
+# request never holds more than one chunk in memory and returns as soon as it is written. Once every file of an
+# upload is complete, the files are ingested by a background job (see backend/jobs.py) streaming them into eu (see
+# backend/streaming.py) while the page polls its progress and throughput. Files may be JSON arrays or NDJSON, plain,
+# gzip or zstd compressed (zstd needs the zstandard package), the compression is detected from the content.
+# The spool directories of abandoned or failed uploads are removed once they received nothing for a while.
+#     BDMM_UPLOAD_DIR              spool directory (default <system temp>/bdmm_uploads)
+#     BDMM_UPLOAD_MAX_BYTES        maximum size of one file (default 20 GB)
+#     BDMM_UPLOAD_MAX_TOTAL_BYTES  maximum size of every spooled file together (default 100 GB)
+#     BDMM_UPLOAD_MAX_FILES        maximum number of files of one upload (default 100)
+#     BDMM_UPLOAD_EXPIRY           seconds after which an upload that is not written to or ingested is removed
+#                                  (default 1 day)
+########################################################################################################################
+
+spool_dir = os.environ.get('BDMM_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'bdmm_uploads'))
+max_bytes = int(os.environ.get('BDMM_UPLOAD_MAX_BYTES', str(20 * 1024 ** 3)))
+max_total_bytes = int(os.environ.get('BDMM_UPLOAD_MAX_TOTAL_BYTES', str(100 * 1024 ** 3)))
+max_files = int(os.environ.get('BDMM_UPLOAD_MAX_FILES', '100'))
+expiry = float(os.environ.get('BDMM_UPLOAD_EXPIRY', str(24 * 3600)))
+
+gzip_magic = b'\x1f\x8b'
+zstd_magic = b'\x28\xb5\x2f\xfd'
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadConflict(UploadError):
+    pass
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+def upload_path(upload_id, filename=None, ingesting=False):
+    """
+    Spool path of an upload (or of one of its files), ids and names are restricted so they cannot leave spool_dir
+
+    The directory of an upload being ingested is renamed to '<upload id>.ingesting' (see start_ingest). The file name
+    is prefixed with a hash of the original name, so names sanitized to the same string ('a b.json' and 'a_b.json') do
+    not share a spool file
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        raise UploadError(f"Invalid upload id {upload_id}")
+    directory = os.path.join(spool_dir, upload_id + ('.ingesting' if ingesting else ''))
+    if filename is None:
+        return directory
+
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(filename)).lstrip('.')
+    if not name:
+        raise UploadError(f"Invalid file name {filename}")
+
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:12]
+
+    return os.path.join(directory, f"{digest}_{name}")
+
+
+def expire_uploads(max_age=expiry):
+    """
+    Removes the spool directories that were not written to for 'max_age' seconds, i.e. uploads that were abandoned,
+    failed or never completed, and the '.ingesting' directories left by a server stopped during an ingest (an ingest
+    touches its directory after every batch)
+
+    Expected Output:
+    number of removed uploads (int)
+    """
+    if not os.path.isdir(spool_dir):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for upload_id in os.listdir(spool_dir):
+        directory = os.path.join(spool_dir, upload_id)
+        try:
+            modified = max([os.path.getmtime(directory)] +
+                           [os.path.getmtime(os.path.join(directory, name)) for name in os.listdir(directory)])
+        except OSError:
+            continue
+        if now - modified > max_age:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+
+    return removed
+
+
+def spooled_bytes():
+    """
+    Size of every file of spool_dir, uploads being received or ingested
+    """
+    total = 0
+    for root, _, names in os.walk(spool_dir):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+
+    return total
+
+
+def append_chunk(upload_id, filename, offset, stream, buffer_size=1024 * 1024):
+    """
+    Appends the chunk read from 'stream' to the spooled file, 'offset' must be the size already received so that a
+    retried or out of order chunk is refused instead of corrupting the file. The size of the file, the size of the
+    spool directory and the number of files of the upload are limited (max_bytes, max_total_bytes, max_files)
+
+    Expected Output:
+    size of the spooled file after the chunk
+    """
+    path = upload_path(upload_id, filename)
+    if offset == 0:
+        expire_uploads()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if offset != size:
+        raise UploadError(f"Expected offset {size} for {filename}, got {offset}")
+    if not os.path.exists(path) and len(os.listdir(os.path.dirname(path))) >= max_files:
+        raise UploadError(f"An upload has at most {max_files} files")
+    total = spooled_bytes()
+
+    with open(path, 'ab') as file:
+        while True:
+            data = stream.read(buffer_size)
+            if not data:
+                break
+            size += len(data)
+            total += len(data)
+            if size > max_bytes:
+                raise UploadError(f"{filename} is larger than {max_bytes} bytes")
+            if total > max_total_bytes:
+                raise UploadError(f"The spooled uploads would exceed {max_total_bytes} bytes")
+            file.write(data)
+
+    return size
+
+
+def open_contracts(raw):
+    """
+    Text stream over a spooled file opened in binary mode, decompressing gzip or zstd content
+    """
+    magic = raw.read(4)
+    raw.seek(0)
+
+    if magic.startswith(gzip_magic):
+        binary = gzip.GzipFile(fileobj=raw)
+    elif magic == zstd_magic:
+        import zstandard
+        binary = zstandard.ZstdDecompressor().stream_reader(raw)
+    else:
+        binary = raw
+
+    return io.TextIOWrapper(binary, encoding='utf-8')
+
+
+def ingest_files(job, upload_id, filenames):
+    """
+    Job target streaming each spooled file of a claimed upload into eu, the progress is the share of the compressed
+    bytes read
+    """
+    directory = upload_path(upload_id, ingesting=True)
+    paths = [upload_path(upload_id, filename, ingesting=True) for filename in filenames]
+    total_bytes = sum(os.path.getsize(path) for path in paths) or 1
+    done_bytes, inserted, rejected = 0, 0, 0
+    start = time.time()
+
+    job.start()
+    try:
+        for filename, path in zip(filenames, paths):
+            if job.cancelled():
+                raise IngestCancelled()
+            job.query_started(filename)
+            file_start = time.time()
+            file_stats = {'inserted': 0, 'rejected': 0}
+
+            def progress(stats):
+                file_stats.update(stats)
+                # keeps the directory from being expired while it is ingested
+                os.utime(directory)
+                job.set_progress((done_bytes + raw.tell()) / total_bytes * 100,
+                                 f"{filename}: {inserted + stats['inserted']} contracts inserted, "
+                                 f"{rejected + stats['rejected']} rejected, {stats['docs_per_second']:.0f} contracts/s")
+                if job.cancelled():
+                    raise IngestCancelled()
+
+            try:
+                with open(path, 'rb') as raw:
+                    streaming.ingest_stream(open_contracts(raw), progress=progress)
+                job.query_finished(filename, time.time() - file_start)
+            except IngestCancelled:
+                raise
+            except Exception as e:
+                job.query_finished(filename, time.time() - file_start, error=str(e))
+            finally:
+                inserted += file_stats['inserted']
+                rejected += file_stats['rejected']
+                done_bytes += os.path.getsize(path)
+
+        seconds = time.time() - start
+        job.finish('done', f"Done - {inserted} contracts inserted, {rejected} rejected in {seconds:.1f} seconds "
+                           f"({inserted / seconds if seconds else 0:.0f} contracts/s)")
+    except IngestCancelled:
+        job.finish('cancelled', f"Cancelled - {inserted} contracts inserted")
+    finally:
+        # a cancelled or failed file stops before ingest_stream bumps the version
+        if inserted:
+            metadata.bump_data_version()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def start_ingest(upload_id, filenames):
+    """
+    Starts the background ingest of the complete files of an upload
+
+    The upload is claimed by renaming its directory, so a repeated or concurrent request raises UploadConflict instead
+    of ingesting the files twice, and no chunk can be appended to a file being ingested
+
+    Expected Output:
+    the run id of the job
+    """
+    directory = upload_path(upload_id)
+    if not os.path.isdir(directory):
+        raise UploadConflict(f"Upload {upload_id} is unknown, expired or already ingested")
+    missing = [filename for filename in filenames if not os.path.exists(upload_path(upload_id, filename))]
+    if missing:
+        raise UploadError(f"Files not received: {', '.join(missing)}")
+
+    try:
+        os.rename(directory, upload_path(upload_id, ingesting=True))
+    except OSError:
+        raise UploadConflict(f"Upload {upload_id} is already ingested")
+
+    return jobs.submit('ingest', filenames, lambda job: ingest_files(job, upload_id, filenames)).run_id
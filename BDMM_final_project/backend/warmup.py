@@ -0,0 +1,52 @@
+from threading import Thread
+from backend import cache
+from backend.queries import query_list
+
+########################################################################################################################
+# Startup warm-up of the result cache
+#
+# Runs every query_list function with its default arguments (2008 to 2020, every country), which is the view the
+# dashboard opens with, so that the first visitor after a deploy does not wait for the scans. Together with the
+# stale-while-revalidate policy of backend/cache.py the landing views are then always answered from the cache.
+# Every worker of the server starts it, but with a shared cache (SQLite or Redis) only the first one to claim the
+# current data version runs the queries, the others read the results from the cache when they are requested.
+########################################################################################################################
+
+
+def warm_up(functions=None):
+    """
+    Computes (or loads from the cache) the default view of each query, unless another process sharing the cache
+    already warmed the current data version
+
+    Expected Output:
+    list of the names of the functions that failed
+    """
+
+    try:
+        if not cache.query_cache.claim(f"warmup:{cache.query_cache.version()}"):
+            print("Warm-up done by another process", flush=True)
+            return []
+    except Exception as e:
+        print(f"Warm-up skipped: {e}", flush=True)
+        return [fn.__name__ for fn in functions or query_list]
+
+    failed = []
+    for fn in functions or query_list:
+        try:
+            fn()
+        except Exception as e:
+            print(f"Warm-up of {fn.__name__} failed: {e}", flush=True)
+            failed.append(fn.__name__)
+
+    return failed
+
+
+def start_warm_up(functions=None):
+    """
+    Runs warm_up in a background thread so that the server starts accepting requests immediately
+    """
+
+    thread = Thread(target=warm_up, args=(functions,), daemon=True)
+    thread.start()
+
+    return thread
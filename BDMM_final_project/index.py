@@ -8,15 +8,23 @@ from apps.sidebar import render_sidebar
 from apps.navbar import Navbar
 import pandas as pd
 from app import app
+from backend.warmup import start_warm_up
 
 server = app.server
 
-sidebar = render_sidebar()
+start_warm_up()
+
 navbar = Navbar()
 
 content = html.Div(id="content", className='content')
 
-app.layout = html.Div([dcc.Location(id="url", refresh=False), navbar, sidebar, content])
+
+def serve_layout():
+    # built on each page load so that the sidebar's dimension lookups do not run at import time
+    return html.Div([dcc.Location(id="url", refresh=False), navbar, render_sidebar(), content])
+
+
+app.layout = serve_layout
 
 
 @app.callback(Output("content", "children"), [Input("url", "pathname")])
@@ -0,0 +1,4 @@
+import os
+
+# a test run never writes the result cache file of the dashboard (see backend/cache.py)
+os.environ.setdefault('BDMM_CACHE_BACKEND', 'memory')
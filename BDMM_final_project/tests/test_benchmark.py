@@ -0,0 +1,43 @@
+import pytest
+from backend import benchmark
+
+########################################################################################################################
+# Tests of the benchmark command line, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+
+def ex8_cpv_hist():
+    pass
+
+
+def ex8_cpv_bar():
+    pass
+
+
+def ex19_cpv_map():
+    pass
+
+
+query_list = [ex8_cpv_hist, ex8_cpv_bar, ex19_cpv_map]
+
+
+def test_query_budget_names_resolve_like_the_selected_queries():
+    args = benchmark.build_parser().parse_args(['--budget', '2', '--query-budget', 'ex19=5',
+                                                '--query-budget', 'ex8_cpv_bar=1'])
+
+    assert benchmark.budgets(args, query_list) == {None: 2.0, 'ex19_cpv_map': 5.0, 'ex8_cpv_bar': 1.0}
+
+
+@pytest.mark.parametrize('name', ['ex7', 'ex8', 'ex1'])
+def test_query_budget_matching_no_or_several_queries_is_rejected(name):
+    args = benchmark.build_parser().parse_args(['--query-budget', f'{name}=1'])
+
+    with pytest.raises(ValueError):
+        benchmark.budgets(args, query_list)
+
+
+def test_over_budget():
+    results = [{'query': 'ex8_cpv_hist', 'latency': {'p95': 3.0}}, {'query': 'ex19_cpv_map', 'latency': {'p95': 3.0}}]
+
+    assert benchmark.over_budget(results, {None: 2.0, 'ex19_cpv_map': 5.0}, 'p95') == [('ex8_cpv_hist', 3.0, 2.0)]
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip('pymongo')
+
+from backend import cache
+
+########################################################################################################################
+# Tests of the result cache keys and versions, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+
+def ex2_cpv_treemap(bot_year=2008, top_year=2020, country_list=('PT', 'ES')):
+    pass
+
+
+def ex3_cpv_bar_1(bot_year=2008, top_year=2020, country_list=('PT', 'ES')):
+    pass
+
+
+@pytest.mark.parametrize('args, kwargs', [
+    ((2008, 2020, ['PT', 'ES']), {}),
+    ((2008, 2020, ['ES', 'PT']), {}),
+    ((2008, 2020, ['ES', 'PT', 'ES']), {}),
+    ((2008,), {'country_list': ('ES', 'PT')}),
+    ((), {'country_list': {'PT', 'ES'}, 'top_year': 2020}),
+    ((), {}),
+])
+def test_same_call_same_key(args, kwargs):
+    key = cache.cache_key(ex2_cpv_treemap, (2008, 2020, ['ES', 'PT']), {})
+
+    assert cache.cache_key(ex2_cpv_treemap, args, kwargs) == key
+
+
+@pytest.mark.parametrize('fn, args', [
+    (ex2_cpv_treemap, (2009, 2020, ['ES', 'PT'])),
+    (ex2_cpv_treemap, (2008, 2020, ['ES'])),
+    (ex2_cpv_treemap, (2008, 2020, ['ES', 'PT', 'FR'])),
+    (ex3_cpv_bar_1, (2008, 2020, ['ES', 'PT'])),
+])
+def test_different_call_different_key(fn, args):
+    assert cache.cache_key(fn, args, {}) != cache.cache_key(ex2_cpv_treemap, (2008, 2020, ['ES', 'PT']), {})
+
+
+def test_versions():
+    versions = iter([1, 1, 2])
+    query_cache = cache.QueryCache(cache.MemoryStore(), version=lambda: next(versions), namespace=lambda: 'epoch')
+
+    assert query_cache.get('key') == ('miss', None)
+    query_cache.set('key', [1], 1)
+    assert query_cache.get('key') == ('hit', [1])
+    assert query_cache.get('key') == ('stale', [1])
+
+
+def test_entries_of_another_database_are_misses():
+    store = cache.MemoryStore()
+    cache.QueryCache(store, version=lambda: 0, namespace=lambda: 'epoch_1').set('key', [1], 0)
+
+    assert cache.QueryCache(store, version=lambda: 0, namespace=lambda: 'epoch_1').get('key') == ('hit', [1])
+    assert cache.QueryCache(store, version=lambda: 0, namespace=lambda: 'epoch_2').get('key') == ('miss', None)
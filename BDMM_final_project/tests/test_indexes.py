@@ -0,0 +1,100 @@
+import pytest
+
+pytest.importorskip('pymongo')
+
+from backend import indexes
+
+########################################################################################################################
+# Tests of the index bootstrap against a fake database, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+
+class FakeCollection:
+    """
+    Collection holding {name: keys} indexes, failing like MongoDB on the same keys under a second name
+    """
+
+    def __init__(self, indexes_):
+        self.indexes = dict(indexes_, _id_=[('_id', 1)])
+
+    def index_information(self):
+        # MongoDB may return float directions
+        return {name: {'key': [(field, float(direction)) for field, direction in keys]}
+                for name, keys in self.indexes.items()}
+
+    def create_index(self, keys, name):
+        if list(keys) in self.indexes.values():
+            raise RuntimeError('IndexOptionsConflict')
+        self.indexes[name] = list(keys)
+
+    def drop_index(self, name):
+        del self.indexes[name]
+
+
+class FakeDatabase:
+    def __init__(self, collections):
+        self.collections = collections
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+spec_keys = [('YEAR', 1), ('ISO_COUNTRY_CODE', 1), ('CAE_NAME', 1)]
+spec_name = indexes.index_name(spec_keys)
+
+
+@pytest.fixture
+def spec(monkeypatch):
+    monkeypatch.setattr(indexes, 'index_spec', {'eu': [spec_keys], 'eu_cube': [[('YEAR', 1)]]})
+
+
+def ensure(monkeypatch, collections, reconcile=False):
+    monkeypatch.setattr(indexes, 'db', FakeDatabase(collections))
+
+    return indexes.ensure_indexes(reconcile=reconcile)
+
+
+def test_creates_missing_indexes_and_skips_missing_collections(spec, monkeypatch):
+    eu = FakeCollection({})
+
+    assert ensure(monkeypatch, {'eu': eu}) == {'eu': {'created': [spec_name], 'dropped': []}}
+    assert eu.indexes[spec_name] == spec_keys
+
+
+def test_same_keys_under_another_name_count_as_present(spec, monkeypatch):
+    eu = FakeCollection({'by_hand': spec_keys})
+
+    assert ensure(monkeypatch, {'eu': eu}) == {'eu': {'created': [], 'dropped': []}}
+    assert 'by_hand' in eu.indexes
+
+
+def test_reconcile_renames_an_equivalent_index_and_drops_the_others(spec, monkeypatch):
+    eu = FakeCollection({'by_hand': spec_keys, 'unused': [('WIN_NAME', 1)]})
+
+    report = ensure(monkeypatch, {'eu': eu}, reconcile=True)
+
+    assert report == {'eu': {'created': [spec_name], 'dropped': ['by_hand', 'unused']}}
+    assert set(eu.indexes) == {'_id_', spec_name}
+
+
+def test_name_taken_by_other_keys_is_recreated(spec, monkeypatch):
+    eu = FakeCollection({spec_name: [('YEAR', 1)]})
+
+    assert ensure(monkeypatch, {'eu': eu}) == {'eu': {'created': [spec_name], 'dropped': [spec_name]}}
+    assert eu.indexes[spec_name] == spec_keys
+
+
+@pytest.mark.parametrize('existing, wanted, reconcile, changes', [
+    ({}, {'a_1': [('a', 1)]}, False, ([], ['a_1'])),
+    ({'a_1': [('a', 1)]}, {'a_1': [('a', 1)]}, True, ([], [])),
+    ({'other': [('a', 1)]}, {'a_1': [('a', 1)]}, False, ([], [])),
+    ({'other': [('a', 1)]}, {'a_1': [('a', 1)]}, True, (['other'], ['a_1'])),
+    # the wanted name holds the keys of another wanted index
+    ({'a_1': [('b', 1)]}, {'a_1': [('a', 1)], 'b_1': [('b', 1)]}, False, (['a_1'], ['a_1', 'b_1'])),
+])
+def test_index_changes(existing, wanted, reconcile, changes):
+    assert indexes.index_changes(existing, wanted, reconcile) == changes
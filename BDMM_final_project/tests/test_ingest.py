@@ -0,0 +1,64 @@
+from datetime import datetime
+import pytest
+from backend import ingest
+
+########################################################################################################################
+# Tests of the fields derived at ingest, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+
+@pytest.mark.parametrize('cpv, division', [
+    (50000000, '50'),
+    (3000000, '03'),
+    (3111000, '03'),
+    (45210000.0, '45'),
+    ('03000000', '03'),
+    (' 50310000 ', '50'),
+    ('', None),
+    (None, None),
+])
+def test_cpv_division(cpv, division):
+    assert ingest.cpv_division(cpv) == division
+
+
+@pytest.mark.parametrize('value, date', [
+    ('22-DEC-17', datetime(2017, 12, 22)),
+    ('01-jan-08', datetime(2008, 1, 1)),
+    ('22-Dec-2017', datetime(2017, 12, 22)),
+    ('22/12/2017', datetime(2017, 12, 22)),
+    ('2017-12-22', datetime(2017, 12, 22)),
+    (' 22-DEC-17 ', datetime(2017, 12, 22)),
+    (datetime(2017, 12, 22, 10), datetime(2017, 12, 22, 10)),
+    ('31-FEB-17', None),
+    ('not a date', None),
+    (None, None),
+])
+def test_parse_date(value, date):
+    assert ingest.parse_date(value) == date
+
+
+day = 24 * 3600 * 1000
+
+
+@pytest.mark.parametrize('document, differences', [
+    ({'DT_DISPATCH': '22-DEC-17', 'DT_AWARD': '20-DEC-17', 'AWARD_VALUE_EURO': 1500, 'VALUE_EURO': 1000},
+     {'time_difference': 2 * day, 'value_difference': 500}),
+    ({'DT_DISPATCH': datetime(2017, 1, 1), 'DT_AWARD': '02-JAN-17', 'AWARD_VALUE_EURO': 10.5, 'VALUE_EURO': 12},
+     {'time_difference': -day, 'value_difference': -1.5}),
+    ({'DT_DISPATCH': '22-DEC-17', 'AWARD_VALUE_EURO': True, 'VALUE_EURO': 1000},
+     {'time_difference': None, 'value_difference': None}),
+    ({'DT_DISPATCH': 'unknown', 'DT_AWARD': '20-DEC-17', 'AWARD_VALUE_EURO': '1500', 'VALUE_EURO': 1000},
+     {'time_difference': None, 'value_difference': None}),
+    ({}, {'time_difference': None, 'value_difference': None}),
+])
+def test_award_differences(document, differences):
+    assert ingest.award_differences(document) == differences
+
+
+def test_prepare_document():
+    document = ingest.prepare_document({'CPV': 3000000, 'DT_DISPATCH': '22-DEC-17', 'DT_AWARD': '20-DEC-17'})
+
+    assert document['CPV_DIVISION'] == '03'
+    assert document['DT_DISPATCH'] == datetime(2017, 12, 22)
+    assert document['time_difference'] == 2 * day
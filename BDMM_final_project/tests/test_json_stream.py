@@ -0,0 +1,91 @@
+import io
+import json
+import pytest
+from backend import json_stream
+
+########################################################################################################################
+# Tests of the incremental contract file parser, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+
+class CountingReader(io.StringIO):
+    """
+    Text file recording how many characters were read from it
+    """
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.characters_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.characters_read += len(data)
+        return data
+
+
+def parse_array(text, read_size):
+    file = io.StringIO(text)
+    assert json_stream.first_character(file) == '['
+
+    return list(json_stream.iter_json_array(file, read_size=read_size))
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 5, 7, 1024])
+def test_numbers_are_not_split_at_read_boundaries(read_size):
+    assert parse_array('[1, 234, -5.5e3, 67]', read_size) == [1, 234, -5500.0, 67]
+
+
+@pytest.mark.parametrize('read_size', [1, 4, 9, 1024])
+def test_elements_cut_at_read_boundaries(read_size):
+    contracts = [{'CPV': 50000000, 'CAE_NAME': 'Autorité "A"', 'B_EU_FUNDS': None, 'CANCELLED': True},
+                 [1, 2, {'nested': 'string, with ] and }'}], 'plain', False, None]
+    text = json.dumps(contracts, ensure_ascii=True)
+
+    assert parse_array(text, read_size) == contracts
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 5, 1024])
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '[\n1 ,\n2\n]'])
+def test_separators(text, read_size):
+    assert parse_array(text, read_size) == ([] if '1' not in text else [1, 2])
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 5, 1024])
+@pytest.mark.parametrize('text', ['[1 2 3]', '[{"a":1},,{"b":2}]', '[1,]', '[,1]', '[,]', '[{"a":1}', '[1,', '['])
+def test_malformed_arrays_raise(text, read_size):
+    with pytest.raises(json.JSONDecodeError):
+        parse_array(text, read_size)
+
+
+def test_malformed_element_raises_without_reading_the_rest_of_the_file():
+    text = '[{"a": 1}, {bad}, ' + ', '.join(json.dumps({'ID_NOTICE_CAN': i, 'padding': 'x' * 100})
+                                               for i in range(2000)) + ']'
+    file = CountingReader(text)
+    json_stream.first_character(file)
+    elements = json_stream.iter_json_array(file, read_size=1024)
+
+    assert next(elements) == {'a': 1}
+    with pytest.raises(json.JSONDecodeError):
+        next(elements)
+    assert file.characters_read <= 2 * 1024 + 1
+
+
+def test_element_larger_than_the_limit_raises():
+    file = io.StringIO(json.dumps([{'value': 'x' * 1000}]))
+    json_stream.first_character(file)
+
+    with pytest.raises(ValueError):
+        list(json_stream.iter_json_array(file, read_size=100, max_element_size=500))
+
+
+def test_ndjson_rejects_invalid_lines():
+    rejected = []
+    file = io.StringIO('{"a": 1}\n{bad}\n\n{"a": 2}\n')
+
+    assert list(json_stream.iter_contracts(file, rejected)) == [{'a': 1}, {'a': 2}]
+    assert len(rejected) == 1 and rejected[0].startswith('line 2')
+
+
+def test_batches():
+    assert list(json_stream.batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip('pymongo')
+
+from backend import cache
+from backend import partials
+
+########################################################################################################################
+# Tests of the composition of year ranges from per-year partial aggregates, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+# (ISO_COUNTRY_CODE, CPV_DIVISION, B_EU_FUNDS, count, value_sum, value_count, offers_sum, offers_count) of each year
+cells = {
+    2010: [('PT', '45', 'Y', 2, 300, 2, 4, 2), ('ES', '45', 'N', 1, 100, 1, 1, 1)],
+    2011: [('PT', '45', 'N', 1, 100, 1, 2, 1), ('PT', '50', 'Y', 3, 0, 0, 3, 3)],
+    2012: [('ES', '50', 'Y', 4, 800, 4, 8, 4)],
+}
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """
+    Years read from the database, the cells of every year being cached in a fresh in-memory cache
+    """
+    years = []
+
+    def fetch_cells(missing):
+        years.append(list(missing))
+        return {year: cells.get(year, []) for year in missing}
+
+    monkeypatch.setattr(partials, 'fetch_cells', fetch_cells)
+    query_cache = cache.QueryCache(cache.MemoryStore(), version=lambda: 1, namespace=lambda: 'epoch')
+    monkeypatch.setattr(cache, 'query_cache', query_cache)
+    monkeypatch.setattr(partials.dimensions, 'join_cpv', lambda documents: documents)
+    monkeypatch.setattr(partials.dimensions, 'join_country', lambda documents: documents)
+
+    return years
+
+
+def test_only_missing_years_are_fetched(fetched):
+    partials.year_cells(2010, 2011, ['PT', 'ES'])
+    partials.year_cells(2010, 2012, ['PT'])
+
+    assert fetched == [[2010, 2011], [2012]]
+
+
+@pytest.mark.parametrize('bot_year, top_year, countries, expected', [
+    (2010, 2010, ['PT', 'ES'], cells[2010]),
+    (2010, 2011, ['PT'], [cells[2010][0]] + cells[2011]),
+    (2011, 2012, ['ES'], cells[2012]),
+    (2013, 2014, ['PT', 'ES'], []),
+])
+def test_year_cells(fetched, bot_year, top_year, countries, expected):
+    assert sorted(partials.year_cells(bot_year, top_year, countries)) == sorted(expected)
+
+
+def test_rollup_sums_the_measures():
+    groups = partials.rollup(cells[2010] + cells[2011], lambda cell: cell[0])
+
+    assert groups == {'PT': [6, 400, 3, 9, 6], 'ES': [1, 100, 1, 1, 1]}
+
+
+def test_country_treemap_over_a_range(fetched):
+    documents = partials.country_treemap(2010, 2012, ['PT', 'ES'])
+
+    assert sorted((document['_id'], document['count']) for document in documents) == [('ES', 5), ('PT', 6)]
+
+
+def test_cpv_bar_averages_the_whole_range(fetched):
+    documents = partials.cpv_bar(2010, 2012, ['PT', 'ES'], -1)
+
+    # 45: (300 + 100 + 100) / 4, 50: 800 / 4 (the 2011 cells have no numeric value)
+    assert [(document['_id'], document['avg']) for document in documents] == [('50', 200), ('45', 125)]
+
+
+def test_sort_by_avg_puts_nulls_first_ascending():
+    documents = [{'avg': 2}, {'avg': None}, {'avg': 1}]
+
+    assert [document['avg'] for document in partials.sort_by_avg(documents, 1)] == [None, 1, 2]
+    assert [document['avg'] for document in partials.sort_by_avg(documents, -1)] == [2, 1, None]
@@ -0,0 +1,49 @@
+import re
+import pytest
+
+pytest.importorskip('pymongo')
+pytest.importorskip('pandas')
+
+from backend import queries
+
+########################################################################################################################
+# Tests of the query helpers that need no database, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+
+@pytest.mark.parametrize('code, low, high', [
+    ('50', 50000000, 51000000),
+    ('03', 3000000, 4000000),
+    ('503', 50300000, 50400000),
+    ('5031', 50310000, 50320000),
+    ('50310000', 50310000, 50310001),
+])
+def test_cpv_range(code, low, high):
+    assert queries.cpv_range(code) == {'$gte': low, '$lt': high}
+
+
+@pytest.mark.parametrize('code, cpv, matches', [
+    ('50', 50310000, True),
+    ('50', 51000000, False),
+    ('03', 3111000, True),
+    ('03', 30000000, False),
+    ('03', '03111000', True),
+    ('03', '30000000', False),
+    ('503', '50310000', True),
+    ('503', '50410000', False),
+])
+def test_cpv_prefix(code, cpv, matches):
+    number, string = queries.cpv_prefix(code)
+    if isinstance(cpv, str):
+        matched = re.match(string['CPV']['$regex'], cpv) is not None
+    else:
+        matched = number['CPV']['$gte'] <= cpv < number['CPV']['$lt']
+
+    assert matched == matches
+
+
+def test_cpv_map_filters_the_country_list():
+    match = queries.ex7_cpv_map_plan(2010, 2012, ['PT', 'ES'])['pipeline'][0]['$match']
+
+    assert match['ISO_COUNTRY_CODE'] == {'$in': ['PT', 'ES'], '$ne': None}
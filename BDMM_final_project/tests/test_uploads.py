@@ -0,0 +1,71 @@
+import io
+import os
+import time
+import pytest
+
+pytest.importorskip('pymongo')
+
+from backend import uploads
+
+########################################################################################################################
+# Tests of the spooled uploads against a temporary spool directory, run from BDMM_final_project with:
+#     python -m pytest tests
+########################################################################################################################
+
+upload_id = '0123456789abcdef0123456789abcdef'
+
+
+class FakeJob:
+    run_id = 'run'
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, 'spool_dir', str(tmp_path))
+    submitted = []
+    monkeypatch.setattr(uploads.jobs, 'submit', lambda kind, names, target: submitted.append(names) or FakeJob())
+
+    return submitted
+
+
+def test_an_upload_is_ingested_once(spool):
+    uploads.append_chunk(upload_id, 'a.json', 0, io.BytesIO(b'[{"a": 1}]'))
+
+    assert uploads.start_ingest(upload_id, ['a.json']) == 'run'
+    with pytest.raises(uploads.UploadConflict):
+        uploads.start_ingest(upload_id, ['a.json'])
+    assert spool == [['a.json']]
+    assert os.path.exists(uploads.upload_path(upload_id, 'a.json', ingesting=True))
+
+
+def test_missing_files_are_not_claimed(spool):
+    uploads.append_chunk(upload_id, 'a.json', 0, io.BytesIO(b'[]'))
+
+    with pytest.raises(uploads.UploadError) as error:
+        uploads.start_ingest(upload_id, ['a.json', 'b.json'])
+    assert not isinstance(error.value, uploads.UploadConflict)
+    assert os.path.isdir(uploads.upload_path(upload_id))
+
+
+def test_spool_and_file_count_limits(spool, monkeypatch):
+    monkeypatch.setattr(uploads, 'max_total_bytes', 10)
+    monkeypatch.setattr(uploads, 'max_files', 2)
+    uploads.append_chunk(upload_id, 'a.json', 0, io.BytesIO(b'12345'))
+    uploads.append_chunk(upload_id, 'b.json', 0, io.BytesIO(b'1234'))
+
+    with pytest.raises(uploads.UploadError):
+        uploads.append_chunk(upload_id, 'c.json', 0, io.BytesIO(b'1'))
+    with pytest.raises(uploads.UploadError):
+        uploads.append_chunk(upload_id, 'b.json', 4, io.BytesIO(b'56'))
+
+
+def test_stale_ingesting_directories_expire(spool):
+    uploads.append_chunk(upload_id, 'a.json', 0, io.BytesIO(b'[]'))
+    uploads.start_ingest(upload_id, ['a.json'])
+    directory = uploads.upload_path(upload_id, ingesting=True)
+    old = time.time() - 3600
+    os.utime(uploads.upload_path(upload_id, 'a.json', ingesting=True), (old, old))
+    os.utime(directory, (old, old))
+
+    assert uploads.expire_uploads(max_age=60) == 1
+    assert not os.path.exists(directory)